@@ -0,0 +1,140 @@
+"""
+Бенчмарк извлечения сумм из постов stats-каналов.
+
+Сравнивает прежний путь (parse_amount по _AMOUNT_RE: первая сумма + upper() и два
+поиска BTC/ETH) с однопроходным src.amounts.extract_amounts и считает посты,
+по которым решения о пересылке расходятся. Перед замером extract_amounts
+проверяется на типичных формах постов (SHAPES): монета перед суммой и после неё,
+несколько монет в строке, полные названия.
+
+Корпус — тексты stats-постов из БД (--db); без БД используется синтетический
+корпус в формате типичных whale/liquidation-алертов.
+
+Запуск:
+    python -m benchmarks.bench_amounts --db posts_archive.db
+    python -m benchmarks.bench_amounts --posts 50000
+"""
+import argparse
+import random
+import sqlite3
+import time
+from typing import Callable, List
+
+from src.amounts import extract_amounts, threshold_for
+from src.channel_processors import CHANNEL_TYPE_STATS, parse_amount
+
+CONFIG = {'btc_eth_threshold': 1_000_000, 'other_coin_threshold': 300_000,
+          'coin_thresholds': {'SOL': 500_000}}
+
+TEMPLATES = [
+    "🚨 {n} #{coin} ({usd} USD) transferred from unknown wallet to #Binance",
+    "🐳 ${usd_short} {coin} long liquidated on Bybit at ${price}",
+    "Whale bought ${usd_short} of {coin}",
+    "Top liquidations:\n{coin} ${usd_short}\n{coin2} ${usd_short2}\n{coin3} ${usd_short3}",
+    "{coin} open interest up 5% in 1h, ${usd_short} added",
+    "Market update without amounts for {coin}",
+]
+COINS = ['BTC', 'ETH', 'SOL', 'DOGE', 'XRP', 'TON']
+
+# (текст, ожидаемые пары) при монетах из CONFIG['coin_thresholds']
+SHAPES = [
+    ("SOL $300K, ETH $2.5M", [('SOL', 300_000), ('ETH', 2_500_000)]),
+    ("$2.5M of ETH and $300K of SOL", [('ETH', 2_500_000), ('SOL', 300_000)]),
+    ("BTC $1M ETH $2M", [('BTC', 1_000_000), ('ETH', 2_000_000)]),
+    ("$1M BTC $2M ETH", [('BTC', 1_000_000), ('ETH', 2_000_000)]),
+    ("Top liquidations:\nSOL $1.2M\nETH $3M", [('SOL', 1_200_000), ('ETH', 3_000_000)]),
+    ("🚨 1,000 #ETH (2,500,000 USD) transferred", [('ETH', 2_500_000)]),
+    ("Whale bought $5M of Bitcoin", [('BTC', 5_000_000)]),
+    ("Solana open interest up, $700K added", [('SOL', 700_000)]),
+    ("Market update: $3M inflow", [(None, 3_000_000)]),
+]
+
+
+def _short(value: float) -> str:
+    for suffix, mult in (('B', 1e9), ('M', 1e6), ('K', 1e3)):
+        if value >= mult:
+            return f"{value / mult:.1f}{suffix}"
+    return f"{value:.0f}"
+
+
+def synthetic_corpus(n: int, seed: int = 1) -> List[str]:
+    rnd = random.Random(seed)
+    posts = []
+    for _ in range(n):
+        values = [10 ** rnd.uniform(4, 9) for _ in range(3)]
+        coins = rnd.sample(COINS, 3)
+        posts.append(rnd.choice(TEMPLATES).format(
+            n=f"{rnd.randint(10, 5000):,}", coin=coins[0], coin2=coins[1], coin3=coins[2],
+            usd=f"{values[0]:,.0f}", usd_short=_short(values[0]), usd_short2=_short(values[1]),
+            usd_short3=_short(values[2]), price=f"{rnd.uniform(0.1, 70000):,.2f}",
+        ))
+    return posts
+
+
+def db_corpus(path: str) -> List[str]:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return [row[0] for row in conn.execute(
+            "SELECT text FROM posts WHERE channel_type = ? AND text IS NOT NULL AND text != ''",
+            (CHANNEL_TYPE_STATS,)
+        )]
+    finally:
+        conn.close()
+
+
+def legacy_decision(text: str) -> bool:
+    amount = parse_amount(text)
+    if amount is None:
+        return False
+    upper = text.upper()
+    if 'BTC' in upper or 'ETH' in upper:
+        return amount > CONFIG['btc_eth_threshold']
+    return amount > CONFIG['other_coin_threshold']
+
+
+def single_pass_decision(text: str) -> bool:
+    coins = CONFIG['coin_thresholds'].keys()
+    return any(amount > threshold_for(coin, CONFIG) for coin, amount in extract_amounts(text, coins))
+
+
+def check_shapes() -> int:
+    """Сверяет extract_amounts с SHAPES; возвращает число несовпадений"""
+    failed = 0
+    for text, expected in SHAPES:
+        got = extract_amounts(text, CONFIG['coin_thresholds'].keys())
+        if got != [(coin, float(value)) for coin, value in expected]:
+            failed += 1
+            print(f"НЕ СОВПАДАЕТ: {text!r}: {got} вместо {expected}")
+    print(f"Формы постов: {len(SHAPES) - failed}/{len(SHAPES)} совпадают")
+    return failed
+
+
+def measure(name: str, func: Callable[[str], bool], corpus: List[str], repeat: int) -> List[bool]:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        decisions = [func(text) for text in corpus]
+        best = min(best, time.perf_counter() - t0)
+    print(f"{name:<28} {len(corpus) / best:>10.0f} posts/s  forwarded: {sum(decisions)}")
+    return decisions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="БД с постами stats-каналов")
+    parser.add_argument("--posts", type=int, default=20_000, help="размер синтетического корпуса")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if check_shapes():
+        raise SystemExit(1)
+    corpus = db_corpus(args.db) if args.db else synthetic_corpus(args.posts)
+    print(f"Корпус: {len(corpus)} постов ({'БД' if args.db else 'синтетический'})")
+    legacy = measure("_AMOUNT_RE (legacy)", legacy_decision, corpus, args.repeat)
+    single = measure("extract_amounts (single)", single_pass_decision, corpus, args.repeat)
+    diff = sum(a != b for a, b in zip(legacy, single))
+    print(f"Решения расходятся: {diff} постов ({diff / max(1, len(corpus)):.1%})")
+
+
+if __name__ == "__main__":
+    main()
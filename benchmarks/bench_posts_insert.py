@@ -0,0 +1,94 @@
+"""
+Бенчмарк пропускной способности вставки в posts.
+
+Сравнивает старую схему (все индексы + INSERT OR REPLACE) с текущей
+(миграции src.migrations + UPSERT), а также вклад каждого изменения по отдельности.
+
+Запуск:
+    python -m benchmarks.bench_posts_insert --rows 50000 --batch 100
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from src.migrations import ARCHIVE_MIGRATIONS, apply_migrations
+
+LEGACY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_posts_channel ON posts(channel)",
+    "CREATE INDEX IF NOT EXISTS idx_posts_published_at ON posts(published_at)",
+    "CREATE INDEX IF NOT EXISTS idx_posts_is_advertisement ON posts(is_advertisement)",
+    "CREATE INDEX IF NOT EXISTS idx_posts_is_forwarded ON posts(is_forwarded)",
+    "CREATE INDEX IF NOT EXISTS idx_posts_channel_type ON posts(channel_type)",
+    "CREATE INDEX IF NOT EXISTS idx_posts_channel_message_id ON posts(channel, message_id)",
+]
+
+COLUMNS = """(channel, channel_type, message_id, post_url, text, text_length,
+             published_at, is_advertisement, is_forwarded, has_media, blacklisted)"""
+
+REPLACE_SQL = f"INSERT OR REPLACE INTO posts {COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+UPSERT_SQL = f"""
+    INSERT INTO posts {COLUMNS} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(channel, message_id) DO UPDATE SET
+        channel_type = excluded.channel_type, post_url = excluded.post_url,
+        text = excluded.text, text_length = excluded.text_length,
+        published_at = excluded.published_at, processed_at = CURRENT_TIMESTAMP,
+        is_advertisement = excluded.is_advertisement, is_forwarded = excluded.is_forwarded,
+        has_media = excluded.has_media, blacklisted = excluded.blacklisted
+"""
+
+
+def make_rows(n: int, channels: int = 200):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    text = "Пример текста поста для бенчмарка вставки " * 8
+    for i in range(n):
+        ch = f"@channel_{i % channels}"
+        mid = i // channels + 1
+        yield (ch, i % 7, mid, f"https://t.me/{ch[1:]}/{mid}", text, len(text),
+               (start + timedelta(seconds=i)).isoformat(), i % 5 == 0, i % 3 == 0, i % 4 == 0, 0)
+
+
+def build_db(path: str, legacy_indexes: bool) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    apply_migrations(conn, ARCHIVE_MIGRATIONS)
+    if legacy_indexes:
+        for ddl in LEGACY_INDEXES:
+            conn.execute(ddl)
+        conn.commit()
+    return conn
+
+
+def run_case(name: str, legacy_indexes: bool, sql: str, rows: int, batch: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = build_db(os.path.join(tmp, "bench.db"), legacy_indexes)
+        data = list(make_rows(rows))
+        results = []
+        # Первый проход — новые строки, второй — повторная обработка тех же постов
+        for phase in ("insert", "update"):
+            t0 = time.perf_counter()
+            for i in range(0, len(data), batch):
+                conn.executemany(sql, data[i:i + batch])
+                conn.commit()
+            elapsed = time.perf_counter() - t0
+            results.append(f"{phase}: {rows / elapsed:>9.0f} rows/s")
+        conn.close()
+    print(f"{name:<40} " + "  ".join(results))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    run_case("legacy indexes + INSERT OR REPLACE", True, REPLACE_SQL, args.rows, args.batch)
+    run_case("legacy indexes + UPSERT", True, UPSERT_SQL, args.rows, args.batch)
+    run_case("pruned indexes + INSERT OR REPLACE", False, REPLACE_SQL, args.rows, args.batch)
+    run_case("pruned indexes + UPSERT (current)", False, UPSERT_SQL, args.rows, args.batch)
+
+
+if __name__ == "__main__":
+    main()
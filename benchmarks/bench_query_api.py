@@ -0,0 +1,171 @@
+"""
+Нагрузочный тест src.query_api: не замедляет ли чтение через API запись постов.
+
+Писатель в основном процессе повторяет путь бота — пачки UPSERT в posts архива (с триггерами
+сводки) и обновление чекпоинта канала в базе состояния, по транзакции на пачку — с частотой
+--write-rate постов/с (0 — без пауз, предельная пропускная способность) и меряет
+строки/с и задержку транзакции. Сервер API работает в отдельном процессе, клиенты — ещё в
+нескольких процессах и запрашивают ленты, историю каналов (с переходом по курсору)
+и статистику с суммарной частотой --rps. Прогоны: без читателей, с API с кэшем и
+без кэша, и с клиентами без пауз (--rps 0).
+
+Блокировок между API и писателем нет (WAL), поэтому замедление записи — это только
+конкуренция за CPU (клиенты здесь работают на той же машине): она заметна, если
+писатель без пауз или клиенты без пауз занимают все ядра.
+
+Запуск:
+    python -m benchmarks.bench_query_api --seconds 10 --clients 4 --rps 100
+    python -m benchmarks.bench_query_api --write-rate 0   # предельная скорость записи
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from benchmarks.bench_posts_insert import UPSERT_SQL
+from src import storage
+
+CHANNELS = 200
+PREFILL_ROWS = 100_000
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def make_rows(offset: int, n: int):
+    text = "Пример текста поста для нагрузочного теста API " * 8
+    for i in range(offset, offset + n):
+        ch = f"@channel_{i % CHANNELS}"
+        mid = i // CHANNELS + 1
+        yield (ch, i % 7, mid, f"https://t.me/{ch[1:]}/{mid}", text, len(text),
+               (START + timedelta(seconds=i)).isoformat(), i % 5 == 0, i % 3 == 0, i % 4 == 0, 0)
+
+
+def build_db(state_path: str, archive_path: str) -> None:
+    storage.setup(state_path, archive_path)
+    conn = storage.connect(state_path, archive_path)
+    conn.executemany(
+        "INSERT INTO channels (username, last_message_id, channel_type) VALUES (?, 0, 0)",
+        [(f"@channel_{i}",) for i in range(CHANNELS)]
+    )
+    conn.executemany(UPSERT_SQL, make_rows(0, PREFILL_ROWS))
+    conn.commit()
+    conn.close()
+
+
+def run_server(db_path: str, port: int, cache_ttl: float) -> None:
+    from src.query_api import make_server
+    make_server(db_path, '127.0.0.1', port, cache_ttl).serve_forever()
+
+
+def run_client(port: int, seconds: float, rps: float, counter) -> None:
+    base = f"http://127.0.0.1:{port}"
+    rnd = random.Random(os.getpid())
+    deadline = time.time() + seconds
+    done = 0
+    while time.time() < deadline:
+        if rps > 0:
+            time.sleep(rnd.expovariate(rps))
+        kind = rnd.random()
+        if kind < 0.4:
+            url = f"{base}/posts/forwarded?limit=50"
+        elif kind < 0.9:
+            url = f"{base}/channels/channel_{rnd.randrange(CHANNELS)}/posts?limit=50"
+        else:
+            url = f"{base}/stats/ads?from=2026-01-01"
+        # Часть запросов листает дальше по курсору
+        for _ in range(rnd.choice((1, 1, 3))):
+            with urllib.request.urlopen(url) as resp:
+                cursor = json.loads(resp.read()).get('next_cursor')
+            done += 1
+            if not cursor:
+                break
+            url = f"{url.split('&cursor=')[0]}&cursor={cursor}"
+    with counter.get_lock():
+        counter.value += done
+
+
+def run_writer(state_path: str, archive_path: str, seconds: float, batch: int, write_rate: float, offset: int):
+    conn = storage.connect(state_path, archive_path, timeout=30)
+    commits: List[float] = []
+    rows = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        if write_rate > 0:
+            # Следующая пачка — по расписанию, а не сразу после предыдущей
+            delay = started + rows / write_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        data = list(make_rows(offset + rows, batch))
+        t0 = time.perf_counter()
+        conn.executemany(UPSERT_SQL, data)
+        conn.execute("UPDATE channels SET last_message_id = ? WHERE username = ?", (data[-1][2], data[-1][0]))
+        conn.commit()
+        commits.append(time.perf_counter() - t0)
+        rows += batch
+    elapsed = time.perf_counter() - started
+    conn.close()
+    commits.sort()
+    return rows / elapsed, commits[len(commits) // 2], commits[int(len(commits) * 0.99)], commits[-1], rows
+
+
+def run_case(name: str, state_path: str, archive_path: str, args, offset: int,
+             cache_ttl: Optional[float], rps: float) -> int:
+    ctx = multiprocessing.get_context('spawn')
+    procs = []
+    counter = ctx.Value('i', 0)
+    if cache_ttl is not None:
+        port = random.randint(20000, 40000)
+        server = ctx.Process(target=run_server, args=(archive_path, port, cache_ttl), daemon=True)
+        server.start()
+        time.sleep(1.0)
+        procs.append(server)
+        for _ in range(args.clients):
+            client = ctx.Process(target=run_client, args=(port, args.seconds, rps / args.clients, counter))
+            client.start()
+            procs.append(client)
+    rate, p50, p99, worst, rows = run_writer(state_path, archive_path, args.seconds, args.batch, args.write_rate, offset)
+    for proc in procs[1:]:
+        proc.join()
+    for proc in procs[:1]:
+        proc.terminate()
+        proc.join()
+    api = f"  API {counter.value / args.seconds:>7.0f} req/s" if cache_ttl is not None else ""
+    print(f"{name:<24} запись {rate:>8.0f} rows/s  транзакция p50 {p50 * 1000:6.2f} ms  "
+          f"p99 {p99 * 1000:6.2f} ms  max {worst * 1000:7.2f} ms{api}")
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch", type=int, default=50, help="постов в транзакции писателя")
+    parser.add_argument("--write-rate", type=float, default=2000, help="постов/с у писателя (0 — без пауз)")
+    parser.add_argument("--clients", type=int, default=4, help="процессов-клиентов API")
+    parser.add_argument("--rps", type=float, default=100, help="суммарная частота запросов клиентов")
+    args = parser.parse_args()
+    print(f"CPU: {os.cpu_count()}, клиентов: {args.clients}, запросов {args.rps:.0f}/s, "
+          f"запись {args.write_rate:.0f} постов/s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, "bench.db")
+        archive_path = os.path.join(tmp, "bench_archive.db")
+        build_db(state_path, archive_path)
+        offset = PREFILL_ROWS
+        cases = (
+            ("без читателей", None, args.rps),
+            ("API, кэш 5s", 5.0, args.rps),
+            ("API без кэша", 0.0, args.rps),
+            ("API без пауз, кэш 5s", 5.0, 0),
+            ("без читателей (повтор)", None, args.rps),
+        )
+        for name, cache_ttl, rps in cases:
+            offset += run_case(name, state_path, archive_path, args, offset, cache_ttl, rps)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,13 @@ mkdir -p /data
 if [ -f /data/CONFIG.py ]; then ln -sf /data/CONFIG.py /app/src/CONFIG.py; fi
 [ -f /data/channels_v2.db ] || touch /data/channels_v2.db
 ln -sf /data/channels_v2.db /app/channels_v2.db
+[ -f /data/posts_archive.db ] || touch /data/posts_archive.db
+ln -sf /data/posts_archive.db /app/posts_archive.db
 for s in userbot2_session.session userbot_session.session; do
   if [ -f /data/$s ]; then ln -sf /data/$s /app/$s; fi
 done
+# WORKER_MODE=multi — отдельные процессы для чтения, классификации и пересылки (src/workers.py)
+if [ "${WORKER_MODE:-single}" = "multi" ]; then
+  exec python -u -m src.workers
+fi
 exec python -u -m src.RUN4
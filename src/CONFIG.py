@@ -33,6 +33,17 @@ phone_number = _require_env("TELEGRAM_PHONE_NUMBER")  # телефон заре
 password_raw = os.getenv("TELEGRAM_PASSWORD")
 password = int(password_raw) if password_raw and password_raw.isdigit() else password_raw
 
+# Дополнительные Telegram-аккаунты для шардирования каналов (необязательно).
+# JSON-список: [{"name": "acc2", "phone": "+...", "password": "...", "session": "userbot2_acc2_session"}]
+# api_id/api_hash по умолчанию берутся у основного аккаунта.
+telegram_accounts = json.loads(os.getenv("TELEGRAM_ACCOUNTS_JSON", "") or "[]")
+
+# Минимальный интервал между запросами одного аккаунта, секунды
+telegram_rpc_interval = float(os.getenv("TELEGRAM_RPC_INTERVAL", "0.3"))
+
+# Минимальный интервал между пересылками одного аккаунта в один целевой канал, секунды
+forward_target_interval = float(os.getenv("FORWARD_TARGET_INTERVAL", "0.5"))
+
 # Ключ для DeepSeek/OpenAI-совместимого клиента
 deepseek_api_key = _require_env("DEEPSEEK_API_KEY")
 
@@ -60,6 +71,34 @@ csv_url = _require_env("CSV_URL")
 # Полностью загружаем базовые настройки из переменной окружения,
 # чтобы значения (каналы, интервалы, промпты и т.д.) не светились в репозитории.
 # Ожидается JSON-строка с полным словарём настроек.
-DEFAULT_CONFIGS = json.loads(_require_env("DEFAULT_CONFIG_JSON"))
+#
+# OPTIONAL_CONFIG_DEFAULTS — значения для необязательных ключей, которых может не быть
+# в DEFAULT_CONFIG_JSON. Ключ, перечисленный здесь, можно менять через Google-таблицу.
+OPTIONAL_CONFIG_DEFAULTS = {
+    # Сколько новых сообщений одного канала обрабатывать за цикл; остаток — в следующих циклах
+    'catchup_budget_per_cycle': 500,
+    # Минимальная уверенность локального классификатора рекламы, при которой LLM не вызывается
+    'local_classifier_threshold': 0.97,
+    # Дедлайн одного запроса к DeepSeek, секунды
+    'llm_timeout': 20,
+    # Что делать с постом, когда DeepSeek недоступен: defer (отложить), heuristic (локальная оценка), pass (пропустить как не рекламу)
+    'llm_fallback_policy': 'defer',
+    # Пороги stats-каналов по монетам, например {"BTC": 1000000, "SOL": 200000};
+    # монеты без порога — btc_eth_threshold (BTC/ETH) или other_coin_threshold
+    'coin_thresholds': {},
+    # Полосы планировщика: тип канала -> [приоритет, параллельных обработчиков],
+    # например {"stats": [0, 2], "filtered": [2, 1]}; не указанные типы — src.lanes.DEFAULT_LANES
+    'channel_type_lanes': {},
+    # Сколько токенов текста поста (приблизительно) отправлять в DeepSeek; длинные посты
+    # укорачиваются с сохранением начала, конца и строк со ссылками (src.prompt_budget); 0 — без ограничения
+    'llm_input_token_budget': 600,
+    # Куда пересылать: тип канала или канал -> целевой канал, например
+    # {"stats": "@alerts", "@somechannel": "@special"}; без правила — target_channel (src.routing)
+    'target_routes': {},
+    # Перед опросом каналов сверять top_message их диалогов с last_message_id (пачками по 100)
+    # и вызывать get_messages только у каналов с новыми постами
+    'dialog_prefilter': False,
+}
+DEFAULT_CONFIGS = {**OPTIONAL_CONFIG_DEFAULTS, **json.loads(_require_env("DEFAULT_CONFIG_JSON"))}
 
 ########################################################################################
\ No newline at end of file
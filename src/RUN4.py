@@ -1,14 +1,14 @@
 import csv
-import requests
 from io import StringIO
 import sqlite3
 from telethon import TelegramClient, errors
 from telethon.tl.functions.channels import JoinChannelRequest, LeaveChannelRequest
 from telethon.tl.functions.account import UpdateNotifySettingsRequest
-from telethon.tl.types import InputPeerNotifySettings, InputPeerChannel
+from telethon.tl.functions.messages import GetPeerDialogsRequest
+from telethon.tl.types import InputPeerNotifySettings, InputPeerChannel, InputDialogPeer
 import logging
 import asyncio
-from openai import OpenAI
+from openai import AsyncOpenAI
 import random
 import re
 import time
@@ -16,59 +16,92 @@ import traceback
 from telethon.errors import PhoneMigrateError, FloodWaitError, SessionPasswordNeededError
 from telethon.errors.rpcerrorlist import AuthKeyDuplicatedError
 import ast
-from typing import Dict, List, Tuple, Optional, Any, Set, Union
+import json
+import functools
+from typing import Dict, List, Tuple, Optional, Any, Set, Union, Callable, Awaitable
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timezone
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="urllib3")
 
 # === PATH CONFIGURATION ===
-# Определяем базовый путь для данных (Docker или локально) - ДО импорта CONFIG
+# Пути определяются ДО импорта CONFIG (см. paths.py)
 import os
-DATA_DIR = '/data' if os.path.exists('/data') else '.'
-# Загружаем .env для определения режима (до импорта CONFIG)
-from dotenv import load_dotenv  # type: ignore
-load_dotenv()
-ENV_MODE = os.getenv('ENV_MODE', 'production').lower()
-# Используем разные сессии для теста и продакшна, чтобы избежать конфликтов
-SESSION_NAME = os.getenv('SESSION_NAME', 
-    'userbot2_test_session' if ENV_MODE == 'test' else 'userbot2_session')
-DB_FILE = os.getenv('DB_FILE', 
-    os.path.join(DATA_DIR, "channels_v2_test.db" if ENV_MODE == 'test' else "channels_v2.db") 
-    if DATA_DIR != '.' else ("channels_v2_test.db" if ENV_MODE == 'test' else "channels_v2.db"))
-SESSION_PATH = os.getenv('SESSION_PATH', 
-    os.path.join(DATA_DIR, SESSION_NAME) if DATA_DIR != '.' else SESSION_NAME)
-LOG_FILE = os.getenv('LOG_FILE', 
-    os.path.join(DATA_DIR, "userbot2_test.log" if ENV_MODE == 'test' else "userbot2.log") 
-    if DATA_DIR != '.' else ("userbot2_test.log" if ENV_MODE == 'test' else "userbot2.log"))
+from .paths import (
+    DATA_DIR, ENV_MODE, SESSION_NAME, DB_FILE, ARCHIVE_DB_FILE, SESSION_PATH, LOG_FILE, QUEUE_DB_FILE,
+    TELEGRAM_SESSION_MODE, LOCAL_CLASSIFIER_PATH
+)
 
 # === CONFIG ===
 from .CONFIG import (
-    api_id, api_hash, phone_number, password, deepseek_api_key, csv_url, DEFAULT_CONFIGS
+    api_id, api_hash, phone_number, password, deepseek_api_key, csv_url, DEFAULT_CONFIGS,
+    telegram_accounts, telegram_rpc_interval, forward_target_interval, openai_proxy
+)
+
+# === TELEGRAM ACCOUNTS ===
+from .accounts import (
+    AccountPool, TelegramAccount, build_account_specs, memory_session_copy, PRIMARY_ACCOUNT, RPC_LANE
 )
 
+# === PEER CACHE ===
+from .peer_cache import PeerCache
+
 # === CHANNEL PROCESSORS ===
 from .channel_processors import (
     CHANNEL_TYPE_FILTERED, CHANNEL_TYPE_WHITELIST, CHANNEL_TYPE_STATS, CHANNEL_TYPE_LONGCHECK,
     CHANNEL_TYPE_RANKS, CHANNEL_TYPE_WHITELIST2, CHANNEL_TYPE_TYPE2,
-    MESSAGE_PROCESSORS, parse_amount
+    CHANNEL_TYPE_NAMES, MESSAGE_PROCESSORS, AlbumMessage
 )
+from . import lanes
+from . import routing
+from . import catchup
+from .pipeline import Classified, group_albums, run_pipeline
+from .http_transport import LLM_BASE_URL, close_client, get_client
+from . import diagnostics
+from .prompt_budget import LLM_MAX_OUTPUT_TOKENS, clean_for_llm, estimate_tokens, fit_to_budget, llm_messages
 
 # === CONFIG VALIDATOR ===
 from .config_validator import validate_and_update_config
 
+# === DATABASES (состояние и архив постов) ===
+from . import storage
+
+# === LOCAL CLASSIFIER / METRICS ===
+from .local_classifier import load_model
+from . import metrics
+
+# === LLM RESILIENCE ===
+from .circuit_breaker import CircuitBreaker
+from .exceptions import LLMUnavailableError
+
 # === LOGGING ===
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Через очередь и фоновый listener (см. log_setup.py); в воркерах уже настроено до импорта
+from .log_setup import setup_logging
+setup_logging(LOG_FILE)
 
 # === OPENAI / DEEPSEEK ===
-openai_client = OpenAI(api_key=deepseek_api_key, base_url="https://api.deepseek.com")
+# Ретраи делаем сами (с jitter и учётом circuit breaker), поэтому max_retries=0
+LLM_DEFAULT_TIMEOUT = 20.0
+# Общий пул соединений с keep-alive; OPENAI_PROXY применяется к запросам DeepSeek (http_transport)
+openai_client = AsyncOpenAI(
+    api_key=deepseek_api_key, base_url=LLM_BASE_URL,
+    timeout=LLM_DEFAULT_TIMEOUT, max_retries=0, http_client=get_client(openai_proxy)
+)
+LLM_MAX_ATTEMPTS = 3
+LLM_RETRY_BASE_DELAY = 1.0
+LLM_RETRY_BATCH = 50
+LLM_BREAKER = CircuitBreaker('llm', failure_threshold=5, reset_timeout=60)
+# Маркировка рекламы по закону (erid, «Реклама») — эвристика для политики heuristic без модели
+_AD_MARKER_RE = re.compile(r'\berid\b|#реклама|\bреклама\b', re.IGNORECASE)
+
+# Локальный предклассификатор рекламы (необязателен: без модели все тексты идут в LLM)
+try:
+    LOCAL_CLASSIFIER = load_model(LOCAL_CLASSIFIER_PATH)
+except Exception as e:
+    logging.error(f"Не удалось загрузить локальный классификатор {LOCAL_CLASSIFIER_PATH}: {e}")
+    LOCAL_CLASSIFIER = None
+if LOCAL_CLASSIFIER is not None:
+    logging.info(f"Локальный классификатор загружен: {LOCAL_CLASSIFIER_PATH} {LOCAL_CLASSIFIER.meta.get('eval', '')}")
 
 # Проверка критических параметров при импорте
 if not api_id or not api_hash:
@@ -79,12 +112,39 @@ if not deepseek_api_key:
     raise ValueError("deepseek_api_key must be set in CONFIG.py")
 
 # === TELETHON ===
-client = TelegramClient(SESSION_PATH, api_id, api_hash, connection_retries=5)
+def _make_client(spec: Dict[str, Any]) -> TelegramClient:
+    session = spec['session']
+    if TELEGRAM_SESSION_MODE == 'memory':
+        session = memory_session_copy(session)
+    return TelegramClient(session, spec['api_id'], spec['api_hash'], connection_retries=5)
+
+ACCOUNTS = AccountPool(
+    build_account_specs(
+        {
+            'api_id': api_id, 'api_hash': api_hash, 'phone': phone_number, 'password': password,
+            'session': SESSION_PATH, 'rpc_interval': telegram_rpc_interval
+        },
+        telegram_accounts,
+        DATA_DIR
+    ),
+    client_factory=_make_client
+)
+# Клиент основного аккаунта
+client = ACCOUNTS.primary.client
+# Разрезолвленные целевые каналы и каналы: пересылка не резолвит username
+PEERS = PeerCache()
+# Темп пересылок по (аккаунт, целевой канал), см. routing.py
+TARGET_BUDGETS = routing.TargetBudgets(forward_target_interval)
+# Общий темп опроса каналов после запуска, см. catchup.py
+CATCHUP = catchup.StartupBudget()
 
 # === CONSTANTS ===
 MUTE_UNTIL_FOREVER = 2**31 - 1
 CONFIG_CHECK_INTERVAL = 7200  # 2 часа
+METRICS_LOG_INTERVAL = 600
 MAX_NULL_HASH_FIXES = 5
+# Каналов в одном GetPeerDialogsRequest (предфильтр dialog_prefilter)
+DIALOG_PREFILTER_CHUNK = 100
 SLEEP_AFTER_JOIN_MIN = 25
 SLEEP_AFTER_JOIN_MAX = 40
 SLEEP_AFTER_FLOOD_MIN = 13
@@ -106,10 +166,19 @@ ALLOWED_CONFIG_KEYS = list(DEFAULT_CONFIGS.keys())
 _channel_count_cache: Dict[int, int] = {}
 
 # === HELPER FUNCTIONS ===
+_open_db_connections = 0
+
 @contextmanager
-def get_db_connection():
-    """Context manager для работы с БД - автоматически закрывает соединение"""
-    conn = sqlite3.connect(DB_FILE)
+def get_db_connection(archive: bool = False):
+    """
+    Context manager для работы с БД - автоматически закрывает соединение.
+    archive=True — с подключённым архивом постов (posts, channel_daily_stats, backfill_progress).
+    Такие соединения пишут только в архив: их настройки checkpoint общие для обеих баз
+    (storage.ARCHIVE_PRAGMAS), а таблицы состояния пишутся соединением без архива.
+    """
+    global _open_db_connections
+    conn = storage.connect(DB_FILE, ARCHIVE_DB_FILE if archive else None)
+    _open_db_connections += 1
     try:
         yield conn
         conn.commit()
@@ -118,6 +187,88 @@ def get_db_connection():
         raise
     finally:
         conn.close()
+        _open_db_connections -= 1
+
+# === DIAGNOSTICS (снимок по SIGUSR1, см. diagnostics.py) ===
+def _diag_database() -> Dict[str, Any]:
+    files = {path: os.path.getsize(path)
+             for db in (DB_FILE, ARCHIVE_DB_FILE, QUEUE_DB_FILE) for path in (db, f"{db}-wal")
+             if os.path.exists(path)}
+    return {'open_connections': _open_db_connections, 'file_sizes': files}
+
+def _diag_caches() -> Dict[str, Any]:
+    return {
+        'peers': PEERS.stats(),
+        'channel_count_cache': len(_channel_count_cache),
+        'local_classifier': LOCAL_CLASSIFIER is not None,
+        'llm_breaker': LLM_BREAKER.state,
+    }
+
+diagnostics.register('accounts', lambda: {account.name: account.state() for account in ACCOUNTS})
+diagnostics.register('database', _diag_database)
+diagnostics.register('caches', _diag_caches)
+diagnostics.register('target_budgets', TARGET_BUDGETS.state)
+diagnostics.register('catchup', CATCHUP.state)
+
+def outbox_begin(
+    channel: str,
+    channel_type: int,
+    message_id: int,
+    peer: InputPeerChannel,
+    target: str,
+    account: str = PRIMARY_ACCOUNT,
+    album_ids: Optional[List[int]] = None
+) -> str:
+    """
+    Записывает намерение переслать сообщение (до вызова forward).
+    Возвращает статус записи: 'sent', если сообщение уже было переслано, иначе 'pending'.
+
+    album_ids — все сообщения альбома: после рестарта альбом досылается одним вызовом.
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT status FROM forward_outbox WHERE channel = ? AND message_id = ? AND target = ?",
+            (channel, message_id, target)
+        )
+        row = cur.fetchone()
+        if row and row[0] == 'sent':
+            return 'sent'
+        cur.execute("""
+            INSERT INTO forward_outbox
+                (channel, channel_type, message_id, chat_id, access_hash, target, account, album_ids, attempts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT(channel, message_id, target) DO UPDATE SET
+                status = 'pending',
+                chat_id = excluded.chat_id,
+                access_hash = excluded.access_hash,
+                account = excluded.account,
+                album_ids = excluded.album_ids,
+                attempts = attempts + 1
+        """, (channel, channel_type, message_id, peer.channel_id, peer.access_hash, target, account,
+              json.dumps(album_ids) if album_ids else None))
+        return 'pending'
+
+def outbox_complete(channel: str, message_id: int, target: str, status: str = 'sent') -> None:
+    """
+    Отмечает результат пересылки в posts (если пост уже сохранён) и в outbox.
+
+    Базы пишутся разными соединениями: сначала posts, потом outbox. После сбоя между
+    ними запись outbox остаётся pending, и resume_forward_outbox закрывает её без
+    повторной пересылки (пост уже отмечен пересланным).
+    """
+    if status == 'sent':
+        with get_db_connection(archive=True) as conn:
+            conn.execute(
+                "UPDATE posts SET is_forwarded = 1, forwarded_at = COALESCE(forwarded_at, ?) "
+                "WHERE channel = ? AND message_id = ?",
+                (utc_now().isoformat(), channel, message_id)
+            )
+    with get_db_connection() as conn:
+        conn.execute("""
+            UPDATE forward_outbox SET status = ?, sent_at = CURRENT_TIMESTAMP
+            WHERE channel = ? AND message_id = ? AND target = ?
+        """, (status, channel, message_id, target))
 
 async def safe_forward_message(
     message_id: int,
@@ -126,30 +277,69 @@ async def safe_forward_message(
     channel_type: int,
     counters: dict,
     log_prefix: str = "",
-    use_short_delay: bool = True
+    use_short_delay: bool = True,
+    account: Optional[TelegramAccount] = None,
+    message_ids: Optional[List[int]] = None,
+    target: Optional[str] = None
 ) -> bool:
     """
     Безопасная пересылка сообщения с обработкой ошибок Telegram.
-    Возвращает True если успешно, False если ошибка.
+    Возвращает True если успешно (или сообщение уже было переслано ранее), False если ошибка.
+
+    message_ids — все сообщения альбома (включая message_id): пересылаются одним вызовом
+    и приходят в целевой канал одним альбомом.
+
+    target — целевой канал; по умолчанию по правилам target_routes (routing.resolve_target).
+    Пауза между пересылками выдерживается отдельно для каждого целевого канала
+    (TARGET_BUDGETS), очередь к каналу — по приоритету полосы; FloodWait действует
+    на весь аккаунт (account.penalize).
+
+    Пересылка идёт через forward_outbox: после рестарта повторно обработанные
+    сообщения не пересылаются второй раз.
     """
+    account = account or ACCOUNTS.primary
+    channel = f"@{ch_link}"
+    target = target or routing.resolve_target(channel, channel_type, CONFIG)
+    budget = TARGET_BUDGETS.get(account.name, target)
+    ids = message_ids or [message_id]
+    album_ids = ids if len(ids) > 1 else None
+    statuses = [outbox_begin(channel, channel_type, i, peer, target, account.name, album_ids) for i in ids]
+    if all(status == 'sent' for status in statuses):
+        logging.info(f"https://t.me/{ch_link}/{message_id} (Type {channel_type}): already forwarded → {target}, skip")
+        return True
     try:
-        await ensure_connected()  # Проверка перед отправкой
-        await asyncio.sleep(random.uniform(SLEEP_BETWEEN_MESSAGES_MIN, SLEEP_BETWEEN_MESSAGES_MAX))
-        await client.forward_messages(CONFIG['target_channel'], message_id, from_peer=peer)
-        log_msg = log_prefix if log_prefix else f"https://t.me/{ch_link}/{message_id} (Type {channel_type}): FW → {CONFIG['target_channel']}: {message_id}"
+        await ensure_connected(account)  # Проверка перед отправкой
+        async with budget.slot():
+            await account.throttle()
+            await asyncio.sleep(random.uniform(SLEEP_BETWEEN_MESSAGES_MIN, SLEEP_BETWEEN_MESSAGES_MAX))
+            target_peer = await PEERS.target(account, target)
+            with diagnostics.inflight('telegram', f"{account.name} forward {channel}/{message_id}"):
+                await account.client.forward_messages(target_peer, ids if len(ids) > 1 else message_id, from_peer=peer)
+        for i in ids:
+            outbox_complete(channel, i, target)
+        log_msg = log_prefix if log_prefix else f"https://t.me/{ch_link}/{message_id} (Type {channel_type}): FW → {target}: {message_id}"
+        if len(ids) > 1:
+            log_msg += f" (альбом из {len(ids)})"
         logging.info(log_msg)
         counters['forwarded'] += 1
         return True
+    except AuthKeyDuplicatedError:
+        # Запись остаётся pending и будет дослана после восстановления сессии
+        raise
     except ConnectionError as e:
         logging.warning(f"Connection lost during forward: {e}, reconnecting...")
         try:
-            await ensure_connected()
+            await ensure_connected(account)
         except Exception as reconnect_error:
             logging.error(f"Reconnection failed: {reconnect_error}")
         counters['skipped'] += 1
         return False
     except FloodWaitError as e:
-        logging.warning(f"https://t.me/{ch_link}/{message_id}: FloodWait {e.seconds}s")
+        logging.warning(f"https://t.me/{ch_link}/{message_id}: FloodWait {e.seconds}s → {target} [{account.name}]")
+        for i in ids:
+            outbox_complete(channel, i, target, status='failed')
+        # FloodWait действует на весь аккаунт: ждут все его запросы, в какой бы канал они ни шли
+        account.penalize(e.seconds)
         delay_min = SLEEP_AFTER_FLOOD_SHORT_MIN if use_short_delay else SLEEP_AFTER_FLOOD_MIN
         delay_max = SLEEP_AFTER_FLOOD_SHORT_MAX if use_short_delay else SLEEP_AFTER_FLOOD_MAX
         await asyncio.sleep(e.seconds + random.uniform(delay_min, delay_max))
@@ -157,13 +347,71 @@ async def safe_forward_message(
         return False
     except errors.rpcerrorlist.MsgIdInvalidError as e:
         logging.warning(f"Ignored invalid message ID: https://t.me/{ch_link}/{message_id}, error: {e}")
+        for i in ids:
+            outbox_complete(channel, i, target, status='failed')
         counters['skipped'] += 1
         return False
-    except (errors.RPCError, ConnectionError) as e:
+    except (errors.RPCError, ConnectionError, ValueError) as e:
         logging.error(f"RPC error forwarding message: {e}")
+        if isinstance(e, (errors.ChannelPrivateError, errors.ChannelInvalidError, errors.PeerIdInvalidError)):
+            # Возможно, устарел разрезолвленный target — разрезолвим заново при следующей пересылке
+            PEERS.invalidate_target(account.name, target)
+        for i in ids:
+            outbox_complete(channel, i, target, status='failed')
         counters['skipped'] += 1
         return False
 
+async def resume_forward_outbox() -> None:
+    """
+    Досылает пересылки, прерванные падением или AuthKeyDuplicatedError.
+
+    Берёт только записи в статусе pending. Если пост уже отмечен в posts как
+    пересланный, запись закрывается без повторной пересылки. Пересылка идёт в
+    сохранённый в записи целевой канал: при старте настройки из таблицы ещё не
+    загружены, а маршрут поста определён при его обработке. Запись отмечается
+    failed, только если целевой канал не резолвится (safe_forward_message).
+    Записи одного альбома (album_ids) досылаются одним вызовом, альбомом.
+    """
+    with get_db_connection() as conn:
+        # Старые завершённые записи больше не нужны для дедупликации
+        conn.execute("""
+            DELETE FROM forward_outbox
+            WHERE status != 'pending' AND created_at < datetime('now', '-7 days')
+        """)
+    with get_db_connection(archive=True) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT o.channel, o.channel_type, o.message_id, o.chat_id, o.access_hash, o.target,
+                   o.account, o.album_ids, COALESCE(p.is_forwarded, 0)
+            FROM forward_outbox o
+            LEFT JOIN posts p ON p.channel = o.channel AND p.message_id = o.message_id
+            WHERE o.status = 'pending'
+            ORDER BY o.id
+        """)
+        pending = cur.fetchall()
+    if not pending:
+        return
+    logging.info(f"Outbox: {len(pending)} незавершённых пересылок")
+    # Пересылка — сообщение или альбом целиком; в posts есть только подпись альбома
+    forwards: Dict[Tuple[str, str, Any], List[tuple]] = {}
+    for row in pending:
+        channel, message_id, target, album_ids = row[0], row[2], row[5], row[7]
+        forwards.setdefault((channel, target, album_ids or message_id), []).append(row)
+    counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
+    for rows in forwards.values():
+        channel, channel_type, message_id, chat_id, access_hash, target, account, album_ids, _ = rows[0]
+        if any(row[-1] for row in rows):
+            for row in rows:
+                outbox_complete(channel, row[2], target)
+            continue
+        account = ACCOUNTS.get(account)
+        await safe_forward_message(
+            message_id, PEERS.channel(account.name, chat_id, access_hash), channel.lstrip('@'),
+            channel_type, counters, account=account, target=target,
+            message_ids=json.loads(album_ids) if album_ids else None
+        )
+    logging.info(f"Outbox: дослано {counters['forwarded']}, пропущено {counters['skipped']}")
+
 async def join_and_mute_channel(
     channel_username: str,
     stats: Set[str],
@@ -171,27 +419,33 @@ async def join_and_mute_channel(
     longcheck: Set[str],
     ranks: Set[str],
     whitelist2: Set[str],
-    type2: Set[str]
+    type2: Set[str],
+    account: Optional[TelegramAccount] = None
 ) -> Optional[Tuple[int, int, int, int]]:
     """
     Подписывается на канал и отключает уведомления.
     Возвращает (chat_id, access_hash, last_message_id, channel_type) или None при ошибке.
+    access_hash действителен только для аккаунта, который подписался.
     """
+    account = account or ACCOUNTS.primary
+    tg = account.client
     try:
-        logging.info(f"Join: {channel_username}")
-        result = await client(JoinChannelRequest(channel_username))
+        logging.info(f"Join: {channel_username} [{account.name}]")
+        await account.throttle()
+        result = await tg(JoinChannelRequest(channel_username))
         await asyncio.sleep(random.uniform(SLEEP_AFTER_JOIN_MIN, SLEEP_AFTER_JOIN_MAX))
         chat = result.chats[0]
-        await client(UpdateNotifySettingsRequest(
+        await tg(UpdateNotifySettingsRequest(
             peer=InputPeerChannel(chat.id, chat.access_hash),
             settings=InputPeerNotifySettings(mute_until=MUTE_UNTIL_FOREVER)
         ))
-        last_msg = await client.get_messages(InputPeerChannel(chat.id, chat.access_hash), limit=1)
+        last_msg = await tg.get_messages(InputPeerChannel(chat.id, chat.access_hash), limit=1)
         last_id = last_msg[0].id if last_msg else 0
         ctype = _get_channel_type(channel_username, stats, whitelist, longcheck, ranks, whitelist2, type2)
         return chat.id, chat.access_hash, last_id, ctype
     except FloodWaitError as e:
-        logging.warning(f"FloodWait {e.seconds}s join {channel_username}")
+        logging.warning(f"FloodWait {e.seconds}s join {channel_username} [{account.name}]")
+        account.penalize(e.seconds)
         await asyncio.sleep(e.seconds + random.uniform(SLEEP_AFTER_FLOOD_MIN, SLEEP_AFTER_FLOOD_MAX))
         return None
     except (errors.RPCError, ConnectionError, ValueError) as e:
@@ -199,67 +453,19 @@ async def join_and_mute_channel(
         return None
 
 def setup_database() -> None:
-    """Инициализирует базу данных"""
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS channels (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE,
-            chat_id INTEGER,
-            last_message_id INTEGER DEFAULT 0,
-            channel_type INTEGER NOT NULL DEFAULT 0
-        )
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS advertisements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            message_id INTEGER UNIQUE,
-            channel_username TEXT
-        )
-    """)
-    # Таблица для хранения всех обработанных постов
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS posts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            channel TEXT NOT NULL,
-            channel_type INTEGER NOT NULL,
-            message_id INTEGER NOT NULL,
-            post_url TEXT NOT NULL,
-            text TEXT,
-            text_length INTEGER DEFAULT 0,
-            published_at TIMESTAMP,
-            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_advertisement BOOLEAN DEFAULT 0,
-            is_forwarded BOOLEAN DEFAULT 0,
-            has_media BOOLEAN DEFAULT 0,
-            blacklisted BOOLEAN DEFAULT 0,
-            UNIQUE(channel, message_id)
-        )
-    """)
-    # Оптимизированные индексы для быстрого поиска
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_channel ON posts(channel)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_published_at ON posts(published_at)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_is_advertisement ON posts(is_advertisement)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_is_forwarded ON posts(is_forwarded)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_channel_type ON posts(channel_type)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_channel_message_id ON posts(channel, message_id)")
-    cur.execute("PRAGMA table_info(channels)")
-    columns = [col[1] for col in cur.fetchall()]
-    if 'access_hash' not in columns:
-        cur.execute("ALTER TABLE channels ADD COLUMN access_hash INTEGER")
-        logging.info("Добавлен столбец access_hash в таблицу channels")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_channels_username ON channels (username)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_advertisements_message_id ON advertisements (message_id)")
-    conn.commit()
-    conn.close()
-    logging.info("Database initialized with posts table")
-
-def get_tracked_channels() -> List[Tuple[str, int, int, int, Optional[int]]]:
-    """Получает список отслеживаемых каналов из БД"""
+    """Инициализирует базу состояния и архив постов, применяет миграции схемы (storage.setup)"""
+    # WAL сохраняется в файлах БД: читатели (query_api, отчёты) не блокируют запись бота
+    version, archive_version = storage.setup(DB_FILE, ARCHIVE_DB_FILE)
+    logging.info(f"Database initialized, schema version {version}, archive schema version {archive_version}")
+
+def get_tracked_channels() -> List[Tuple[str, int, int, int, Optional[int], Optional[str]]]:
+    """
+    Получает список отслеживаемых каналов из БД:
+    (username, last_message_id, channel_type, chat_id, access_hash, account)
+    """
     with get_db_connection() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT username, last_message_id, channel_type, chat_id, access_hash FROM channels")
+        cur.execute("SELECT username, last_message_id, channel_type, chat_id, access_hash, account FROM channels")
         return cur.fetchall()
 
 def add_channel_to_db(
@@ -267,15 +473,25 @@ def add_channel_to_db(
     chat_id: int,
     access_hash: Optional[int],
     last_message_id: int = 0,
-    channel_type: int = 0
+    channel_type: int = 0,
+    account: str = PRIMARY_ACCOUNT
 ) -> None:
     """Добавляет канал в БД"""
     with get_db_connection() as conn:
         cur = conn.cursor()
         cur.execute("""
-            INSERT OR IGNORE INTO channels (username, chat_id, access_hash, last_message_id, channel_type)
-            VALUES (?, ?, ?, ?, ?)
-        """, (username, chat_id, access_hash, last_message_id, channel_type))
+            INSERT OR IGNORE INTO channels (username, chat_id, access_hash, last_message_id, channel_type, account)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (username, chat_id, access_hash, last_message_id, channel_type, account))
+
+def reassign_channel_account(username: str, account: str, chat_id: int, access_hash: int) -> None:
+    """Закрепляет канал за другим аккаунтом, сохраняя last_message_id"""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE channels SET account = ?, chat_id = ?, access_hash = ? WHERE username = ?",
+            (account, chat_id, access_hash, username)
+        )
 
 def update_last_message_id(channel_username: str, message_id: int) -> None:
     """Обновляет last_message_id для канала"""
@@ -283,6 +499,22 @@ def update_last_message_id(channel_username: str, message_id: int) -> None:
         cur = conn.cursor()
         cur.execute("UPDATE channels SET last_message_id = ? WHERE username = ?", (message_id, channel_username))
 
+def load_scheduler_state(scope: str) -> Dict[str, float]:
+    """Время последнего опроса (unix time) по именам в scheduler_state (catchup.SCOPE_*)"""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT name, last_scan_at FROM scheduler_state WHERE scope = ?", (scope,))
+        return dict(cur.fetchall())
+
+def save_scan_times(scope: str, names: List[str], scanned_at: float) -> None:
+    """Запоминает время опроса полос или каналов"""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.executemany("""
+            INSERT INTO scheduler_state (scope, name, last_scan_at) VALUES (?, ?, ?)
+            ON CONFLICT(scope, name) DO UPDATE SET last_scan_at = excluded.last_scan_at
+        """, [(scope, name, scanned_at) for name in names])
+
 def update_channel_type(channel_username: str, channel_type: int) -> None:
     """Обновляет тип канала"""
     with get_db_connection() as conn:
@@ -306,7 +538,7 @@ def add_advertisement_post(message_id: int, channel_username: str) -> None:
             (message_id, channel_username)
         )
 
-def save_posts_batch(posts: List[Dict[str, Any]]) -> None:
+def save_posts_batch(posts: List[Dict[str, Any]], conn: Optional[sqlite3.Connection] = None) -> None:
     """
     Оптимизированное батч-сохранение постов в БД.
     
@@ -322,50 +554,89 @@ def save_posts_batch(posts: List[Dict[str, Any]]) -> None:
             - is_forwarded: bool
             - has_media: bool
             - blacklisted: bool
+            - amounts: Optional[List[Tuple[Optional[str], float]]] (stats-каналы)
+        conn: Открытое соединение с архивом (get_db_connection(archive=True)), если посты нужно
+            записать в транзакции вызывающего
     """
     if not posts:
         return
     
-    with get_db_connection() as conn:
-        cur = conn.cursor()
-        # Подготавливаем данные для батч-вставки
-        batch_data = []
-        for post in posts:
-            published_at = post.get('published_at')
-            # Конвертируем datetime в строку ISO format для SQLite
-            if published_at:
-                if isinstance(published_at, datetime):
-                    published_at_str = published_at.isoformat()
-                elif isinstance(published_at, str):
-                    published_at_str = published_at
-                else:
-                    published_at_str = None
+    if conn is None:
+        with get_db_connection(archive=True) as own_conn:
+            _upsert_posts(own_conn.cursor(), posts)
+    else:
+        _upsert_posts(conn.cursor(), posts)
+    logging.info(f"Saved batch of {len(posts)} posts to database")
+
+def _upsert_posts(cur: sqlite3.Cursor, posts: List[Dict[str, Any]]) -> None:
+    # Подготавливаем данные для батч-вставки
+    batch_data = []
+    for post in posts:
+        published_at = post.get('published_at')
+        # Конвертируем datetime в строку ISO format для SQLite
+        if published_at:
+            if isinstance(published_at, datetime):
+                published_at_str = published_at.isoformat()
+            elif isinstance(published_at, str):
+                published_at_str = published_at
             else:
                 published_at_str = None
-            
-            batch_data.append((
-                post['channel'],
-                post['channel_type'],
-                post['message_id'],
-                post['post_url'],
-                post.get('text'),
-                post.get('text_length', 0),
-                published_at_str,
-                int(post.get('is_advertisement', False)),
-                int(post.get('is_forwarded', False)),
-                int(post.get('has_media', False)),
-                int(post.get('blacklisted', False))
-            ))
+        else:
+            published_at_str = None
         
-        # Используем executemany для батч-вставки
-        cur.executemany("""
-            INSERT OR REPLACE INTO posts 
-            (channel, channel_type, message_id, post_url, text, text_length, 
-             published_at, is_advertisement, is_forwarded, has_media, blacklisted)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, batch_data)
-        if len(posts) > 0:
-            logging.info(f"Saved batch of {len(posts)} posts to database")
+        amounts = post.get('amounts')
+        batch_data.append((
+            post['channel'],
+            post['channel_type'],
+            post['message_id'],
+            post['post_url'],
+            post.get('text'),
+            post.get('text_length', 0),
+            published_at_str,
+            int(post.get('is_advertisement', False)),
+            int(post.get('is_forwarded', False)),
+            int(post.get('has_media', False)),
+            int(post.get('blacklisted', False)),
+            json.dumps(amounts) if amounts else None,
+            max(a for _, a in amounts) if amounts else None,
+            _iso(post.get('fetched_at')),
+            _iso(post.get('classified_at')),
+            _iso(post.get('forwarded_at'))
+        ))
+    
+    # UPSERT вместо INSERT OR REPLACE: REPLACE удаляет и заново вставляет строку,
+    # трогая все индексы и меняя id, а ON CONFLICT обновляет строку на месте
+    cur.executemany("""
+        INSERT INTO posts 
+        (channel, channel_type, message_id, post_url, text, text_length, 
+         published_at, is_advertisement, is_forwarded, has_media, blacklisted, amounts, max_amount,
+         fetched_at, classified_at, forwarded_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(channel, message_id) DO UPDATE SET
+            channel_type = excluded.channel_type,
+            post_url = excluded.post_url,
+            text = excluded.text,
+            text_length = excluded.text_length,
+            published_at = excluded.published_at,
+            processed_at = CURRENT_TIMESTAMP,
+            is_advertisement = excluded.is_advertisement,
+            is_forwarded = MAX(posts.is_forwarded, excluded.is_forwarded),
+            has_media = excluded.has_media,
+            blacklisted = excluded.blacklisted,
+            amounts = excluded.amounts,
+            max_amount = excluded.max_amount,
+            -- Задержки считаются по первой обработке поста
+            fetched_at = COALESCE(posts.fetched_at, excluded.fetched_at),
+            classified_at = COALESCE(posts.classified_at, excluded.classified_at),
+            forwarded_at = COALESCE(posts.forwarded_at, excluded.forwarded_at)
+    """, batch_data)
+
+def _iso(value: Any) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def utc_now() -> datetime:
+    """Текущее время для отметок стадий поста (fetched_at/classified_at/forwarded_at)"""
+    return datetime.now(timezone.utc)
 
 def update_post_forwarded(channel: str, message_id: int, is_forwarded: bool = True) -> None:
     """
@@ -376,7 +647,7 @@ def update_post_forwarded(channel: str, message_id: int, is_forwarded: bool = Tr
         message_id: ID сообщения
         is_forwarded: Был ли пост переслан
     """
-    with get_db_connection() as conn:
+    with get_db_connection(archive=True) as conn:
         cur = conn.cursor()
         cur.execute(
             "UPDATE posts SET is_forwarded = ? WHERE channel = ? AND message_id = ?",
@@ -394,33 +665,156 @@ async def is_blacklisted(text: str) -> bool:
             return True
     return False
 
-async def is_advertisement(text: str) -> bool:
-    """Проверяет, является ли текст рекламой через AI"""
-    try:
-        if isinstance(text, bytes):
-            text = text.decode('utf-8', errors='ignore')
-        text = re.sub(r'[^\w\s.,!?а-яА-Я$]', '', text)
-        if not text.strip():
-            logging.warning("Текст пуст после очистки, скип")
-            return False
-        resp = openai_client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": CONFIG['system_prompt']},
-                {
-                    "role": "user",
-                    "content": CONFIG['user_prompt'].format(text=text)
-                }
-            ],
-            max_tokens=10,
-            temperature=0
+def classify_locally(text: str) -> Optional[bool]:
+    """Вердикт локального классификатора или None, если модели нет или она не уверена"""
+    threshold = CONFIG['local_classifier_threshold']
+    if LOCAL_CLASSIFIER is None or threshold >= 1 or not isinstance(text, str):
+        return None
+    verdict = LOCAL_CLASSIFIER.decide(text, threshold)
+    if verdict is None:
+        metrics.inc('local_classifier.escalated')
+    else:
+        metrics.inc('local_classifier.ad' if verdict else 'local_classifier.not_ad')
+    return verdict
+
+async def _ask_llm(text: str) -> str:
+    """Один запрос к DeepSeek с жёстким дедлайном"""
+    timeout = float(CONFIG['llm_timeout'])
+    with diagnostics.inflight('llm', f"{estimate_tokens(text)} tokens"):
+        resp = await asyncio.wait_for(
+            openai_client.chat.completions.create(
+                model="deepseek-chat",
+                messages=llm_messages(CONFIG, text),
+                max_tokens=LLM_MAX_OUTPUT_TOKENS,
+                temperature=0,
+                timeout=timeout
+            ),
+            timeout=timeout + 5
         )
-        result = resp.choices[0].message.content.strip().lower()
+    return resp.choices[0].message.content.strip().lower()
+
+def _heuristic_is_advertisement(text: str) -> bool:
+    """Локальная оценка без LLM: модель с порогом 0.5, без модели — маркировка рекламы"""
+    if LOCAL_CLASSIFIER is not None:
+        return LOCAL_CLASSIFIER.predict_proba(text) >= 0.5
+    return bool(_AD_MARKER_RE.search(text))
+
+def _llm_fallback(text: str) -> bool:
+    """Решение, когда LLM недоступен, по политике llm_fallback_policy"""
+    policy = CONFIG['llm_fallback_policy']
+    metrics.inc(f'llm.fallback.{policy}')
+    if policy == 'defer':
+        raise LLMUnavailableError(f"LLM unavailable (breaker {LLM_BREAKER.state})")
+    if policy == 'heuristic':
+        return _heuristic_is_advertisement(text)
+    return False  # pass: считаем не рекламой
+
+async def is_advertisement(text: str) -> bool:
+    """
+    Проверяет, является ли текст рекламой через AI.
+
+    Ошибки и таймауты ретраятся с экспоненциальной паузой и jitter; при открытом
+    circuit breaker или исчерпании попыток решение принимает _llm_fallback.
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', errors='ignore')
+    raw_text = text
+    # Длинный пост укорачивается до бюджета (начало, конец, строки со ссылками), затем очищается
+    text, truncated = fit_to_budget(text, int(CONFIG['llm_input_token_budget']))
+    if truncated:
+        metrics.inc('llm.truncated')
+    text = clean_for_llm(text)
+    if not text.strip():
+        logging.warning("Текст пуст после очистки, скип")
+        return False
+    for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+        if not LLM_BREAKER.allow():
+            break
+        metrics.inc('llm.calls')
+        metrics.observe('llm.prompt_tokens', estimate_tokens(text))
+        started = time.monotonic()
+        try:
+            result = await _ask_llm(text)
+        except Exception as e:
+            LLM_BREAKER.record_failure()
+            metrics.inc('llm.failures')
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.inc('llm.timeouts')
+            logging.error(f"Ошибка OpenAI при анализе текста (попытка {attempt}/{LLM_MAX_ATTEMPTS}): {e!r}")
+            if attempt < LLM_MAX_ATTEMPTS and LLM_BREAKER.ready():
+                await asyncio.sleep(LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            continue
+        LLM_BREAKER.record_success()
+        metrics.observe('llm.latency', time.monotonic() - started)
         logging.info(f"Классификатор: {result}")
         return result == "нет"
-    except Exception as e:
-        logging.error(f"Ошибка OpenAI при анализе текста: {e}\n{traceback.format_exc()}")
-        return False  # При ошибке не считаем рекламой (безопасное поведение)
+    return _llm_fallback(raw_text)
+
+def defer_llm_check(message_id: int, channel: str, channel_type: int) -> None:
+    """Откладывает проверку поста до восстановления LLM"""
+    with get_db_connection() as conn:
+        conn.execute("""
+            INSERT INTO llm_retry_queue (channel, message_id, channel_type) VALUES (?, ?, ?)
+            ON CONFLICT(channel, message_id) DO UPDATE SET attempts = attempts + 1
+        """, (channel, message_id, channel_type))
+    metrics.inc('llm.deferred')
+
+async def retry_deferred_llm_checks() -> None:
+    """
+    Повторно обрабатывает отложенные посты, когда LLM снова доступен.
+
+    Сообщения перечитываются из Telegram и проходят через обычный процессор;
+    при новой недоступности LLM оставшиеся записи ждут следующего цикла.
+    """
+    if not LLM_BREAKER.ready():
+        return
+    with get_db_connection() as conn:
+        conn.execute("DELETE FROM llm_retry_queue WHERE channel NOT IN (SELECT username FROM channels)")
+        rows = conn.execute("""
+            SELECT q.channel, q.message_id, q.channel_type, c.chat_id, c.access_hash, c.account
+            FROM llm_retry_queue q JOIN channels c ON c.username = q.channel
+            ORDER BY q.created_at, q.message_id
+            LIMIT ?
+        """, (LLM_RETRY_BATCH,)).fetchall()
+        metrics.set_gauge('llm.retry_queue_depth', conn.execute("SELECT COUNT(*) FROM llm_retry_queue").fetchone()[0])
+    if not rows:
+        return
+    by_channel: Dict[str, List[Tuple[int, int, int, Optional[int], Optional[str]]]] = {}
+    for channel, message_id, channel_type, chat_id, access_hash, account_name in rows:
+        by_channel.setdefault(channel, []).append((message_id, channel_type, chat_id, access_hash, account_name))
+    logging.info(f"Повторная проверка {len(rows)} отложенных постов")
+    for channel, items in by_channel.items():
+        _, channel_type, chat_id, access_hash, account_name = items[0]
+        account = ACCOUNTS.get(account_name)
+        processor = MESSAGE_PROCESSORS.get(channel_type)
+        peer = PEERS.channel(account.name, chat_id, access_hash)
+        ch_link = channel.lstrip('@')
+        forward_func = functools.partial(safe_forward_message, account=account)
+        await account.throttle()
+        with diagnostics.inflight('telegram', f"{account.name} get_messages {channel} ({len(items)})"):
+            messages = await account.client.get_messages(peer, ids=[item[0] for item in items])
+        counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
+        posts_batch: List[Dict] = []
+        done: List[Tuple[str, int]] = []
+        try:
+            for (message_id, *_), message in zip(items, messages):
+                if message is not None and processor is not None:
+                    await processor(
+                        message, peer, ch_link, channel_type, counters,
+                        forward_func, is_blacklisted, is_advertisement,
+                        is_advertisement_post, add_advertisement_post,
+                        config=CONFIG, channel=channel, posts_batch=posts_batch,
+                        local_classify_func=classify_locally
+                    )
+                done.append((channel, message_id))
+        except LLMUnavailableError:
+            logging.warning("LLM всё ещё недоступен, отложенные посты ждут следующего цикла")
+            return
+        finally:
+            if posts_batch:
+                save_posts_batch(posts_batch)
+            with get_db_connection() as conn:
+                conn.executemany("DELETE FROM llm_retry_queue WHERE channel = ? AND message_id = ?", done)
 
 def _get_channel_type(
     ch: str,
@@ -447,74 +841,141 @@ def _get_channel_type(
     else:
         return CHANNEL_TYPE_FILTERED
 
+def _fetch_limits() -> Tuple[int, int]:
+    """Размер страницы и бюджет сообщений одного канала за цикл"""
+    page_size = max(1, int(CONFIG['max_messages_per_channel']) 
+                    if str(CONFIG['max_messages_per_channel']).isdigit() else 100)
+    budget = max(1, int(CONFIG.get('catchup_budget_per_cycle', 500)))
+    return page_size, budget
+
+async def _iter_message_pages(
+    account: TelegramAccount,
+    peer: InputPeerChannel,
+    min_id: int,
+    page_size: int,
+    budget: int
+):
+    """
+    Отдаёт новые сообщения канала страницами, от старых к новым.
+
+    В отличие от get_messages(limit=N), который возвращает N самых новых сообщений,
+    ничего не пропускает: за цикл отдаётся не больше budget сообщений, остальное
+    догоняется в следующих циклах. В памяти держится не больше одной страницы.
+    """
+    page = []
+    await account.throttle()
+    messages = account.client.iter_messages(peer, min_id=min_id, reverse=True, limit=budget)
+    while True:
+        # Запрос к Telegram идёт внутри __anext__, когда буфер iter_messages пуст
+        with diagnostics.inflight('telegram', f"{account.name} read {peer.channel_id} >{min_id}"):
+            try:
+                message = await messages.__anext__()
+            except StopAsyncIteration:
+                break
+        page.append(message)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
 async def process_channel(
     channel: str,
     last_message_id: int,
     channel_type: int,
     chat_id: int,
-    access_hash: Optional[int]
+    access_hash: Optional[int],
+    account_name: Optional[str] = None
 ) -> dict:
-    """Обрабатывает канал, используя соответствующий процессор"""
+    """
+    Обрабатывает новые сообщения канала процессором его типа.
+    Чтение, классификация, пересылка и запись идут конвейером (см. pipeline.py).
+    """
+    account = ACCOUNTS.get(account_name)
     ch_link = channel.lstrip('@')
     counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
     
     try:
-        # Проверяем соединение перед обработкой
-        await ensure_connected()
-        
-        peer = InputPeerChannel(chat_id, access_hash)
-        lim = max(1, int(CONFIG['max_messages_per_channel']) 
-                 if str(CONFIG['max_messages_per_channel']).isdigit() else 100)
-        
-        messages = await client.get_messages(peer, min_id=last_message_id, limit=lim)
-        counters['fetched'] = len(messages)
-        
-        if not messages:
-            return counters
-        
-        messages = sorted(messages, key=lambda m: m.id)
-        max_id = last_message_id
-        
         # Получаем процессор для этого типа канала
         processor = MESSAGE_PROCESSORS.get(channel_type)
         if not processor:
             logging.warning(f"Неизвестный тип канала: {channel_type}, пропускаем")
             return counters
         
-        # Список для батч-сохранения постов
-        posts_batch = []
+        # Проверяем соединение перед обработкой
+        await ensure_connected(account)
+        
+        peer = PEERS.channel(account.name, chat_id, access_hash)
+        page_size, budget = _fetch_limits()
+        
+        fetched_at: Dict[int, datetime] = {}
+        
+        async def pages():
+            async for page in _iter_message_pages(account, peer, last_message_id, page_size, budget):
+                counters['fetched'] += len(page)
+                now = utc_now()
+                for message in page:
+                    fetched_at[message.id] = now
+                yield page
         
-        # Обрабатываем каждое сообщение
-        for message in messages:
+        async def classify(message) -> Optional[Classified]:
             if message.id <= last_message_id:
-                continue
-            
-            max_id = max(max_id, message.id)
-            
+                return None
             # Пропускаем служебные сообщения
             if message.action:
                 logging.info(f"Skipped service message: https://t.me/{ch_link}/{message.id}")
-                continue
+                return None
+            posts: List[Dict[str, Any]] = []
+            deferred_forward = []
+            
+            async def defer_forward(*args, **kwargs) -> bool:
+                # Пересылка выполняется стадией пересылки по порядку id; is_forwarded
+                # постов будет исправлен по её результату
+                deferred_forward.append((args, kwargs))
+                return True
             
-            # Вызываем процессор с нужными параметрами
             await processor(
                 message, peer, ch_link, channel_type, counters,
-                safe_forward_message, is_blacklisted, is_advertisement,
+                defer_forward, is_blacklisted, is_advertisement,
                 is_advertisement_post, add_advertisement_post,
                 config=CONFIG, channel=channel,
-                posts_batch=posts_batch  # Передаем список для сбора постов
+                posts_batch=posts,  # Передаем список для сбора постов
+                local_classify_func=classify_locally,
+                defer_func=defer_llm_check
             )
+            classified_at = utc_now()
+            for post in posts:
+                post['fetched_at'] = fetched_at.pop(message.id, None)
+                post['classified_at'] = classified_at
+            if deferred_forward and isinstance(message, AlbumMessage):
+                deferred_forward[0][1]['message_ids'] = message.ids
+            return Classified(message.id, posts, deferred_forward[0] if deferred_forward else None)
         
-        # Сохраняем все посты батчем в БД
-        if posts_batch:
-            try:
-                save_posts_batch(posts_batch)
-            except Exception as e:
-                logging.error(f"Error saving posts batch for {channel}: {e}\n{traceback.format_exc()}")
+        async def forward(result: Classified) -> bool:
+            args, kwargs = result.forward
+            forwarded = await safe_forward_message(*args, **kwargs, account=account)
+            if forwarded:
+                forwarded_at = utc_now()
+                for post in result.posts:
+                    post['forwarded_at'] = forwarded_at
+            return forwarded
+        
+        def persist(posts_batch: List[Dict[str, Any]], max_id: int) -> None:
+            # Сохраняем посты страницы батчем в БД
+            if posts_batch:
+                try:
+                    save_posts_batch(posts_batch)
+                except Exception as e:
+                    logging.error(f"Error saving posts batch for {channel}: {e}\n{traceback.format_exc()}")
+            # Чекпоинт после каждой страницы: после сбоя повторно обработается не больше одной страницы
+            if max_id > last_message_id:
+                update_last_message_id(channel, max_id)
+        
+        # Части альбома оцениваются и пересылаются вместе
+        await run_pipeline(group_albums(pages()), classify, forward, persist)
         
-        # Обновляем last_message_id
-        if max_id > last_message_id:
-            update_last_message_id(channel, max_id)
+        if counters['fetched'] >= budget:
+            logging.info(f"{channel}: достигнут лимит {budget} сообщений за цикл, догоняем в следующем")
         
         return counters
         
@@ -522,7 +983,7 @@ async def process_channel(
         logging.error(
             f"@{channel}: AuthKeyDuplicatedError - сессия используется с двух IP одновременно!\n"
             f"Останови бота на сервере или используй другой аккаунт для локального тестирования.\n"
-            f"Текущая сессия: {SESSION_PATH}\n"
+            f"Текущая сессия: {account.session_path}\n"
             f"Проверь, что локально используется тестовый аккаунт (ENV_MODE=test)"
         )
         # Пропускаем этот канал, но не падаем полностью
@@ -530,7 +991,7 @@ async def process_channel(
     except ConnectionError as e:
         logging.warning(f"@{channel}: Connection lost, attempting reconnect...")
         try:
-            await ensure_connected()
+            await ensure_connected(account)
             return counters
         except Exception as reconnect_error:
             logging.error(f"@{channel}: Reconnection failed: {reconnect_error}")
@@ -539,16 +1000,26 @@ async def process_channel(
         logging.error(f"@{channel} (Type {channel_type}): Ошибка: {e}\n{traceback.format_exc()}")
         return counters
 
-async def remove_channel(channel_username, chat_id, access_hash):
+async def leave_channel(channel_username, chat_id, access_hash, account: Optional[TelegramAccount] = None):
+    """Отписывает аккаунт от канала (без изменений в БД)"""
+    account = account or ACCOUNTS.primary
     try:
         peer = InputPeerChannel(chat_id, access_hash)
-        await client(LeaveChannelRequest(peer))
-        logging.info(f"Left: {channel_username}")
+        await account.throttle()
+        await account.client(LeaveChannelRequest(peer))
+        logging.info(f"Left: {channel_username} [{account.name}]")
     except FloodWaitError as e:
-        logging.warning(f"FloodWait {e.seconds}s leave {channel_username}")
+        logging.warning(f"FloodWait {e.seconds}s leave {channel_username} [{account.name}]")
+        account.penalize(e.seconds)
         await asyncio.sleep(e.seconds + random.uniform(SLEEP_AFTER_FLOOD_MIN, SLEEP_AFTER_FLOOD_MAX))
     except Exception as e:
         logging.error(f"Ошибка отписки {channel_username}: {e}")
+
+async def remove_channel(channel_username, chat_id, access_hash, account_name: Optional[str] = None):
+    account = ACCOUNTS.get(account_name)
+    await leave_channel(channel_username, chat_id, access_hash, account)
+    if chat_id:
+        PEERS.forget_channel(account.name, chat_id)
     with get_db_connection() as conn:
         cur = conn.cursor()
         cur.execute("DELETE FROM channels WHERE username = ?", (channel_username,))
@@ -560,10 +1031,10 @@ def _parse_channel_from_row(row: List[str], index: int, channel_set: Set[str]) -
         ch = row[index].strip()
         channel_set.add('@' + ch if not ch.startswith('@') else ch)
 
-def load_csv():
+async def load_csv():
     try:
         timeout = CONFIG.get('csv_timeout', 30)
-        resp = requests.get(csv_url, timeout=timeout)
+        resp = await get_client(openai_proxy).get(csv_url, timeout=timeout)
         resp.raise_for_status()
         csv_content = StringIO(resp.text)
         reader = csv.reader(csv_content, delimiter=',')
@@ -600,7 +1071,8 @@ async def fetch_channels(csv_rows: List[List[str]]) -> None:
             _parse_channel_from_row(row, 6, type2)
 
         all_google = stats | whitelist | longcheck | filtered | ranks | whitelist2 | type2
-        db_channels = {c[0] for c in get_tracked_channels()}
+        tracked = {c[0]: c for c in get_tracked_channels()}
+        db_channels = set(tracked)
 
         new_channels = all_google - db_channels
         removed = db_channels - all_google
@@ -608,11 +1080,13 @@ async def fetch_channels(csv_rows: List[List[str]]) -> None:
 
         for ch in new_channels:
             try:
-                result = await join_and_mute_channel(ch, stats, whitelist, longcheck, ranks, whitelist2, type2)
+                account = ACCOUNTS.get(ACCOUNTS.assign(ch))
+                result = await join_and_mute_channel(ch, stats, whitelist, longcheck, ranks, whitelist2, type2,
+                                                     account=account)
                 if result:
                     chat_id, access_hash, last_id, ctype = result
-                    add_channel_to_db(ch, chat_id, access_hash, last_id, ctype)
-                    logging.info(f"Joined and muted: {ch}, type={ctype}")
+                    add_channel_to_db(ch, chat_id, access_hash, last_id, ctype, account.name)
+                    logging.info(f"Joined and muted: {ch}, type={ctype}, account={account.name}")
             except Exception as e:
                 logging.error(f"Ошибка подписки на канал {ch}: {e}")
 
@@ -620,7 +1094,7 @@ async def fetch_channels(csv_rows: List[List[str]]) -> None:
         existing_with_null = [
             (ch, _get_channel_type(ch, stats, whitelist, longcheck, ranks, whitelist2, type2))
             for ch in existing
-            if next((c[4] for c in get_tracked_channels() if c[0] == ch), None) is None
+            if tracked[ch][4] is None
         ][:max_fixes]
         for ch, ctype in existing_with_null:
             logging.info(f"Канал {ch} имеет NULL access_hash, удаляем и переподписываемся")
@@ -628,23 +1102,45 @@ async def fetch_channels(csv_rows: List[List[str]]) -> None:
                 cur = conn.cursor()
                 cur.execute("DELETE FROM channels WHERE username = ?", (ch,))
             try:
-                result = await join_and_mute_channel(ch, stats, whitelist, longcheck, ranks, whitelist2, type2)
+                account = ACCOUNTS.get(ACCOUNTS.assign(ch))
+                result = await join_and_mute_channel(ch, stats, whitelist, longcheck, ranks, whitelist2, type2,
+                                                     account=account)
                 if result:
                     chat_id, access_hash, last_id, ctype = result
-                    add_channel_to_db(ch, chat_id, access_hash, last_id, ctype)
-                    logging.info(f"Переподписан: {ch}, type={ctype}")
+                    add_channel_to_db(ch, chat_id, access_hash, last_id, ctype, account.name)
+                    logging.info(f"Переподписан: {ch}, type={ctype}, account={account.name}")
             except Exception as e:
                 logging.error(f"Ошибка переподписки на канал {ch}: {e}")
 
+        # Ребалансировка: каналы, закреплённые не за тем аккаунтом (аккаунты добавлены/удалены).
+        # Новый аккаунт подписывается, last_message_id сохраняется, старый отписывается.
+        fixed = {ch for ch, _ in existing_with_null}
+        moves = [ch for ch in sorted(existing - fixed) if tracked[ch][5] != ACCOUNTS.assign(ch)][:max_fixes]
+        for ch in moves:
+            old_account_name = tracked[ch][5]
+            new_account = ACCOUNTS.get(ACCOUNTS.assign(ch))
+            try:
+                result = await join_and_mute_channel(ch, stats, whitelist, longcheck, ranks, whitelist2, type2,
+                                                     account=new_account)
+                if not result:
+                    continue
+                chat_id, access_hash, _, _ = result
+                reassign_channel_account(ch, new_account.name, chat_id, access_hash)
+                logging.info(f"Канал {ch} перенесён: {old_account_name} → {new_account.name}")
+                if old_account_name in ACCOUNTS.names:
+                    await leave_channel(ch, tracked[ch][3], tracked[ch][4], ACCOUNTS.get(old_account_name))
+            except Exception as e:
+                logging.error(f"Ошибка переноса канала {ch} на {new_account.name}: {e}")
+
         for ch in existing:
             ctype = _get_channel_type(ch, stats, whitelist, longcheck, ranks, whitelist2, type2)
             update_channel_type(ch, ctype)
 
         for ch in removed:
-            row = next((c for c in get_tracked_channels() if c[0] == ch), None)
+            row = tracked.get(ch)
             if row:
                 try:
-                    await remove_channel(ch, row[3], row[4])
+                    await remove_channel(ch, row[3], row[4], row[5])
                 except Exception as e:
                     logging.error(f"Ошибка удаления {ch}: {e}")
 
@@ -678,31 +1174,82 @@ async def update_configs(csv_rows: List[List[str]]) -> None:
     try:
         updated_config = validate_and_update_config(CONFIG, configs)
         if updated_config != CONFIG:
+            old_targets = routing.all_targets(CONFIG)
             CONFIG.update(updated_config)
             logging.info(f"Новые настройки применены: {list(configs.keys())}")
+            targets = routing.all_targets(CONFIG)
+            if targets != old_targets:
+                logging.info(f"Целевые каналы изменены: {', '.join(old_targets)} → {', '.join(targets)}")
+                for target in set(old_targets) - set(targets):
+                    PEERS.invalidate_target(username=target)
+                await warm_target_peers()
     except Exception as e:
         logging.warning(f"Ошибка валидации конфигурации: {e}, используются текущие значения")
 
+async def warm_target_peers() -> None:
+    """Заранее резолвит все целевые каналы (target_channel и target_routes) для всех аккаунтов"""
+    for account in ACCOUNTS:
+        if account.reconnect_failures:
+            continue
+        for target in routing.all_targets(CONFIG):
+            try:
+                await PEERS.target(account, target)
+            except Exception as e:
+                logging.error(f"[{account.name}] Не удалось разрезолвить {target}: {e}")
+
 async def _process_channel_batch(
-    batch: List[Tuple[str, int, int, Optional[int]]],
+    batch: List[Tuple[str, int, int, Optional[int], Optional[str]]],
     channel_type: int,
     sleep_min: float,
-    sleep_max: float
+    sleep_max: float,
+    channel_handler: Optional[Callable[..., Awaitable[dict]]] = None
 ) -> dict:
     """Обрабатывает батч каналов"""
+    handler = channel_handler or process_channel
     total_counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
-    for channel, last_message_id, chat_id, access_hash in batch:
-        counters = await process_channel(channel, last_message_id, channel_type, chat_id, access_hash)
+    for channel, last_message_id, chat_id, access_hash, account_name in batch:
+        await CATCHUP.acquire(RPC_LANE.get()[0])
+        started = time.time()
+        counters = await handler(channel, last_message_id, channel_type, chat_id, access_hash, account_name)
+        save_scan_times(catchup.SCOPE_CHANNEL, [channel], started)
         for k in total_counters:
             total_counters[k] += counters[k]
         await asyncio.sleep(random.uniform(sleep_min, sleep_max))
     return total_counters
 
+async def _process_account_channels(
+    type_channels: List[Tuple[str, int, int, Optional[int], Optional[str]]],
+    channel_type: int,
+    sleep_min: float,
+    sleep_max: float,
+    channel_handler: Optional[Callable[..., Awaitable[dict]]] = None
+) -> dict:
+    """Обрабатывает каналы одного аккаунта"""
+    batch_size = 40 if channel_type in (CHANNEL_TYPE_FILTERED, CHANNEL_TYPE_LONGCHECK) else 0
+    
+    if batch_size > 0:
+        total_counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
+        for i in range(0, len(type_channels), batch_size):
+            batch = type_channels[i:i + batch_size]
+            start_idx = i + 1
+            end_idx = min(i + batch_size, len(type_channels))
+            logging.info(f"Обработка каналов {start_idx}-{end_idx}")
+            batch_counters = await _process_channel_batch(batch, channel_type, sleep_min, sleep_max,
+                                                          channel_handler)
+            for k in total_counters:
+                total_counters[k] += batch_counters[k]
+    else:
+        total_counters = await _process_channel_batch(type_channels, channel_type, sleep_min, sleep_max,
+                                                      channel_handler)
+    return total_counters
+
 async def fetch_unread_messages(
-    channels: List[Tuple[str, int, int, int, Optional[int]]],
-    channel_type: int
+    channels: List[Tuple[str, int, int, int, Optional[int], Optional[str]]],
+    channel_type: int,
+    channel_handler: Optional[Callable[..., Awaitable[dict]]] = None,
+    workers: int = 1
 ) -> None:
-    type_channels = [(ch[0], ch[1], ch[3], ch[4]) for ch in channels if ch[2] == channel_type]
+    type_channels = [(ch[0], ch[1], ch[3], ch[4], ch[5]) for ch in channels if ch[2] == channel_type]
     count = len(type_channels)
     
     # Логируем только если количество изменилось или отключен режим "только при изменении"
@@ -713,20 +1260,75 @@ async def fetch_unread_messages(
     
     sleep_min = CONFIG.get('sleep_between_channels_min', 0.2)
     sleep_max = CONFIG.get('sleep_between_channels_max', 0.35)
-    batch_size = 40 if channel_type in (CHANNEL_TYPE_FILTERED, CHANNEL_TYPE_LONGCHECK) else 0
     
-    if batch_size > 0:
-        total_counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
-        for i in range(0, len(type_channels), batch_size):
-            batch = type_channels[i:i + batch_size]
-            start_idx = i + 1
-            end_idx = min(i + batch_size, len(type_channels))
-            logging.info(f"Обработка каналов {start_idx}-{end_idx}")
-            batch_counters = await _process_channel_batch(batch, channel_type, sleep_min, sleep_max)
-            for k in total_counters:
-                total_counters[k] += batch_counters[k]
-    else:
-        total_counters = await _process_channel_batch(type_channels, channel_type, sleep_min, sleep_max)
+    # Каналы разных аккаунтов обрабатываются параллельно, внутри аккаунта — workers
+    # последовательными потоками (каналы раскладываются по ним по очереди)
+    by_account: Dict[str, List[Tuple[str, int, int, Optional[int], Optional[str]]]] = {}
+    for item in type_channels:
+        by_account.setdefault(ACCOUNTS.get(item[4]).name, []).append(item)
+
+    async def run_account(account_name: str, items: List[Tuple[str, int, int, Optional[int], Optional[str]]]) -> None:
+        if CONFIG.get('dialog_prefilter'):
+            items = await _channels_with_new_posts(ACCOUNTS.get(account_name), items, channel_type)
+        await asyncio.gather(*(
+            _process_account_channels(items[k::workers], channel_type, sleep_min, sleep_max, channel_handler)
+            for k in range(min(workers, len(items)))
+        ))
+
+    await asyncio.gather(*(run_account(name, items) for name, items in by_account.items()))
+
+async def _channels_with_new_posts(
+    account: TelegramAccount,
+    items: List[Tuple[str, int, int, Optional[int], Optional[str]]],
+    channel_type: int
+) -> List[Tuple[str, int, int, Optional[int], Optional[str]]]:
+    """
+    Предфильтр цикла (dialog_prefilter): оставляет каналы, у которых top_message диалога
+    больше last_message_id. Диалоги запрашиваются пачками по DIALOG_PREFILTER_CHUNK —
+    один запрос вместо get_messages для каждого канала. Каналы без access_hash, без
+    диалога или из пачки, запрос которой не удался, опрашиваются как обычно.
+    """
+    top_messages: Dict[int, int] = {}
+    checkable = [item for item in items if item[3] is not None]
+    for i in range(0, len(checkable), DIALOG_PREFILTER_CHUNK):
+        chunk = checkable[i:i + DIALOG_PREFILTER_CHUNK]
+        peers = [InputDialogPeer(PEERS.channel(account.name, chat_id, access_hash))
+                 for _, _, chat_id, access_hash, _ in chunk]
+        try:
+            await ensure_connected(account)
+            await account.throttle()
+            with diagnostics.inflight('telegram', f"{account.name} dialogs x{len(peers)}"):
+                result = await account.client(GetPeerDialogsRequest(peers=peers))
+            metrics.inc('dialog_prefilter.requests')
+        except AuthKeyDuplicatedError:
+            raise
+        except FloodWaitError as e:
+            logging.warning(f"FloodWait {e.seconds}s dialogs [{account.name}]")
+            account.penalize(e.seconds)
+            continue
+        except Exception as e:
+            logging.warning(f"[{account.name}] Предфильтр диалогов не удался, каналы опрашиваются как обычно: {e}")
+            continue
+        for dialog in result.dialogs:
+            channel_id = getattr(dialog.peer, 'channel_id', None)
+            if channel_id is not None:
+                top_messages[channel_id] = dialog.top_message
+
+    selected = []
+    quiet = []
+    for item in items:
+        top_message = top_messages.get(item[2])
+        if top_message is not None and top_message <= item[1]:
+            quiet.append(item[0])
+        else:
+            selected.append(item)
+    if quiet:
+        # Без новых постов канал всё равно считается опрошенным (план догона, catchup.py)
+        save_scan_times(catchup.SCOPE_CHANNEL, quiet, time.time())
+    lane = CHANNEL_TYPE_NAMES.get(channel_type, str(channel_type))
+    metrics.inc(f'dialog_prefilter.{lane}.polled', len(selected))
+    metrics.inc(f'dialog_prefilter.{lane}.skipped', len(quiet))
+    return selected
 
 def _normalize_intervals(d: Dict[str, Any]) -> Dict[int, int]:
     """Нормализует интервалы для типов каналов"""
@@ -775,29 +1377,36 @@ def _normalize_intervals(d: Dict[str, Any]) -> Dict[int, int]:
     
     return out
 
-async def _start_client():
+async def _start_client(account: Optional[TelegramAccount] = None):
     """Единая точка авторизации клиента"""
+    account = account or ACCOUNTS.primary
+    tg = account.client
     # Проверка phone_number
-    if not phone_number:
-        raise ValueError("phone_number not configured in CONFIG.py")
+    if not account.phone:
+        raise ValueError(f"phone_number not configured for account {account.name}")
     
     # Если сессия существует, код не нужен
-    session_file = f"{SESSION_PATH}.session"
+    session_file = f"{account.session_path}.session"
     if os.path.exists(session_file):
         # Пытаемся подключиться без кода
         try:
-            return await client.start(phone=phone_number, password=password)
+            return await tg.start(phone=account.phone, password=account.password)
         except Exception as e:
-            logging.warning(f"Failed to start with existing session: {e}, will request code")
+            logging.warning(f"[{account.name}] Failed to start with existing session: {e}, will request code")
             # Если не получилось, запрашиваем код
     
     # Если сессии нет, используем код из файла или переменной окружения
-    code_file = os.path.join(DATA_DIR, 'telegram_code.txt')
-    code_env = os.environ.get('TELEGRAM_CODE')
+    if account.name == PRIMARY_ACCOUNT:
+        code_file = os.path.join(DATA_DIR, 'telegram_code.txt')
+        code_env_name = 'TELEGRAM_CODE'
+    else:
+        code_file = os.path.join(DATA_DIR, f'telegram_code_{account.name}.txt')
+        code_env_name = f'TELEGRAM_CODE_{account.name.upper()}'
+    code_env = os.environ.get(code_env_name)
     
     def get_code():
         if code_env:
-            logging.info("Using code from TELEGRAM_CODE environment variable")
+            logging.info(f"Using code from {code_env_name} environment variable")
             return code_env
         if os.path.exists(code_file):
             logging.info(f"Reading code from {code_file}")
@@ -806,36 +1415,42 @@ async def _start_client():
             os.remove(code_file)
             return code
         raise ValueError(
-            f"Telegram code required. Set TELEGRAM_CODE env var or create {code_file}"
+            f"Telegram code required. Set {code_env_name} env var or create {code_file}"
         )
     
-    return await client.start(
-        phone=phone_number,
+    return await tg.start(
+        phone=account.phone,
         code_callback=get_code,
-        password=password
+        password=account.password
     )
 
-async def ensure_connected():
+async def ensure_connected(account: Optional[TelegramAccount] = None):
     """Проверяет соединение и переподключается при необходимости"""
-    if not client.is_connected():
-        logging.warning("Client disconnected, reconnecting...")
+    account = account or ACCOUNTS.primary
+    tg = account.client
+    if not tg.is_connected():
+        if not account.can_reconnect():
+            raise ConnectionError(f"[{account.name}] reconnect postponed after previous failures")
+        logging.warning(f"[{account.name}] Client disconnected, reconnecting...")
         try:
-            await client.connect()
-            if not await client.is_user_authorized():
-                logging.warning("Session expired, re-authenticating...")
-                await _start_client()
+            await tg.connect()
+            if not await tg.is_user_authorized():
+                logging.warning(f"[{account.name}] Session expired, re-authenticating...")
+                await _start_client(account)
             else:
-                logging.info("Reconnected successfully")
+                logging.info(f"[{account.name}] Reconnected successfully")
+            account.reconnect_succeeded()
         except AuthKeyDuplicatedError as e:
+            account.reconnect_failed()
             logging.error(
-                f"❌ Reconnection failed: AuthKeyDuplicatedError!\n"
+                f"❌ Reconnection failed: AuthKeyDuplicatedError! [{account.name}]\n"
                 f"Сессия используется с двух IP одновременно.\n"
                 f"Останови бота на сервере или используй другой аккаунт для локального тестирования."
             )
             raise
         except Exception as e:
-            logging.error(f"Reconnection failed: {e}")
-            await asyncio.sleep(5)
+            account.reconnect_failed()
+            logging.error(f"[{account.name}] Reconnection failed: {e}")
             raise
     return True
 
@@ -846,11 +1461,10 @@ async def main():
     
     logging.info(f"Data directory: {DATA_DIR}")
     logging.info(f"Session path: {SESSION_PATH}")
-    logging.info(f"Database file: {DB_FILE}")
+    logging.info(f"Database file: {DB_FILE}, posts archive: {ARCHIVE_DB_FILE}")
     
     # Проверка соответствия режима и сессии
-    env_mode = os.getenv('ENV_MODE', 'production').lower()
-    if env_mode == 'test':
+    if ENV_MODE == 'test':
         if 'test' not in SESSION_NAME:
             logging.warning(
                 f"⚠ WARNING: ENV_MODE=test, but session name is '{SESSION_NAME}' (should contain 'test').\n"
@@ -864,13 +1478,27 @@ async def main():
             )
     
     setup_database()
+    if not await authorize_accounts():
+        return
+
+    try:
+        await resume_forward_outbox()
+    except Exception as e:
+        logging.error(f"Outbox resume error: {e}\n{traceback.format_exc()}")
+
+    await run_scheduler()
+
+async def authorize_accounts() -> bool:
+    """
+    Авторизует все аккаунты. Возвращает False, если основной аккаунт
+    авторизовать не удалось и продолжать работу нельзя.
+    """
     try:
         logging.info("Авторизация…")
-        target_peer = await client.get_input_entity(CONFIG['target_channel'])
-        logging.info(f"Target channel resolved: {CONFIG['target_channel']}")
         await _start_client()
         user = await client.get_me()
         logging.info(f"OK, user: {user.username}")
+        await PEERS.target(ACCOUNTS.primary, CONFIG['target_channel'])
     except PhoneMigrateError as e:
         logging.warning(f"PhoneMigrate → DC {e.new_dc}")
         await client.disconnect()
@@ -889,7 +1517,7 @@ async def main():
             f"❌ КРИТИЧЕСКАЯ ОШИБКА: AuthKeyDuplicatedError!\n"
             f"Сессия используется одновременно с двух разных IP адресов.\n"
             f"Текущая сессия: {SESSION_PATH}\n"
-            f"ENV_MODE: {os.getenv('ENV_MODE', 'production')}\n"
+            f"ENV_MODE: {ENV_MODE}\n"
             f"Номер телефона: {phone_number}\n\n"
             f"РЕШЕНИЕ:\n"
             f"1. Если тестируешь локально - убедись, что на сервере бот ОСТАНОВЛЕН\n"
@@ -897,19 +1525,123 @@ async def main():
             f"3. Для локального теста используй тестовый аккаунт (ENV_MODE=test)\n"
             f"4. Удали старую сессию и создай новую: Remove-Item {SESSION_PATH}.session"
         )
-        return
+        return False
     except Exception as e:
         logging.error(f"Auth error: {e}\n{traceback.format_exc()}")
-        return
+        return False
+
+    # Дополнительные аккаунты: ошибка авторизации не останавливает бота,
+    # каналы такого аккаунта пропускаются до успешного переподключения
+    for account in list(ACCOUNTS)[1:]:
+        try:
+            await _start_client(account)
+            me = await account.client.get_me()
+            logging.info(f"[{account.name}] OK, user: {me.username}")
+            await PEERS.target(account, CONFIG['target_channel'])
+        except Exception as e:
+            account.reconnect_failed()
+            logging.error(f"[{account.name}] Auth error: {e}")
+    if len(ACCOUNTS) > 1:
+        logging.info(f"Аккаунтов: {len(ACCOUNTS)} ({', '.join(ACCOUNTS.names)})")
+    # Целевые каналы из target_routes — заранее, чтобы первая пересылка не резолвила username
+    await warm_target_peers()
+    return True
+
+async def _recover_from_loop_error(where: str, e: Exception) -> None:
+    """Общая обработка ошибок циклов планировщика: пауза и, если нужно, переподключение"""
+    if isinstance(e, AuthKeyDuplicatedError):
+        logging.error(
+            f"❌ {where}: AuthKeyDuplicatedError - сессия используется с двух IP!\n"
+            f"Останови бота на сервере или используй другой аккаунт.\n"
+            f"Сессия: {SESSION_PATH}, ENV_MODE: {ENV_MODE}"
+        )
+        await asyncio.sleep(60)  # Долгая пауза перед следующей попыткой
+    elif isinstance(e, ConnectionError):
+        logging.error(f"{where}: Connection lost: {e}, reconnecting...")
+        try:
+            await ensure_connected()
+            await asyncio.sleep(5)  # Небольшая пауза после переподключения
+        except Exception as reconnect_error:
+            logging.error(f"{where}: Reconnection failed: {reconnect_error}")
+            await asyncio.sleep(30)  # Долгая пауза при неудаче
+    else:
+        logging.error(f"{where} error: {e}\n{traceback.format_exc()}")
+        await asyncio.sleep(10)  # Пауза при любой другой ошибке
+
+async def _run_lane(
+    channel_type: int,
+    channel_handler: Optional[Callable[..., Awaitable[dict]]] = None,
+    first_due: Optional[float] = None
+) -> None:
+    """
+    Цикл опроса каналов одного типа со своим интервалом, приоритетом и числом обработчиков.
+    Интервал и полоса перечитываются из CONFIG каждый цикл.
+
+    first_due — время первого цикла по плану догона (catchup.first_due); первый цикл
+    опрашивает каналы от давно не опрошенных к недавним.
+    """
+    next_due = first_due or time.time()
+    first_cycle = True
+    while True:
+        lane = lanes.get_lane(channel_type, CONFIG)
+        now = time.time()
+        if now < next_due:
+            await asyncio.sleep(next_due - now)
+            continue
+        # Все RPC этой задачи и её подзадач идут с приоритетом полосы
+        RPC_LANE.set((lane.priority, lane.name))
+        metrics.observe(f"lane.{lane.name}.start_lag", now - next_due)
+        try:
+            channels = get_tracked_channels()
+            if first_cycle:
+                channels = catchup.order_by_staleness(channels, load_scheduler_state(catchup.SCOPE_CHANNEL))
+            await fetch_unread_messages(channels, channel_type, channel_handler, lane.workers)
+            save_scan_times(catchup.SCOPE_LANE, [str(channel_type)], now)
+        except Exception as e:
+            await _recover_from_loop_error(f"Lane {lane.name}", e)
+        if first_cycle:
+            CATCHUP.finish(channel_type)
+            first_cycle = False
+        metrics.observe(f"lane.{lane.name}.cycle", time.time() - now)
+        next_due = now + _normalize_intervals(CONFIG['channel_type_intervals'])[channel_type]
 
+def _plan_catchup(intervals: Dict[int, int]) -> Dict[int, float]:
+    """
+    План догона после запуска по scheduler_state: время первого цикла каждой полосы.
+    Просроченные полосы ограничиваются общим темпом CATCHUP до конца своего первого цикла.
+    """
+    now = time.time()
+    last_scans = load_scheduler_state(catchup.SCOPE_LANE)
+    plan: Dict[int, float] = {}
+    overdue = []
+    for t, interval in intervals.items():
+        last_scan = last_scans.get(str(t))
+        plan[t] = catchup.first_due(last_scan, interval, lanes.get_lane(t, CONFIG).priority, now)
+        if last_scan is None or last_scan + interval <= now:
+            overdue.append(t)
+    CATCHUP.start(overdue)
+    logging.info("План догона: " + ", ".join(
+        f"{lanes.get_lane(t, CONFIG).name} через {plan[t] - now:.0f}s" + (" (просрочен)" if t in overdue else "")
+        for t in sorted(plan, key=plan.get)
+    ))
+    return plan
+
+async def run_scheduler(channel_handler: Optional[Callable[..., Awaitable[dict]]] = None) -> None:
+    """
+    Основной цикл: обновление настроек и списка каналов; каналы опрашиваются полосами
+    (_run_lane) — по задаче на тип, независимо друг от друга.
+    channel_handler заменяет process_channel (например, в многопроцессном режиме).
+    """
     logging.info("Бот запущен!")
     intervals = _normalize_intervals(CONFIG['channel_type_intervals'])
-    last_check = {t: 0 for t in (0, 1, 2, 3, 4, 5, 6)}
     last_config_check = 0
     last_table_check = 0
     last_connection_check = 0
+    last_metrics_log = time.time()
     base_sleep = min(intervals.values())
     CONNECTION_CHECK_INTERVAL = 300  # Проверка соединения каждые 5 минут
+    lane_tasks: Dict[int, asyncio.Task] = {}
+    lane_first_due = _plan_catchup(intervals)
 
     while True:
         try:
@@ -917,46 +1649,47 @@ async def main():
             
             # Периодическая проверка соединения
             if now - last_connection_check >= CONNECTION_CHECK_INTERVAL:
-                try:
-                    await ensure_connected()
-                except Exception as e:
-                    logging.error(f"Connection check failed: {e}")
+                for account in ACCOUNTS:
+                    try:
+                        await ensure_connected(account)
+                    except Exception as e:
+                        logging.error(f"[{account.name}] Connection check failed: {e}")
                 last_connection_check = now
             
-            csv_rows = load_csv()
-            if now - last_config_check >= CONFIG_CHECK_INTERVAL:
+            if now - last_metrics_log >= METRICS_LOG_INTERVAL:
+                metrics.log_snapshot()
+                last_metrics_log = now
+            storage.checkpoint_due(DB_FILE, ARCHIVE_DB_FILE)
+            
+            config_due = now - last_config_check >= CONFIG_CHECK_INTERVAL
+            table_due = now - last_table_check >= CONFIG['table_scan_interval']
+            csv_rows = await load_csv() if config_due or table_due else []
+            if config_due:
                 await update_configs(csv_rows)
                 last_config_check = now
                 intervals = _normalize_intervals(CONFIG['channel_type_intervals'])
                 base_sleep = min(intervals.values())
-            if now - last_table_check >= CONFIG['table_scan_interval']:
+            if table_due:
                 await fetch_channels(csv_rows)
                 last_table_check = now
-            channels = get_tracked_channels()
-            for t, interval in intervals.items():
-                if now - last_check[t] >= interval:
-                    await fetch_unread_messages(channels, t)
-                    last_check[t] = now
-        except AuthKeyDuplicatedError as e:
-            logging.error(
-                f"❌ Main loop: AuthKeyDuplicatedError - сессия используется с двух IP!\n"
-                f"Останови бота на сервере или используй другой аккаунт.\n"
-                f"Сессия: {SESSION_PATH}, ENV_MODE: {os.getenv('ENV_MODE', 'production')}"
-            )
-            await asyncio.sleep(60)  # Долгая пауза перед следующей попыткой
-        except ConnectionError as e:
-            logging.error(f"Main loop: Connection lost: {e}, reconnecting...")
-            try:
-                await ensure_connected()
-                await asyncio.sleep(5)  # Небольшая пауза после переподключения
-            except Exception as reconnect_error:
-                logging.error(f"Main loop: Reconnection failed: {reconnect_error}")
-                await asyncio.sleep(30)  # Долгая пауза при неудаче
+            # Полосы стартуют после первого обновления настроек и списка каналов;
+            # упавшая полоса перезапускается
+            for t in intervals:
+                task = lane_tasks.get(t)
+                if task is None or task.done():
+                    if task is not None and not task.cancelled() and task.exception():
+                        logging.error(f"Полоса типа {t} остановилась: {task.exception()!r}, перезапуск")
+                    lane_tasks[t] = asyncio.create_task(_run_lane(t, channel_handler, lane_first_due.pop(t, None)))
+            if channel_handler is None:
+                await retry_deferred_llm_checks()
         except Exception as e:
-            logging.error(f"Main loop error: {e}\n{traceback.format_exc()}")
-            await asyncio.sleep(10)  # Пауза при любой другой ошибке
+            await _recover_from_loop_error("Main loop", e)
         await asyncio.sleep(base_sleep)
 
 if __name__ == "__main__":
-    with client:
-        client.loop.run_until_complete(main())
\ No newline at end of file
+    diagnostics.install(client.loop)
+    try:
+        client.loop.run_until_complete(main())
+    finally:
+        client.loop.run_until_complete(ACCOUNTS.disconnect_all())
+        client.loop.run_until_complete(close_client())
\ No newline at end of file
@@ -0,0 +1,252 @@
+"""Пул Telegram-аккаунтов и шардирование каналов между ними"""
+import asyncio
+import contextvars
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+
+PRIMARY_ACCOUNT = 'main'
+
+# Пауза между переподключениями растёт экспоненциально до этого предела
+RECONNECT_BACKOFF_MAX = 300
+
+# (приоритет, имя полосы) текущей задачи: меньший приоритет раньше получает бюджет аккаунта.
+# Задаётся полосой планировщика (src.lanes) и наследуется её подзадачами.
+DEFAULT_RPC_PRIORITY = 5
+RPC_LANE: contextvars.ContextVar[Tuple[int, str]] = contextvars.ContextVar(
+    'rpc_lane', default=(DEFAULT_RPC_PRIORITY, 'default')
+)
+
+
+class PriorityLock:
+    """asyncio-замок, который при освобождении передаётся ожидающему с наименьшим приоритетом (FIFO внутри)"""
+
+    def __init__(self):
+        self._locked = False
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: int) -> None:
+        if not self._locked and not self._waiters:
+            self._locked = True
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Замок уже передан этой задаче — отдаём его следующему
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)  # замок переходит к ожидающему, _locked остаётся True
+                return
+        self._locked = False
+
+
+class TelegramAccount:
+    """
+    Один Telegram-аккаунт: клиент, собственный бюджет запросов и состояние переподключения.
+
+    Бюджет задаётся минимальным интервалом между RPC (rpc_interval). FloodWait
+    приостанавливает только этот аккаунт, остальные продолжают работу.
+    """
+
+    def __init__(self, name: str, client: Any, phone: str, password: Any,
+                 session_path: str, rpc_interval: float = 0.0):
+        self.name = name
+        self.client = client
+        self.phone = phone
+        self.password = password
+        self.session_path = session_path
+        self.rpc_interval = rpc_interval
+        self.flood_until = 0.0
+        self.reconnect_failures = 0
+        self.next_reconnect_at = 0.0
+        self._last_call = 0.0
+        self._lock = PriorityLock()
+
+    async def throttle(self) -> None:
+        """
+        Ждёт, пока аккаунт может сделать следующий запрос.
+
+        Из нескольких ожидающих первым проходит запрос полосы с меньшим приоритетом
+        (RPC_LANE), время ожидания пишется в метрику rpc_wait.<полоса>.
+        """
+        priority, lane = RPC_LANE.get()
+        started = time.monotonic()
+        await self._lock.acquire(priority)
+        try:
+            now = time.monotonic()
+            wait = max(self.flood_until - now, self._last_call + self.rpc_interval - now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_call = time.monotonic()
+        finally:
+            self._lock.release()
+        metrics.observe(f"rpc_wait.{lane}", self._last_call - started)
+
+    def penalize(self, seconds: float) -> None:
+        """Приостанавливает аккаунт после FloodWait"""
+        self.flood_until = max(self.flood_until, time.monotonic() + seconds)
+
+    def reconnect_failed(self) -> None:
+        """Увеличивает паузу до следующей попытки переподключения"""
+        self.reconnect_failures += 1
+        delay = min(RECONNECT_BACKOFF_MAX, 5 * 2 ** (self.reconnect_failures - 1))
+        self.next_reconnect_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+
+    def reconnect_succeeded(self) -> None:
+        self.reconnect_failures = 0
+        self.next_reconnect_at = 0.0
+
+    def can_reconnect(self) -> bool:
+        return time.monotonic() >= self.next_reconnect_at
+
+    def state(self) -> Dict[str, Any]:
+        """Состояние для диагностики: соединение, FloodWait, очередь к бюджету запросов"""
+        now = time.monotonic()
+        return {
+            'connected': self.client.is_connected(),
+            'flood_wait_left': round(max(0.0, self.flood_until - now), 1),
+            'rpc_waiters': self._lock.waiting,
+            'since_last_rpc': round(now - self._last_call, 1) if self._last_call else None,
+            'reconnect_failures': self.reconnect_failures,
+        }
+
+    def __repr__(self) -> str:
+        return f"TelegramAccount({self.name!r})"
+
+
+def rendezvous_account(channel: str, names: List[str]) -> str:
+    """
+    Стабильно выбирает аккаунт для канала (rendezvous hashing).
+
+    При добавлении или удалении аккаунта переезжают только каналы, которые
+    принадлежали изменившемуся аккаунту (~1/N каналов).
+    """
+    def weight(name: str) -> int:
+        digest = hashlib.sha1(f"{name}:{channel.lower()}".encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big')
+    return max(names, key=weight)
+
+
+class AccountPool:
+    """
+    Набор аккаунтов. Первый аккаунт — основной (PRIMARY_ACCOUNT).
+
+    client_factory(spec) создаёт клиент для аккаунта; в тестах можно передать
+    фабрику, возвращающую фейковый клиент.
+    """
+
+    def __init__(self, specs: List[Dict[str, Any]], client_factory: Callable[[Dict[str, Any]], Any]):
+        if not specs:
+            raise ValueError("At least one Telegram account must be configured")
+        self.accounts: Dict[str, TelegramAccount] = {}
+        for spec in specs:
+            name = spec['name']
+            if name in self.accounts:
+                raise ValueError(f"Duplicate Telegram account name: {name}")
+            self.accounts[name] = TelegramAccount(
+                name=name,
+                client=client_factory(spec),
+                phone=spec.get('phone'),
+                password=spec.get('password'),
+                session_path=spec['session'],
+                rpc_interval=float(spec.get('rpc_interval', 0.0)),
+            )
+
+    @property
+    def primary(self) -> TelegramAccount:
+        return next(iter(self.accounts.values()))
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.accounts)
+
+    def get(self, name: Optional[str]) -> TelegramAccount:
+        """Аккаунт по имени; None или неизвестное имя — основной аккаунт"""
+        if name is None:
+            return self.primary
+        return self.accounts.get(name, self.primary)
+
+    def assign(self, channel: str) -> str:
+        """Имя аккаунта, которому должен принадлежать канал"""
+        if len(self.accounts) == 1:
+            return self.primary.name
+        return rendezvous_account(channel, self.names)
+
+    def __iter__(self):
+        return iter(self.accounts.values())
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    async def disconnect_all(self) -> None:
+        for account in self:
+            try:
+                await account.client.disconnect()
+            except Exception as e:
+                logging.warning(f"[{account.name}] disconnect error: {e}")
+
+
+def build_account_specs(
+    primary: Dict[str, Any],
+    extra: List[Dict[str, Any]],
+    data_dir: str
+) -> List[Dict[str, Any]]:
+    """
+    Собирает список аккаунтов: основной из TELEGRAM_* и дополнительные из TELEGRAM_ACCOUNTS_JSON.
+
+    Для дополнительных аккаунтов без api_id/api_hash используются значения основного.
+    Сессии с относительным путём кладутся в data_dir.
+    """
+    specs = [dict(primary, name=PRIMARY_ACCOUNT)]
+    for i, raw in enumerate(extra, start=2):
+        spec = dict(raw)
+        spec.setdefault('name', f"acc{i}")
+        spec.setdefault('api_id', primary['api_id'])
+        spec.setdefault('api_hash', primary['api_hash'])
+        if not spec.get('phone'):
+            raise ValueError(f"Telegram account {spec['name']} has no phone")
+        session = spec.get('session') or f"userbot2_{spec['name']}_session"
+        if not os.path.isabs(session) and data_dir != '.':
+            session = os.path.join(data_dir, session)
+        spec['session'] = session
+        spec.setdefault('rpc_interval', primary.get('rpc_interval', 0.0))
+        specs.append(spec)
+    return specs
+
+
+def memory_session_copy(session_path: str):
+    """
+    Копия авторизации из файла .session в памяти.
+
+    Нужна, когда той же сессией пользуется второй процесс: SQLite-файл сессии
+    не рассчитан на одновременную запись из нескольких процессов.
+    """
+    from telethon.sessions import SQLiteSession, StringSession
+    if not os.path.exists(f"{session_path}.session"):
+        # Не создаём пустой файл сессии: его создаст процесс, который авторизуется
+        return StringSession()
+    file_session = SQLiteSession(session_path)
+    try:
+        return StringSession(StringSession.save(file_session))
+    finally:
+        file_session.close()
@@ -0,0 +1,114 @@
+"""
+Извлечение сумм и монет из постов stats-каналов за один проход по тексту.
+
+Одна скомпилированная регулярка находит и суммы в долларах ($1.2M, $250,000,
+1.5M USD), и монеты — тикеры и полные названия (Bitcoin → BTC); затем каждая сумма
+связывается с ближайшей монетой в той же строке (или с единственной монетой поста).
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Монеты, которые распознаются всегда; остальные — из ключей coin_thresholds
+DEFAULT_COINS = ('BTC', 'ETH')
+BTC_ETH = frozenset(DEFAULT_COINS)
+# Полные названия монет; название распознаётся, если распознаётся его тикер
+COIN_ALIASES = {
+    'BITCOIN': 'BTC',
+    'ETHEREUM': 'ETH',
+    'ETHER': 'ETH',
+    'SOLANA': 'SOL',
+    'TONCOIN': 'TON',
+    'TETHER': 'USDT',
+    'RIPPLE': 'XRP',
+    'DOGECOIN': 'DOGE',
+    'CARDANO': 'ADA',
+    'LITECOIN': 'LTC',
+}
+
+_MULTIPLIERS = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+_NUM = r'(\d{1,3}(?:[,\u00a0 ]\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)'
+
+AmountPair = Tuple[Optional[str], float]  # (монета или None, сумма в USD)
+
+
+_scanners: Dict[Tuple[str, ...], 're.Pattern[str]'] = {}
+
+
+def _scanner(coins: Iterable[str]) -> 're.Pattern[str]':
+    """Регулярка для набора монет (кэшируется: набор меняется только с настройками)"""
+    key = tuple(coins)
+    scanner = _scanners.get(key)
+    if scanner is None:
+        known = {c.upper() for c in key} | BTC_ETH
+        names = known | {alias for alias, coin in COIN_ALIASES.items() if coin in known}
+        tickers = '|'.join(re.escape(c) for c in sorted(names, key=len, reverse=True))
+        scanner = _scanners[key] = re.compile(
+            rf'\$\s?{_NUM}\s?([KkMmBb])?(?![A-Za-z])'                    # $1.2M
+            rf'|(?<![\w.,$]){_NUM}\s?([KkMmBb])?\s?(?:USD\b|\$)'          # 1.2M USD
+            rf'|(?<![A-Za-z0-9])#?({tickers})(?![A-Za-z0-9])'             # BTC, #eth
+            r'|(\n)',
+            re.IGNORECASE
+        )
+    return scanner
+
+
+def _to_number(raw: str, suffix: str) -> float:
+    value = float(raw.replace(',', '').replace(' ', '').replace('\u00a0', ''))
+    return value * _MULTIPLIERS[suffix.upper()] if suffix else value
+
+
+def extract_amounts(text: str, coins: Iterable[str] = ()) -> List[AmountPair]:
+    """
+    Все пары (монета, сумма) из текста в порядке появления.
+
+    Сумма связывается с ближайшей (по числу токенов) монетой в той же строке, при
+    равном расстоянии — с монетой перед суммой, если строка начинается с монеты, иначе
+    с монетой после неё; если в строке монет нет, а во всём посте ровно одна — с ней;
+    иначе монета None.
+    """
+    # Один проход регуляркой; дальше работа только со списком найденных токенов
+    tokens = _scanner(coins).findall(text)
+    amounts: List[Tuple[int, int, float]] = []   # (строка, номер токена, сумма)
+    mentions: List[Tuple[int, int, str]] = []    # (строка, номер токена, монета)
+    line = 0
+    for i, (num1, suf1, num2, suf2, coin, newline) in enumerate(tokens):
+        if newline:
+            line += 1
+        elif coin:
+            coin = coin.upper()
+            mentions.append((line, i, COIN_ALIASES.get(coin, coin)))
+        elif num1:
+            amounts.append((line, i, _to_number(num1, suf1)))
+        else:
+            amounts.append((line, i, _to_number(num2, suf2)))
+    if not amounts:
+        return []
+    if not mentions:
+        return [(None, value) for _, _, value in amounts]
+    post_coins = {coin for _, _, coin in mentions}
+    only_coin = next(iter(post_coins)) if len(post_coins) == 1 else None
+    pairs: List[AmountPair] = []
+    for a_line, a_idx, value in amounts:
+        same_line = [(abs(idx - a_idx), idx, coin) for line_no, idx, coin in mentions if line_no == a_line]
+        if not same_line:
+            pairs.append((only_coin, value))
+            continue
+        nearest = min(same_line)
+        if len(same_line) > 1 and sorted(same_line)[1][0] == nearest[0]:
+            # Равное расстояние: «SOL $300K, ETH $2.5M» — монета перед суммой, «$2.5M of ETH» — после;
+            # сторону задаёт то, с чего начинается строка
+            first_amount = next(idx for line_no, idx, _ in amounts if line_no == a_line)
+            coin_first = same_line[0][1] < first_amount
+            nearest = min(same_line, key=lambda m: (m[0], (m[1] > a_idx) == coin_first))
+        pairs.append((nearest[2], value))
+    return pairs
+
+
+def threshold_for(coin: Optional[str], config: Dict) -> int:
+    """Порог для монеты: coin_thresholds, затем btc_eth_threshold / other_coin_threshold"""
+    per_coin = config.get('coin_thresholds') or {}
+    if coin is not None and coin in per_coin:
+        return per_coin[coin]
+    if coin in BTC_ETH:
+        return config['btc_eth_threshold']
+    return config['other_coin_threshold']
@@ -0,0 +1,223 @@
+"""
+Догрузка истории отслеживаемых каналов в posts без пересылки.
+
+При добавлении канала бот запоминает только последний message_id, поэтому истории
+в posts нет. Эта команда проходит историю от last_message_id канала назад до
+заданной даты, прогоняет сообщения через обычные процессоры (blacklist, реклама,
+суммы), но ничего не пересылает. Части альбомов собираются в один пост, как при
+обычном опросе (pipeline.group_albums). Рекламу определяет локальный классификатор,
+без модели — маркировка рекламы (как llm_fallback_policy=heuristic): история не тратит
+запросы к DeepSeek; --llm включает обычную проверку через LLM. Каналы обрабатываются
+параллельно, запросы идут через бюджет аккаунта (TelegramAccount.throttle). Посты
+пишутся крупными транзакциями вместе с чекпоинтом в backfill_progress, поэтому
+прерванный запуск продолжается с того же места.
+
+    python -m src.backfill --days 30
+    python -m src.backfill --days 7 --channels @chan1 @chan2 --concurrency 2
+    python -m src.backfill --days 30 --reset   # начать заново
+    python -m src.backfill --days 7 --llm      # реклама через DeepSeek
+"""
+import argparse
+import asyncio
+import logging
+import os
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+PAGE_SIZE = 100
+COMMIT_POSTS = 1000
+
+
+async def _no_forward(message_id, peer, ch_link, channel_type, counters,
+                      log_prefix: str = "", use_short_delay: bool = True) -> bool:
+    """Вместо пересылки: история только сохраняется"""
+    return False
+
+
+async def _local_is_advertisement(text) -> bool:
+    """Вердикт рекламы без LLM: локальный классификатор или маркировка рекламы"""
+    from . import RUN4
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', errors='ignore')
+    return RUN4._heuristic_is_advertisement(text)
+
+
+def _load_progress(channel: str, since: str) -> Tuple[Optional[int], bool]:
+    """(oldest_message_id, done) для канала; более ранняя since продолжает завершённый канал"""
+    from . import RUN4
+    with RUN4.get_db_connection(archive=True) as conn:
+        row = conn.execute(
+            "SELECT since, oldest_message_id, done FROM backfill_progress WHERE channel = ?", (channel,)
+        ).fetchone()
+        if row is None:
+            conn.execute("INSERT INTO backfill_progress (channel, since) VALUES (?, ?)", (channel, since))
+            return None, False
+        stored_since, oldest, done = row
+        if since < stored_since:
+            conn.execute("""
+                UPDATE backfill_progress SET since = ?, done = 0, updated_at = CURRENT_TIMESTAMP
+                WHERE channel = ?
+            """, (since, channel))
+            return oldest, False
+        return oldest, bool(done)
+
+
+def _commit(channel: str, posts: List[Dict], oldest_message_id: Optional[int], done: bool) -> None:
+    """Посты и чекпоинт в одной транзакции"""
+    from . import RUN4
+    with RUN4.get_db_connection(archive=True) as conn:
+        RUN4.save_posts_batch(posts, conn)
+        conn.execute("""
+            UPDATE backfill_progress
+            SET oldest_message_id = ?, posts = posts + ?, done = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE channel = ?
+        """, (oldest_message_id, len(posts), int(done), channel))
+
+
+async def backfill_channel(
+    row: Tuple[str, int, int, int, Optional[int], Optional[str]],
+    since: datetime,
+    semaphore: asyncio.Semaphore,
+    use_llm: bool = False
+) -> int:
+    """Догружает историю одного канала; возвращает число сохранённых постов"""
+    from telethon.errors import FloodWaitError
+    from . import RUN4
+    from .channel_processors import MESSAGE_PROCESSORS
+    from .exceptions import LLMUnavailableError
+    from .pipeline import group_albums
+
+    channel, last_message_id, channel_type, chat_id, access_hash, account_name = row
+    processor = MESSAGE_PROCESSORS.get(channel_type)
+    if processor is None or not chat_id:
+        logging.warning(f"{channel}: нет процессора или chat_id, пропуск")
+        return 0
+    oldest, done = _load_progress(channel, since.isoformat())
+    if done:
+        logging.info(f"{channel}: история уже догружена")
+        return 0
+    is_advertisement = RUN4.is_advertisement if use_llm else _local_is_advertisement
+
+    async with semaphore:
+        account = RUN4.ACCOUNTS.get(account_name)
+        peer = RUN4.PEERS.channel(account.name, chat_id, access_hash)
+        ch_link = channel.lstrip('@')
+        counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
+        # Новее last_message_id сообщения обрабатывает сам бот
+        offset_id = oldest or (last_message_id + 1 if last_message_id else 0)
+        pending: List[Dict] = []
+        saved = 0
+        finished = False
+
+        async def pages():
+            # Страницы от новых к старым; чекпоинт (offset_id) двигает только обработка
+            page_offset = offset_id
+            while True:
+                await account.throttle()
+                try:
+                    page = await account.client.get_messages(peer, limit=PAGE_SIZE, offset_id=page_offset)
+                except FloodWaitError as e:
+                    logging.warning(f"{channel}: FloodWait {e.seconds}s [{account.name}]")
+                    account.penalize(e.seconds)
+                    continue
+                if not page:
+                    return
+                yield page
+                page_offset = page[-1].id
+
+        logging.info(f"{channel}: догрузка истории с {since:%Y-%m-%d} [{account.name}], offset_id={offset_id}"
+                     + ("" if use_llm else ", реклама без LLM"))
+        albums = group_albums(pages())
+        try:
+            async for items in albums:
+                for message in items:
+                    if message.date and message.date < since:
+                        finished = True
+                        break
+                    if not message.action:
+                        await processor(
+                            message, peer, ch_link, channel_type, counters,
+                            _no_forward, RUN4.is_blacklisted, is_advertisement,
+                            RUN4.is_advertisement_post, RUN4.add_advertisement_post,
+                            config=RUN4.CONFIG, channel=channel, posts_batch=pending,
+                            local_classify_func=RUN4.classify_locally
+                        )
+                    # Альбом целиком: следующая страница начинается до самой ранней его части
+                    offset_id = min(getattr(message, 'ids', None) or [message.id])
+                    counters['fetched'] += 1
+                if finished:
+                    break
+                if len(pending) >= COMMIT_POSTS:
+                    _commit(channel, pending, offset_id, False)
+                    saved += len(pending)
+                    pending = []
+            finished = True
+            _commit(channel, pending, offset_id, True)
+            saved += len(pending)
+        except LLMUnavailableError:
+            logging.warning(f"{channel}: LLM недоступен, догрузка остановлена на {offset_id}")
+            _commit(channel, pending, offset_id, False)
+            saved += len(pending)
+        finally:
+            await albums.aclose()
+        logging.info(f"{channel}: сохранено {saved} постов, просмотрено {counters['fetched']}"
+                     + (" — готово" if finished else ""))
+        return saved
+
+
+async def run(channels: Optional[List[str]], days: int, concurrency: int, reset: bool, use_llm: bool = False) -> int:
+    from . import RUN4
+
+    RUN4.setup_database()
+    if not await RUN4.authorize_accounts():
+        return 1
+    rows = RUN4.get_tracked_channels()
+    if channels:
+        wanted = {c if c.startswith('@') else f"@{c}" for c in channels}
+        missing = wanted - {r[0] for r in rows}
+        if missing:
+            logging.warning(f"Не отслеживаются, пропуск: {sorted(missing)}")
+        rows = [r for r in rows if r[0] in wanted]
+    if reset and rows:
+        with RUN4.get_db_connection(archive=True) as conn:
+            conn.executemany("DELETE FROM backfill_progress WHERE channel = ?", [(r[0],) for r in rows])
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*(backfill_channel(r, since, semaphore, use_llm) for r in rows), return_exceptions=True)
+    failed = 0
+    for row, result in zip(rows, results):
+        if isinstance(result, BaseException):
+            failed += 1
+            logging.error(f"{row[0]}: ошибка догрузки: {result!r}\n"
+                          + "".join(traceback.format_exception(type(result), result, result.__traceback__)))
+    total = sum(r for r in results if isinstance(r, int))
+    logging.info(f"Догрузка завершена: {len(rows)} каналов, {total} постов, ошибок {failed}")
+    return 1 if failed else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Догрузка истории каналов в posts без пересылки")
+    parser.add_argument('--days', type=int, default=7, help="глубина истории в днях")
+    parser.add_argument('--channels', nargs='*', help="каналы (по умолчанию все отслеживаемые)")
+    parser.add_argument('--concurrency', type=int, default=3, help="сколько каналов обрабатывать параллельно")
+    parser.add_argument('--reset', action='store_true', help="сбросить чекпоинты выбранных каналов")
+    parser.add_argument('--llm', action='store_true',
+                        help="проверять рекламу через DeepSeek (по умолчанию локально, без запросов к LLM)")
+    args = parser.parse_args()
+
+    # Бот может работать параллельно: не трогаем его файл сессии
+    os.environ.setdefault('TELEGRAM_SESSION_MODE', 'memory')
+    from . import RUN4
+
+    try:
+        code = RUN4.client.loop.run_until_complete(
+            run(args.channels, args.days, max(1, args.concurrency), args.reset, args.llm)
+        )
+    finally:
+        RUN4.client.loop.run_until_complete(RUN4.ACCOUNTS.disconnect_all())
+    raise SystemExit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Догон после рестарта: когда и в каком порядке опрашивать каналы после запуска.
+
+Время последнего опроса каждого типа каналов (полосы) и каждого канала хранится в
+таблице scheduler_state. При запуске:
+
+- полоса, срок которой ещё не наступил, продолжает своё расписание (last_scan + интервал);
+- просроченные полосы стартуют не одновременно, а с разбросом до CATCHUP_JITTER секунд,
+  срочные (меньший приоритет src.lanes) — раньше;
+- первый цикл полосы опрашивает каналы от давно не опрошенных к недавним (новые — первыми);
+- пока просроченные полосы не прошли первый цикл (но не дольше CATCHUP_MAX_SECONDS),
+  все полосы вместе опрашивают не больше CATCHUP_RATE каналов в секунду, срочные — первыми.
+
+Переменные окружения:
+    CATCHUP_RATE          каналов в секунду на время догона (по умолчанию 2; 0 — без ограничения)
+    CATCHUP_JITTER        разброс старта просроченных полос, секунды (по умолчанию 30)
+    CATCHUP_MAX_SECONDS   предельная длительность догона, секунды (по умолчанию 900)
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from . import metrics
+from .accounts import PriorityLock
+from .lanes import LOWEST_PRIORITY
+
+CATCHUP_RATE = max(0.0, float(os.getenv('CATCHUP_RATE', '2')))
+CATCHUP_JITTER = max(0.0, float(os.getenv('CATCHUP_JITTER', '30')))
+CATCHUP_MAX_SECONDS = max(0.0, float(os.getenv('CATCHUP_MAX_SECONDS', '900')))
+
+# Области scheduler_state: полоса (имя — номер типа каналов) и канал (@username)
+SCOPE_LANE = 'lane'
+SCOPE_CHANNEL = 'channel'
+
+
+def first_due(
+    last_scan: Optional[float],
+    interval: float,
+    priority: int,
+    now: float,
+    rnd: random.Random = random
+) -> float:
+    """Время (time.time()) первого цикла полосы после запуска"""
+    if last_scan is not None and last_scan + interval > now:
+        return last_scan + interval
+    return now + rnd.uniform(0, CATCHUP_JITTER) * (priority + 1) / (LOWEST_PRIORITY + 1)
+
+
+def order_by_staleness(channels: Sequence[tuple], last_scans: Dict[str, float]) -> List[tuple]:
+    """Каналы (username первым полем) от давно не опрошенных к недавним; неопрошенные — первыми"""
+    return sorted(channels, key=lambda ch: last_scans.get(ch[0], 0.0))
+
+
+class StartupBudget:
+    """Общий для всех полос темп опроса каналов на время догона"""
+
+    def __init__(self, rate: float = CATCHUP_RATE, max_seconds: float = CATCHUP_MAX_SECONDS):
+        self.rate = rate
+        self.max_seconds = max_seconds
+        self._pending: set = set()
+        self._started_at = 0.0
+        self._last_grant = 0.0
+        self._granted = 0
+        self._lock = PriorityLock()
+
+    def start(self, lanes: Iterable[Any]) -> None:
+        """Догон идёт, пока каждая из lanes не закончит первый цикл (finish)"""
+        self._pending = set(lanes)
+        self._started_at = time.monotonic()
+
+    @property
+    def active(self) -> bool:
+        if not self._pending or self.rate <= 0:
+            return False
+        if time.monotonic() - self._started_at > self.max_seconds:
+            logging.warning(f"Догон: прошло {self.max_seconds:.0f}s, ограничение темпа снято "
+                            f"(не закончили полосы: {sorted(self._pending)})")
+            self._pending.clear()
+            return False
+        return True
+
+    def finish(self, lane: Any) -> None:
+        if lane not in self._pending:
+            return
+        self._pending.discard(lane)
+        if not self._pending:
+            logging.info(f"Догон завершён за {time.monotonic() - self._started_at:.0f}s, "
+                         f"опрошено каналов: {self._granted}")
+
+    async def acquire(self, priority: int) -> None:
+        """Ждёт очереди на опрос канала; после догона не ждёт"""
+        if not self.active:
+            return
+        started = time.monotonic()
+        await self._lock.acquire(priority)
+        try:
+            wait = self._last_grant + 1 / self.rate - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_grant = time.monotonic()
+            self._granted += 1
+        finally:
+            self._lock.release()
+        metrics.observe('catchup.wait', time.monotonic() - started)
+
+    def state(self) -> Dict[str, Any]:
+        return {'active': self.active, 'pending_lanes': sorted(self._pending), 'granted': self._granted,
+                'waiting': self._lock.waiting}
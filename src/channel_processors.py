@@ -1,8 +1,12 @@
 """Упрощенные процессоры для обработки сообщений разных типов каналов"""
 import logging
 import re
+from datetime import datetime
 from typing import Dict, Any, Optional, List
 
+from .amounts import extract_amounts, threshold_for
+from .exceptions import LLMUnavailableError
+
 # === КОНСТАНТЫ ТИПОВ КАНАЛОВ ===
 CHANNEL_TYPE_FILTERED = 0
 CHANNEL_TYPE_WHITELIST = 1
@@ -12,9 +16,100 @@ CHANNEL_TYPE_RANKS = 4
 CHANNEL_TYPE_WHITELIST2 = 5
 CHANNEL_TYPE_TYPE2 = 6
 
+# Имена типов в настройках (channel_type_intervals, channel_type_lanes, target_routes)
+CHANNEL_TYPE_NAMES = {
+    CHANNEL_TYPE_FILTERED: 'filtered',
+    CHANNEL_TYPE_WHITELIST: 'whitelist',
+    CHANNEL_TYPE_STATS: 'stats',
+    CHANNEL_TYPE_LONGCHECK: 'longcheck',
+    CHANNEL_TYPE_RANKS: 'ranks',
+    CHANNEL_TYPE_WHITELIST2: 'whitelist2',
+    CHANNEL_TYPE_TYPE2: 'type2',
+}
+
+def _target_for(ch_link: str, channel_type: int, config: Dict[str, Any]) -> str:
+    """Целевой канал поста для лога (routing импортирует этот модуль, поэтому импорт здесь)"""
+    from .routing import resolve_target
+    return resolve_target(f"@{ch_link}", channel_type, config)
+
 # Регулярное выражение для парсинга сумм
 _AMOUNT_RE = re.compile(r'\$(\d{1,3}(?:[,\s]\d{3})*(?:\.\d+)?|\d+(?:\.\d+)?)([KkMmBb]?)')
 
+class MessageSnapshot:
+    """
+    Сериализуемая копия сообщения Telethon с полями, которые читают процессоры.
+
+    Используется там, где исходного объекта сообщения нет: при передаче между
+    процессами и при воспроизведении сохранённых постов.
+    """
+    __slots__ = ('id', 'text', 'date', 'grouped_id', 'action',
+                 'video', 'voice', 'photo', 'document', 'poll')
+
+    def __init__(self, id: int, text: Optional[str] = None, date: Optional[datetime] = None,
+                 grouped_id: Optional[int] = None, action: bool = False,
+                 video: bool = False, voice: bool = False, photo: bool = False,
+                 document: bool = False, poll: bool = False):
+        self.id = id
+        self.text = text
+        self.date = date
+        self.grouped_id = grouped_id
+        self.action = action
+        self.video = video
+        self.voice = voice
+        self.photo = photo
+        self.document = document
+        self.poll = poll
+
+    @classmethod
+    def from_message(cls, message) -> 'MessageSnapshot':
+        text = message.text
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        return cls(
+            id=message.id, text=text, date=message.date,
+            grouped_id=getattr(message, 'grouped_id', None), action=bool(message.action),
+            video=bool(message.video), voice=bool(message.voice), photo=bool(message.photo),
+            document=bool(message.document), poll=bool(message.poll),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        if self.date is not None:
+            data['date'] = self.date.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MessageSnapshot':
+        data = dict(data)
+        if data.get('date'):
+            data['date'] = datetime.fromisoformat(data['date'])
+        return cls(**data)
+
+class AlbumMessage:
+    """
+    Альбом (несколько сообщений с общим grouped_id) как одно сообщение для процессоров.
+
+    Текст, id и дата берутся у сообщения с подписью (или у первого), признаки медиа —
+    у всех частей; ids — все сообщения альбома для пересылки одним вызовом.
+    """
+    __slots__ = ('id', 'ids', 'text', 'date', 'grouped_id', 'action',
+                 'video', 'voice', 'photo', 'document', 'poll')
+
+    def __init__(self, members: List[Any]):
+        members = sorted(members, key=lambda m: m.id)
+        caption = next((m for m in members if m.text), members[0])
+        self.id = caption.id
+        self.ids = [m.id for m in members]
+        self.text = caption.text
+        self.date = members[0].date
+        self.grouped_id = members[0].grouped_id
+        self.action = False
+        for name in ('video', 'voice', 'photo', 'document', 'poll'):
+            setattr(self, name, any(getattr(m, name) for m in members))
+
+    def __repr__(self) -> str:
+        return f"AlbumMessage(ids={self.ids})"
+
 def _prepare_post_data(message, ch_link: str, channel: str, channel_type: int, 
                       msg_text: Optional[str] = None, is_advertisement: bool = False,
                       blacklisted: bool = False) -> Dict[str, Any]:
@@ -118,7 +213,7 @@ async def process_filtered_message(message, peer, ch_link: str, channel_type: in
     if not message.text:
         forwarded = await safe_forward_func(
             message.id, peer, ch_link, channel_type, counters,
-            log_prefix=f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): FW no-text → {config['target_channel']}: {message.id}"
+            log_prefix=f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): FW no-text → {_target_for(ch_link, channel_type, config)}: {message.id}"
         )
         # Сохраняем пост без текста
         if posts_batch is not None:
@@ -146,10 +241,25 @@ async def process_filtered_message(message, peer, ch_link: str, channel_type: in
             posts_batch.append(post_data)
         return False
     
-    # Проверка на рекламу через AI
-    is_ad_result = await is_advertisement_func(msg_text)
+    # Проверка на рекламу: сначала локальный классификатор (если уверен), иначе AI
+    local_classify_func = kwargs.get('local_classify_func')
+    is_ad_result = local_classify_func(msg_text) if local_classify_func else None
+    verdict_source = 'local'
+    if is_ad_result is None:
+        try:
+            is_ad_result = await is_advertisement_func(msg_text)
+        except LLMUnavailableError:
+            # LLM недоступен: откладываем проверку, если вызывающий умеет (defer_func), иначе наверх
+            defer_func = kwargs.get('defer_func')
+            if defer_func is None:
+                raise
+            defer_func(message.id, channel, channel_type)
+            logging.info(f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): LLM unavailable, deferred")
+            counters['skipped'] += 1
+            return False
+        verdict_source = 'AI'
     if is_ad_result:
-        logging.info(f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): AD detected, skip")
+        logging.info(f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): AD detected ({verdict_source}), skip")
         add_advertisement_post_func(message.id, channel)
         counters['ads'] += 1
         counters['skipped'] += 1
@@ -205,64 +315,41 @@ async def process_stats_message(message, peer, ch_link: str, channel_type: int,
         counters['skipped'] += 1
         return False
     
-    # Парсим сумму
-    amount = parse_amount(msg_text)
-    if amount is None:
-        counters['skipped'] += 1
-        # Сохраняем посты без суммы
+    # Все пары (монета, сумма) за один проход
+    pairs = extract_amounts(msg_text, (config.get('coin_thresholds') or {}).keys())
+    
+    def save_post(forwarded: bool = False) -> None:
         if posts_batch is not None:
             post_data = _prepare_post_data(message, ch_link, channel, channel_type, 
                                           msg_text=msg_text, is_advertisement=False, blacklisted=False)
+            post_data['amounts'] = pairs or None
+            post_data['is_forwarded'] = forwarded
             posts_batch.append(post_data)
-        return False
     
-    upper = msg_text.upper()
-    
-    # Проверка для BTC/ETH
-    if 'BTC' in upper or 'ETH' in upper:
-        if amount > config['btc_eth_threshold']:
-            forwarded = await safe_forward_func(
-                message.id, peer, ch_link, channel_type, counters,
-                log_prefix=f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): FW stats BTC/ETH {amount} → {config['target_channel']}",
-                use_short_delay=False
-            )
-            if posts_batch is not None:
-                post_data = _prepare_post_data(message, ch_link, channel, channel_type, 
-                                              msg_text=msg_text, is_advertisement=False, blacklisted=False)
-                post_data['is_forwarded'] = forwarded
-                posts_batch.append(post_data)
-            return forwarded
-        else:
-            counters['skipped'] += 1
-            # Сохраняем посты с малой суммой BTC/ETH
-            if posts_batch is not None:
-                post_data = _prepare_post_data(message, ch_link, channel, channel_type, 
-                                              msg_text=msg_text, is_advertisement=False, blacklisted=False)
-                posts_batch.append(post_data)
-            return False
+    if not pairs:
+        counters['skipped'] += 1
+        # Сохраняем посты без суммы
+        save_post()
+        return False
     
-    # Проверка для других монет
-    if amount > config['other_coin_threshold']:
+    # Пересылаем, если хотя бы одна сумма выше порога своей монеты
+    passed = [(coin, amount) for coin, amount in pairs if amount > threshold_for(coin, config)]
+    if passed:
+        coin, amount = max(passed, key=lambda p: p[1])
         forwarded = await safe_forward_func(
             message.id, peer, ch_link, channel_type, counters,
-            log_prefix=f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): FW stats {amount} → {config['target_channel']}",
+            log_prefix=f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): FW stats {coin or 'other'} {amount} → {_target_for(ch_link, channel_type, config)}",
             use_short_delay=False
         )
-        if posts_batch is not None:
-            post_data = _prepare_post_data(message, ch_link, channel, channel_type, 
-                                          msg_text=msg_text, is_advertisement=False, blacklisted=False)
-            post_data['is_forwarded'] = forwarded
-            posts_batch.append(post_data)
+        save_post(forwarded)
         return forwarded
-    else:
-        logging.info(f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): Skip stats other {amount} < {config['other_coin_threshold']}")
-        counters['skipped'] += 1
-        # Сохраняем посты с малой суммой других монет
-        if posts_batch is not None:
-            post_data = _prepare_post_data(message, ch_link, channel, channel_type, 
-                                          msg_text=msg_text, is_advertisement=False, blacklisted=False)
-            posts_batch.append(post_data)
-        return False
+    
+    coin, amount = max(pairs, key=lambda p: p[1])
+    logging.info(f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): Skip stats {coin or 'other'} {amount} < {threshold_for(coin, config)}")
+    counters['skipped'] += 1
+    # Сохраняем посты с малыми суммами
+    save_post()
+    return False
 
 async def process_ranks_message(message, peer, ch_link: str, channel_type: int, counters: dict,
                                  safe_forward_func, is_blacklisted_func=None, is_advertisement_func=None,
@@ -289,7 +376,7 @@ async def process_ranks_message(message, peer, ch_link: str, channel_type: int,
     if not message.text:
         forwarded = await safe_forward_func(
             message.id, peer, ch_link, channel_type, counters,
-            log_prefix=f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): FW no-text → {config['target_channel']}: {message.id}"
+            log_prefix=f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): FW no-text → {_target_for(ch_link, channel_type, config)}: {message.id}"
         )
         if posts_batch is not None:
             post_data = _prepare_post_data(message, ch_link, channel, channel_type, 
@@ -349,7 +436,7 @@ async def process_whitelist2_message(message, peer, ch_link: str, channel_type:
     if not message.text:
         forwarded = await safe_forward_func(
             message.id, peer, ch_link, channel_type, counters,
-            log_prefix=f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): FW no-text → {config['target_channel']}: {message.id}"
+            log_prefix=f"https://t.me/{ch_link}/{message.id} (Type {channel_type}): FW no-text → {_target_for(ch_link, channel_type, config)}: {message.id}"
         )
         if posts_batch is not None:
             post_data = _prepare_post_data(message, ch_link, channel, channel_type, 
@@ -0,0 +1,76 @@
+"""Circuit breaker для внешних сервисов (DeepSeek)"""
+import logging
+import time
+from typing import Optional
+
+from . import metrics
+
+
+class CircuitBreaker:
+    """
+    closed → open после failure_threshold ошибок подряд; через reset_timeout секунд
+    half_open пропускает один пробный вызов: успех закрывает breaker, ошибка снова открывает.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        metrics.set_gauge(f"{name}.breaker_open", 0)
+
+    def _set_state(self, state: str, reason: Optional[str] = None) -> None:
+        if state == self.state:
+            return
+        logging.warning(f"Circuit breaker {self.name}: {self.state} → {state}" + (f" ({reason})" if reason else ""))
+        self.state = state
+        metrics.set_gauge(f"{self.name}.breaker_open", 0 if state == self.CLOSED else 1)
+        metrics.inc(f"{self.name}.breaker_{state}")
+
+    def ready(self) -> bool:
+        """Можно ли пробовать вызов (не меняя состояние)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return not self._trial_blocked()
+
+    def _trial_blocked(self) -> bool:
+        # Пробный вызов, не вернувший результат (например, отменённый), не блокирует breaker навсегда
+        return self._trial_in_flight and time.monotonic() - self._trial_started < self.reset_timeout
+
+    def allow(self) -> bool:
+        """Разрешает вызов; в half_open — только один пробный одновременно"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._set_state(self.HALF_OPEN)
+        if self._trial_blocked():
+            return False
+        self._trial_in_flight = True
+        self._trial_started = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._trial_in_flight = False
+        self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self._trial_in_flight = False
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN, "пробный вызов неудачен")
+        elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN, f"{self.failures} ошибок подряд")
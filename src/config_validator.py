@@ -1,6 +1,7 @@
 """Простая валидация конфигурации без Pydantic"""
 import logging
 import ast
+import json
 from typing import Dict, Any
 
 def validate_config_value(key: str, value: Any, config: Dict[str, Any]) -> Any:
@@ -8,7 +9,8 @@ def validate_config_value(key: str, value: Any, config: Dict[str, Any]) -> Any:
     try:
         # Целочисленные поля
         if key in ['table_scan_interval', 'message_scan_interval', 'min_length', 'min_length_wl',
-                   'max_messages_per_channel', 'csv_timeout', 'max_null_hash_fixes']:
+                   'max_messages_per_channel', 'csv_timeout', 'max_null_hash_fixes',
+                   'catchup_budget_per_cycle', 'llm_input_token_budget']:
             if isinstance(value, str):
                 val = int(value.replace('_', '').replace(' ', ''))
             else:
@@ -19,8 +21,11 @@ def validate_config_value(key: str, value: Any, config: Dict[str, Any]) -> Any:
                 val = 30
             elif key in ['table_scan_interval', 'min_length', 'min_length_wl'] and val < 1:
                 val = 1
-            elif key in ['csv_timeout', 'max_null_hash_fixes'] and val < 1:
+            elif key in ['csv_timeout', 'max_null_hash_fixes', 'max_messages_per_channel',
+                         'catchup_budget_per_cycle'] and val < 1:
                 val = 1
+            elif key == 'llm_input_token_budget' and val < 0:
+                val = 0
             
             return val
         
@@ -34,6 +39,69 @@ def validate_config_value(key: str, value: Any, config: Dict[str, Any]) -> Any:
                 raise ValueError(f"{key} must be >= 0")
             return val
         
+        # Порог уверенности локального классификатора; 1 — всегда спрашивать LLM
+        elif key == 'local_classifier_threshold':
+            val = float(value.replace(',', '.')) if isinstance(value, str) else float(value)
+            if not 0.5 < val <= 1:
+                raise ValueError(f"{key} must be in (0.5, 1]")
+            return val
+        
+        elif key == 'llm_timeout':
+            val = float(value.replace(',', '.')) if isinstance(value, str) else float(value)
+            if val < 1:
+                raise ValueError(f"{key} must be >= 1")
+            return val
+        
+        elif key == 'llm_fallback_policy':
+            val = str(value).strip().lower()
+            if val not in ('defer', 'heuristic', 'pass'):
+                raise ValueError(f"{key} must be one of: defer, heuristic, pass")
+            return val
+        
+        # Пороги по монетам: JSON-объект или "BTC=1000000, SOL=200000"
+        elif key == 'coin_thresholds':
+            if isinstance(value, dict):
+                raw = value
+            elif str(value).strip().startswith('{'):
+                raw = json.loads(value)
+            else:
+                raw = dict(part.split('=', 1) for part in str(value).split(',') if part.strip())
+            result = {}
+            for coin, threshold in raw.items():
+                val = int(str(threshold).replace('_', '').replace(' ', ''))
+                if val < 0:
+                    raise ValueError(f"{key}: threshold for {coin} must be >= 0")
+                result[coin.strip().upper()] = val
+            return result
+        
+        # Полосы планировщика: {"stats": [0, 2], ...} — приоритет 0..9 и число обработчиков 1..10
+        elif key == 'channel_type_lanes':
+            if isinstance(value, dict):
+                raw = value
+            else:
+                raw = json.loads(value) if str(value).strip().startswith('{') else {}
+            result = {}
+            for lane, spec in raw.items():
+                priority, workers = (int(v) for v in spec)
+                if not 0 <= priority <= 9 or not 1 <= workers <= 10:
+                    raise ValueError(f"{key}: {lane} must be [priority 0..9, workers 1..10]")
+                result[str(lane).strip().lower()] = [priority, workers]
+            return result
+        
+        # Маршруты пересылок: {"stats": "@alerts", "@somechannel": "@special"}
+        elif key == 'target_routes':
+            if isinstance(value, dict):
+                raw = value
+            else:
+                raw = json.loads(value) if str(value).strip().startswith('{') else {}
+            result = {}
+            for source, target in raw.items():
+                target = str(target).strip()
+                if not target.startswith('@'):
+                    raise ValueError(f"{key}: target for {source} must start with '@'")
+                result[str(source).strip().lower()] = target
+            return result
+        
         # Float поля
         elif key in ['sleep_between_channels_min', 'sleep_between_channels_max']:
             if isinstance(value, str):
@@ -44,8 +112,8 @@ def validate_config_value(key: str, value: Any, config: Dict[str, Any]) -> Any:
                 raise ValueError(f"{key} must be >= 0")
             return val
         
-        # Boolean поле
-        elif key == 'log_channel_count_changes_only':
+        # Boolean поля
+        elif key in ('log_channel_count_changes_only', 'dialog_prefilter'):
             if isinstance(value, str):
                 lowered = value.strip().lower()
                 return lowered in ('true', '1', 'yes', 'on')
@@ -0,0 +1,113 @@
+"""
+Дневные сводки по каналам (channel_daily_stats) и их выгрузка.
+
+Таблица поддерживается триггерами на posts (миграция 8), поэтому отчёты по объёму,
+доле рекламы и пересылок читают одну строку на канал и день вместо агрегации posts.
+
+    python -m src.daily_stats --from 2026-10-01 --to 2026-10-31 --format csv --out october.csv
+    python -m src.daily_stats --from 2026-10-01 --channels @chan1 @chan2 --format jsonl
+    python -m src.daily_stats --rebuild   # пересчитать сводку из posts
+"""
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+FIELDS = ('day', 'channel', 'channel_type', 'posts', 'ads', 'forwarded', 'blacklisted', 'with_media',
+          'text_length', 'ad_ratio', 'forward_rate')
+
+
+def _ratio(part: int, total: int) -> float:
+    return round(part / total, 4) if total else 0.0
+
+
+def iter_daily_stats(
+    conn: sqlite3.Connection,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    channels: Optional[List[str]] = None
+) -> Iterator[Dict[str, Any]]:
+    """Строки сводки за [date_from, date_to] (YYYY-MM-DD, включительно) по порядку дней"""
+    sql = """
+        SELECT day, channel, channel_type, posts, ads, forwarded, blacklisted, with_media, text_length
+        FROM channel_daily_stats WHERE posts > 0
+    """
+    params: List[Any] = []
+    if date_from:
+        sql += " AND day >= ?"
+        params.append(date_from)
+    if date_to:
+        sql += " AND day <= ?"
+        params.append(date_to)
+    if channels:
+        sql += f" AND channel IN ({','.join('?' * len(channels))})"
+        params.extend(channels)
+    # Курсор читается построчно: выгрузка за любой период не держит всё в памяти
+    for row in conn.execute(sql + " ORDER BY day, channel", params):
+        item = dict(zip(FIELDS, row))
+        item['ad_ratio'] = _ratio(item['ads'], item['posts'])
+        item['forward_rate'] = _ratio(item['forwarded'], item['posts'])
+        yield item
+
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """Пересчитывает сводку из posts (если таблицу меняли вручную); возвращает число строк"""
+    from .migrations import DAILY_STATS_FROM_POSTS
+    with conn:
+        conn.execute("DELETE FROM channel_daily_stats")
+        conn.execute(DAILY_STATS_FROM_POSTS)
+    return conn.execute("SELECT COUNT(*) FROM channel_daily_stats").fetchone()[0]
+
+
+def export(rows: Iterator[Dict[str, Any]], out, fmt: str) -> int:
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def main() -> None:
+    from .paths import ARCHIVE_DB_FILE
+
+    parser = argparse.ArgumentParser(description="Выгрузка дневных сводок по каналам")
+    parser.add_argument('--db', default=ARCHIVE_DB_FILE)
+    parser.add_argument('--from', dest='date_from', help="первый день, YYYY-MM-DD")
+    parser.add_argument('--to', dest='date_to', help="последний день, YYYY-MM-DD (включительно)")
+    parser.add_argument('--channels', nargs='*', help="каналы (по умолчанию все)")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    parser.add_argument('--out', help="файл выгрузки; по умолчанию stdout")
+    parser.add_argument('--rebuild', action='store_true', help="пересчитать сводку из posts и выйти")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        conn = sqlite3.connect(args.db)
+        try:
+            print(f"Пересчитано строк сводки: {rebuild(conn)}", file=sys.stderr)
+        finally:
+            conn.close()
+        return
+
+    channels = [c if c.startswith('@') else f"@{c}" for c in args.channels] if args.channels else None
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    out = open(args.out, 'w', encoding='utf-8', newline='') if args.out else sys.stdout
+    try:
+        count = export(iter_daily_stats(conn, args.date_from, args.date_to, channels), out, args.format)
+    finally:
+        conn.close()
+        if args.out:
+            out.close()
+    print(f"Выгружено строк: {count}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Снимок состояния процесса по сигналу SIGUSR1 (kill -USR1 <pid>, docker kill -s USR1 <контейнер>).
+
+Снимок пишется в файл diagnostics-<процесс>-<pid>-<время>.txt в DIAGNOSTICS_DIR
+(по умолчанию каталог данных), путь — в лог. В снимке:
+
+- все asyncio-задачи со стеками (где каждая сейчас ждёт);
+- запросы к Telegram и DeepSeek в работе и их длительность (inflight);
+- tracemalloc: самые крупные места выделения памяти и рост с прошлого снимка;
+- счётчики и поколения GC, RSS процесса;
+- состояние, которое регистрирует бот (register): аккаунты, кэши, БД, метрики.
+
+В обычной работе ничего не собирается: tracemalloc включается первым сигналом (тогда
+же снимается база для сравнения) и остаётся включённым до SIGUSR2. В многопроцессном
+режиме супервизор передаёт сигнал всем воркерам.
+
+Переменные окружения:
+    DIAGNOSTICS_DIR                  каталог для снимков
+    DIAGNOSTICS_TRACEMALLOC_FRAMES   глубина стека для tracemalloc (по умолчанию 10)
+"""
+import asyncio
+import gc
+import io
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import metrics
+from .paths import DATA_DIR
+
+DIAGNOSTICS_DIR = os.getenv('DIAGNOSTICS_DIR', DATA_DIR)
+TRACEMALLOC_FRAMES = max(1, int(os.getenv('DIAGNOSTICS_TRACEMALLOC_FRAMES', '10')))
+TOP_ALLOCATIONS = 25
+
+_providers: Dict[str, Callable[[], Any]] = {'metrics': metrics.snapshot}
+_inflight: Dict[int, Tuple[str, str, float]] = {}
+_inflight_ids = itertools.count()
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+_last_dump_at: Optional[float] = None
+
+
+def register(name: str, provider: Callable[[], Any]) -> None:
+    """Добавляет раздел снимка: provider() возвращает словарь или строку"""
+    _providers[name] = provider
+
+
+@contextmanager
+def inflight(kind: str, what: str):
+    """Отмечает внешний запрос (telegram, llm) на время его выполнения"""
+    key = next(_inflight_ids)
+    _inflight[key] = (kind, what, time.monotonic())
+    try:
+        yield
+    finally:
+        del _inflight[key]
+
+
+def _section(out: io.StringIO, title: str) -> None:
+    out.write(f"\n=== {title} ===\n")
+
+
+def _write_tasks(out: io.StringIO, loop: asyncio.AbstractEventLoop) -> None:
+    tasks = sorted(asyncio.all_tasks(loop), key=lambda t: t.get_name())
+    _section(out, f"asyncio-задачи ({len(tasks)})")
+    for task in tasks:
+        out.write(f"\n--- {task.get_name()}: {task.get_coro()!r}\n")
+        task.print_stack(limit=20, file=out)
+
+
+def _write_inflight(out: io.StringIO) -> None:
+    now = time.monotonic()
+    items = sorted(_inflight.values(), key=lambda item: item[2])
+    _section(out, f"запросы в работе ({len(items)})")
+    for kind, what, started in items:
+        out.write(f"{now - started:9.2f}s  {kind:<9} {what}\n")
+
+
+def _write_memory(out: io.StringIO) -> None:
+    global _last_snapshot
+    _section(out, "память")
+    rss = None
+    try:
+        with open('/proc/self/status') as f:
+            rss = next((line.split(':', 1)[1].strip() for line in f if line.startswith('VmRSS')), None)
+    except OSError:
+        pass
+    out.write(f"RSS: {rss or 'н/д'}\n")
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        _last_snapshot = tracemalloc.take_snapshot()
+        out.write("tracemalloc включён этим снимком: выделения и рост будут в следующем (выключить — SIGUSR2)\n")
+        return
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    out.write(f"tracemalloc: сейчас {current / 2**20:.1f} MiB, пик {peak / 2**20:.1f} MiB\n")
+    out.write(f"\nКрупнейшие места выделения (топ {TOP_ALLOCATIONS}):\n")
+    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        out.write(f"  {stat}\n")
+    if _last_snapshot is not None:
+        out.write("\nРост с прошлого снимка:\n")
+        for stat in snapshot.compare_to(_last_snapshot, 'lineno')[:TOP_ALLOCATIONS]:
+            out.write(f"  {stat}\n")
+    _last_snapshot = snapshot
+
+
+def _write_gc(out: io.StringIO) -> None:
+    _section(out, "GC")
+    out.write(f"порог: {gc.get_threshold()}, счётчики поколений: {gc.get_count()}\n")
+    for generation, stats in enumerate(gc.get_stats()):
+        out.write(f"поколение {generation}: {stats}\n")
+    out.write(f"отслеживаемых объектов: {len(gc.get_objects())}, gc.garbage: {len(gc.garbage)}\n")
+
+
+def _write_providers(out: io.StringIO) -> None:
+    for name, provider in _providers.items():
+        _section(out, name)
+        try:
+            value = provider()
+        except Exception as e:
+            out.write(f"ошибка: {e!r}\n")
+            continue
+        if isinstance(value, dict):
+            for key, item in sorted(value.items()):
+                out.write(f"{key}: {item}\n")
+        else:
+            out.write(f"{value}\n")
+
+
+def dump(loop: Optional[asyncio.AbstractEventLoop] = None) -> str:
+    """Собирает снимок и пишет его в файл; возвращает путь"""
+    global _last_dump_at
+    loop = loop or asyncio.get_event_loop()
+    now = time.time()
+    process = multiprocessing.current_process().name
+    out = io.StringIO()
+    out.write(f"Диагностика {process} (pid {os.getpid()}), {datetime.now(timezone.utc).isoformat()}\n")
+    if _last_dump_at is not None:
+        out.write(f"Прошлый снимок: {now - _last_dump_at:.0f} s назад\n")
+    _last_dump_at = now
+    for write in (_write_inflight, _write_providers, _write_memory, _write_gc):
+        try:
+            write(out)
+        except Exception as e:
+            out.write(f"\nошибка раздела {write.__name__}: {e!r}\n")
+    _write_tasks(out, loop)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    path = os.path.join(DIAGNOSTICS_DIR, f"diagnostics-{process}-{os.getpid()}-{stamp}.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(out.getvalue())
+    return path
+
+
+def _on_dump_signal(loop: asyncio.AbstractEventLoop) -> None:
+    started = time.monotonic()
+    try:
+        path = dump(loop)
+    except Exception as e:
+        logging.error(f"Диагностика: снимок не записан: {e!r}")
+        return
+    logging.info(f"Диагностика: снимок {path} ({time.monotonic() - started:.2f}s)")
+
+
+def _on_stop_signal() -> None:
+    global _last_snapshot
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        _last_snapshot = None
+        logging.info("Диагностика: tracemalloc выключен")
+
+
+def install(loop: asyncio.AbstractEventLoop) -> bool:
+    """Обработчики SIGUSR1 (снимок) и SIGUSR2 (выключить tracemalloc); False, если сигналов нет (Windows)"""
+    if not hasattr(signal, 'SIGUSR1'):
+        return False
+    loop.add_signal_handler(signal.SIGUSR1, _on_dump_signal, loop)
+    loop.add_signal_handler(signal.SIGUSR2, _on_stop_signal)
+    return True
+
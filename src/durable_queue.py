@@ -0,0 +1,107 @@
+"""Durable-очереди на SQLite для связи между процессами воркеров"""
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Если воркер взял элемент и не подтвердил его за это время, элемент снова становится доступен
+DEFAULT_VISIBILITY_TIMEOUT = 300
+
+
+class DurableQueue:
+    """
+    Набор именованных очередей в одном SQLite-файле (WAL).
+
+    Элемент берётся через take() и удаляется только после ack(). Если процесс
+    упал, не подтвердив элементы, они возвращаются в очередь по истечении
+    visibility_timeout, поэтому обработчики должны быть идемпотентными.
+    """
+
+    def __init__(self, path: str, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS queue_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    queue TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    taken_at REAL,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_items_queue ON queue_items(queue, id)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def put(self, queue: str, payload: Dict[str, Any]) -> None:
+        self.put_many(queue, [payload])
+
+    def put_many(self, queue: str, payloads: Iterable[Dict[str, Any]]) -> int:
+        rows = [(queue, json.dumps(p, ensure_ascii=False)) for p in payloads]
+        if not rows:
+            return 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT INTO queue_items (queue, payload) VALUES (?, ?)", rows)
+            conn.execute("COMMIT")
+        return len(rows)
+
+    def take(self, queue: str, limit: int = 50) -> List[Tuple[int, Dict[str, Any]]]:
+        """Забирает до limit элементов в порядке постановки"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute("""
+                    SELECT id, payload FROM queue_items
+                    WHERE queue = ? AND available_at <= ?
+                      AND (taken_at IS NULL OR taken_at < ?)
+                    ORDER BY id
+                    LIMIT ?
+                """, (queue, now, now - self.visibility_timeout, limit)).fetchall()
+                if rows:
+                    conn.executemany(
+                        "UPDATE queue_items SET taken_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        [(now, row[0]) for row in rows]
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def ack(self, ids: Iterable[int]) -> None:
+        ids = [(i,) for i in ids]
+        if not ids:
+            return
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM queue_items WHERE id = ?", ids)
+            conn.execute("COMMIT")
+
+    def release(self, ids: Iterable[int], delay: float = 0.0) -> None:
+        """Возвращает элементы в очередь (например, после временной ошибки)"""
+        available_at = time.time() + delay
+        ids = [(available_at, i) for i in ids]
+        if not ids:
+            return
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE queue_items SET taken_at = NULL, available_at = ? WHERE id = ?", ids)
+            conn.execute("COMMIT")
+
+    def depths(self) -> Dict[str, int]:
+        """Количество элементов в каждой очереди"""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT queue, COUNT(*) FROM queue_items GROUP BY queue").fetchall())
@@ -0,0 +1,5 @@
+"""Кастомные исключения бота"""
+
+
+class LLMUnavailableError(Exception):
+    """LLM недоступен (ошибки/таймауты или открыт circuit breaker), проверку поста нужно отложить"""
@@ -0,0 +1,111 @@
+"""
+Общий HTTP-клиент (httpx) для DeepSeek и загрузки Google-таблицы.
+
+Один AsyncClient на процесс: соединения держатся открытыми (keep-alive) и
+переиспользуются, поэтому под нагрузкой не платим за TCP/TLS на каждый запрос.
+Запросы к DeepSeek идут через OPENAI_PROXY, если он задан; таблица — напрямую.
+Размер пула рассчитан на число одновременных проверок LLM (полосы filtered и
+longcheck, до PIPELINE_DEPTH сообщений в каждой).
+
+Счётчики http.<хост>.requests / tcp_connects / tls_handshakes попадают в
+периодический лог метрик: доля переиспользованных соединений —
+1 - tcp_connects / requests.
+
+Переменные окружения:
+    LLM_MAX_CONNECTIONS     размер пула к DeepSeek (по умолчанию 2 * (PIPELINE_DEPTH + 2))
+    HTTP_KEEPALIVE_EXPIRY   сколько секунд держать простаивающее соединение (по умолчанию 90)
+    LLM_HTTP2               1 — HTTP/2 к DeepSeek (нужен пакет h2: pip install httpx[http2])
+"""
+import logging
+import os
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from . import metrics
+from .pipeline import PIPELINE_DEPTH
+
+LLM_BASE_URL = "https://api.deepseek.com"
+LLM_MAX_CONNECTIONS = max(1, int(os.getenv('LLM_MAX_CONNECTIONS', str(2 * (PIPELINE_DEPTH + 2)))))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '90'))
+LLM_HTTP2 = os.getenv('LLM_HTTP2', '0').lower() in ('1', 'true', 'yes', 'on')
+# Прочие хосты (Google-таблица) — редкие запросы
+OTHER_MAX_CONNECTIONS = 4
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _proxy_url(proxy: str) -> Optional[str]:
+    """OPENAI_PROXY в формате login:password@ip:port (схема необязательна)"""
+    proxy = (proxy or '').strip()
+    if not proxy:
+        return None
+    return proxy if '://' in proxy else f"http://{proxy}"
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  # type: ignore
+        return True
+    except ImportError:
+        return False
+
+
+async def _on_request(request: httpx.Request) -> None:
+    host = request.url.host
+    metrics.inc(f"http.{host}.requests")
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        # События httpcore: новое TCP-соединение и TLS-рукопожатие (при переиспользовании их нет)
+        if event_name == 'connection.connect_tcp.complete':
+            metrics.inc(f"http.{host}.tcp_connects")
+        elif event_name == 'connection.start_tls.complete':
+            metrics.inc(f"http.{host}.tls_handshakes")
+
+    request.extensions['trace'] = trace
+
+
+def make_client(proxy: str = '') -> httpx.AsyncClient:
+    """Клиент с отдельными пулами для DeepSeek (через прокси, HTTP/2 по желанию) и прочих хостов"""
+    http2 = LLM_HTTP2 and _http2_available()
+    if LLM_HTTP2 and not http2:
+        logging.warning("LLM_HTTP2=1, но пакет h2 не установлен — используется HTTP/1.1")
+    llm_transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+        proxy=_proxy_url(proxy),
+    )
+    default_transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(max_connections=OTHER_MAX_CONNECTIONS, keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+    )
+    llm_host = urlsplit(LLM_BASE_URL).netloc
+    logging.info(
+        f"HTTP: пул DeepSeek {LLM_MAX_CONNECTIONS} соединений, keep-alive {HTTP_KEEPALIVE_EXPIRY:.0f}s, "
+        f"{'HTTP/2' if http2 else 'HTTP/1.1'}, прокси {'есть' if proxy else 'нет'}"
+    )
+    return httpx.AsyncClient(
+        transport=default_transport,
+        mounts={f"https://{llm_host}": llm_transport},
+        event_hooks={'request': [_on_request]},
+        follow_redirects=True,
+    )
+
+
+def get_client(proxy: str = '') -> httpx.AsyncClient:
+    """Общий клиент процесса (создаётся при первом обращении)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = make_client(proxy)
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
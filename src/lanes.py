@@ -0,0 +1,66 @@
+"""
+Полосы (lanes) планировщика: у каждого типа каналов свой приоритет и число обработчиков.
+
+Каждый тип опрашивается отдельной задачей, поэтому FILTERED/LONGCHECK, которые ждут
+DeepSeek на каждом посте, больше не задерживают STATS и WHITELIST. Приоритет полосы
+действует на бюджет запросов аккаунта (TelegramAccount.throttle): когда чтения и
+пересылки разных полос ждут одного аккаунта, первым проходит запрос полосы с меньшим
+приоритетом. В многопроцессном режиме тот же приоритет задаёт порядок очередей
+классификатора и пересыльщика.
+
+Метрики: lane.<имя>.start_lag — насколько позже срока начался цикл полосы,
+lane.<имя>.cycle — длительность цикла, rpc_wait.<имя> — ожидание бюджета аккаунта.
+"""
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .channel_processors import (
+    CHANNEL_TYPE_FILTERED, CHANNEL_TYPE_LONGCHECK, CHANNEL_TYPE_NAMES, CHANNEL_TYPE_RANKS,
+    CHANNEL_TYPE_STATS, CHANNEL_TYPE_TYPE2, CHANNEL_TYPE_WHITELIST, CHANNEL_TYPE_WHITELIST2,
+)
+
+# Тип канала -> (приоритет, параллельных обработчиков); 0 — самый срочный
+DEFAULT_LANES = {
+    CHANNEL_TYPE_STATS: (0, 2),
+    CHANNEL_TYPE_WHITELIST: (0, 2),
+    CHANNEL_TYPE_WHITELIST2: (1, 1),
+    CHANNEL_TYPE_RANKS: (1, 1),
+    CHANNEL_TYPE_TYPE2: (1, 1),
+    CHANNEL_TYPE_FILTERED: (2, 1),
+    CHANNEL_TYPE_LONGCHECK: (3, 1),
+}
+LOWEST_PRIORITY = 9
+
+
+class Lane(NamedTuple):
+    channel_type: int
+    name: str
+    priority: int
+    workers: int
+
+
+def get_lane(channel_type: int, config: Dict[str, Any]) -> Lane:
+    """Полоса типа каналов с учётом channel_type_lanes из настроек"""
+    name = CHANNEL_TYPE_NAMES.get(channel_type, str(channel_type))
+    overrides = config.get('channel_type_lanes') or {}
+    spec = overrides.get(name) or overrides.get(str(channel_type))
+    priority, workers = spec if spec else DEFAULT_LANES.get(channel_type, (LOWEST_PRIORITY, 1))
+    return Lane(channel_type, name, int(priority), int(workers))
+
+
+def queue_name(base: str, channel_type: int, config: Dict[str, Any]) -> str:
+    """Имя durable-очереди с приоритетом полосы, например forward:p0"""
+    return f"{base}:p{get_lane(channel_type, config).priority}"
+
+
+def queues_by_priority(base: str, legacy: Optional[str] = None) -> List[str]:
+    """
+    Очереди base в порядке разбора: от срочных к остальным.
+
+    Перечисляются все приоритеты, а не только текущие из настроек: у процессов
+    настройки обновляются в разное время. legacy — очередь без приоритета
+    (элементы, поставленные до появления полос), разбирается последней.
+    """
+    names = [f"{base}:p{p}" for p in range(LOWEST_PRIORITY + 1)]
+    if legacy:
+        names.append(legacy)
+    return names
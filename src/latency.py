@@ -0,0 +1,139 @@
+"""
+Отчёт о задержках обработки постов: p50/p95/p99 по типам каналов и интервалам времени.
+
+Стадии считаются по отметкам в posts (миграция 9):
+
+    fetch       published_at → fetched_at     (ожидание опроса канала)
+    classify    fetched_at → classified_at    (blacklist, локальная модель, DeepSeek)
+    forward     classified_at → forwarded_at  (очередь пересылки и RPC)
+    end_to_end  published_at → forwarded_at   (от публикации до target_channel)
+
+    python -m src.latency                          # последние 24 часа по типам каналов
+    python -m src.latency --hours 168 --bucket day
+    python -m src.latency --from 2026-10-01 --to 2026-10-08 --types 1,2 --format json
+"""
+import argparse
+import json
+import math
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .channel_processors import CHANNEL_TYPE_NAMES
+
+STAGES = ('fetch', 'classify', 'forward', 'end_to_end')
+PERCENTILES = (50, 95, 99)
+
+_BUCKET_FORMATS = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d'}
+
+# Разница отметок в секундах; NULL, если одной из отметок нет
+_SECONDS = "(julianday({end}) - julianday({start})) * 86400"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Перцентиль по ближайшему рангу (значения отсортированы)"""
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _query(date_from: str, date_to: str, bucket: str, channel_types: Optional[List[int]]) -> Tuple[str, List]:
+    if bucket in _BUCKET_FORMATS:
+        bucket_expr = f"strftime('{_BUCKET_FORMATS[bucket]}', published_at)"
+    else:
+        bucket_expr = "'всё окно'"
+    sql = f"""
+        SELECT channel_type, {bucket_expr},
+               {_SECONDS.format(start='published_at', end='fetched_at')},
+               {_SECONDS.format(start='fetched_at', end='classified_at')},
+               {_SECONDS.format(start='classified_at', end='forwarded_at')},
+               {_SECONDS.format(start='published_at', end='forwarded_at')}
+        FROM posts
+        WHERE published_at >= ? AND published_at < ? AND fetched_at IS NOT NULL
+    """
+    params: List = [date_from, date_to]
+    if channel_types:
+        sql += f" AND channel_type IN ({','.join('?' * len(channel_types))})"
+        params.extend(channel_types)
+    return sql, params
+
+
+def collect(
+    conn: sqlite3.Connection,
+    date_from: str,
+    date_to: str,
+    bucket: str = 'none',
+    channel_types: Optional[List[int]] = None
+) -> Dict[Tuple[str, int], Dict[str, List[float]]]:
+    """Значения задержек стадий, сгруппированные по (интервал, тип канала)"""
+    groups: Dict[Tuple[str, int], Dict[str, List[float]]] = {}
+    sql, params = _query(date_from, date_to, bucket, channel_types)
+    for channel_type, period, *values in conn.execute(sql, params):
+        group = groups.setdefault((period, channel_type), {stage: [] for stage in STAGES})
+        for stage, value in zip(STAGES, values):
+            if value is not None:
+                # Часы published_at и бота могут немного расходиться
+                group[stage].append(max(0.0, value))
+    return groups
+
+
+def summarize(groups: Dict[Tuple[str, int], Dict[str, List[float]]]) -> List[Dict]:
+    rows = []
+    for (period, channel_type), stages in sorted(groups.items()):
+        row = {'period': period, 'channel_type': CHANNEL_TYPE_NAMES.get(channel_type, str(channel_type))}
+        for stage in STAGES:
+            values = sorted(stages[stage])
+            row[stage] = {'count': len(values)}
+            if values:
+                row[stage].update({f"p{p}": round(percentile(values, p), 2) for p in PERCENTILES})
+        rows.append(row)
+    return rows
+
+
+def format_table(rows: Iterable[Dict]) -> str:
+    header = f"{'период':<17}{'тип':<12}{'стадия':<12}{'n':>7}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES)
+    lines = [header, '-' * len(header)]
+    for row in rows:
+        for stage in STAGES:
+            stats = row[stage]
+            if not stats['count']:
+                continue
+            lines.append(
+                f"{row['period']:<17}{row['channel_type']:<12}{stage:<12}{stats['count']:>7}"
+                + "".join(f"{stats[f'p{p}']:>9.1f}s" for p in PERCENTILES)
+            )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    from .paths import ARCHIVE_DB_FILE
+
+    parser = argparse.ArgumentParser(description="Перцентили задержек обработки постов")
+    parser.add_argument('--db', default=ARCHIVE_DB_FILE)
+    parser.add_argument('--hours', type=float, default=24, help="окно до текущего момента (если нет --from)")
+    parser.add_argument('--from', dest='date_from', help="начало окна, ISO (UTC)")
+    parser.add_argument('--to', dest='date_to', help="конец окна, ISO (UTC), не включительно")
+    parser.add_argument('--bucket', choices=('none', 'hour', 'day'), default='none',
+                        help="разбить окно на интервалы")
+    parser.add_argument('--types', help="типы каналов через запятую, например 1,2")
+    parser.add_argument('--format', choices=('table', 'json'), default='table')
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    date_from = args.date_from or (now - timedelta(hours=args.hours)).isoformat()
+    date_to = args.date_to or (now + timedelta(minutes=1)).isoformat()
+    channel_types = [int(t) for t in args.types.split(',')] if args.types else None
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    try:
+        rows = summarize(collect(conn, date_from, date_to, args.bucket, channel_types))
+    finally:
+        conn.close()
+    if args.format == 'json':
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(f"Окно: {date_from} — {date_to}")
+        print(format_table(rows) if rows else "Нет постов с отметками стадий")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Локальный предклассификатор рекламы: наивный Байес на хешированных n-граммах слов.
+
+Обучается офлайн на постах, уже размеченных DeepSeek (posts.is_advertisement), и решает
+уверенные случаи без обращения к LLM. Неуверенные посты по-прежнему уходят в is_advertisement.
+
+    python -m src.local_classifier train [--db posts_archive.db] [--out ad_classifier.bin]
+    python -m src.local_classifier eval  [--db ...] [--model ...] [--threshold 0.97]
+"""
+import argparse
+import json
+import math
+import re
+import sqlite3
+import zlib
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .channel_processors import CHANNEL_TYPE_FILTERED, CHANNEL_TYPE_LONGCHECK
+
+HASH_BITS = 18
+HASH_SIZE = 1 << HASH_BITS
+MAGIC = b'ALPHA-NB1\n'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def extract_features(text: str) -> List[int]:
+    """Хеши униграмм и биграмм слов (без учёта регистра)"""
+    words = _WORD_RE.findall(text.lower())
+    features = [zlib.crc32(w.encode('utf-8')) & (HASH_SIZE - 1) for w in words]
+    features.extend(
+        zlib.crc32(f"{a} {b}".encode('utf-8')) & (HASH_SIZE - 1) for a, b in zip(words, words[1:])
+    )
+    return features
+
+
+class LocalAdClassifier:
+    """Мультиномиальный наивный Байес. Хранит log P(признак | класс) для классов ad / not ad."""
+
+    def __init__(self, log_prior_ad: float, log_prior_ok: float, log_prob_ad: array, log_prob_ok: array,
+                 meta: Optional[dict] = None):
+        self.log_prior_ad = log_prior_ad
+        self.log_prior_ok = log_prior_ok
+        self.log_prob_ad = log_prob_ad
+        self.log_prob_ok = log_prob_ok
+        self.meta = meta or {}
+
+    def predict_proba(self, text: str) -> float:
+        """Вероятность того, что текст — реклама"""
+        score = self.log_prior_ad - self.log_prior_ok
+        lp_ad, lp_ok = self.log_prob_ad, self.log_prob_ok
+        for f in extract_features(text):
+            score += lp_ad[f] - lp_ok[f]
+        if score > 35:
+            return 1.0
+        if score < -35:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(-score))
+
+    def decide(self, text: str, threshold: float) -> Optional[bool]:
+        """True/False, если модель уверена не меньше threshold, иначе None"""
+        p = self.predict_proba(text)
+        if p >= threshold:
+            return True
+        if p <= 1.0 - threshold:
+            return False
+        return None
+
+    @classmethod
+    def train(cls, samples: Iterable[Tuple[str, bool]], alpha: float = 1.0) -> 'LocalAdClassifier':
+        """Обучение за один проход по выборке (выборка не держится в памяти)"""
+        counts_ad = array('d', bytes(8 * HASH_SIZE))
+        counts_ok = array('d', bytes(8 * HASH_SIZE))
+        docs_ad = docs_ok = 0
+        for text, is_ad in samples:
+            counts = counts_ad if is_ad else counts_ok
+            for f in extract_features(text):
+                counts[f] += 1
+            if is_ad:
+                docs_ad += 1
+            else:
+                docs_ok += 1
+        if not docs_ad or not docs_ok:
+            raise ValueError("Training data must contain both ad and non-ad posts")
+        total_ad = sum(counts_ad) + alpha * HASH_SIZE
+        total_ok = sum(counts_ok) + alpha * HASH_SIZE
+        log_prob_ad = array('f', (math.log((c + alpha) / total_ad) for c in counts_ad))
+        log_prob_ok = array('f', (math.log((c + alpha) / total_ok) for c in counts_ok))
+        docs = docs_ad + docs_ok
+        return cls(math.log(docs_ad / docs), math.log(docs_ok / docs), log_prob_ad, log_prob_ok,
+                   meta={'docs_ad': docs_ad, 'docs_ok': docs_ok, 'hash_bits': HASH_BITS})
+
+    def save(self, path: str) -> None:
+        header = dict(self.meta, log_prior_ad=self.log_prior_ad, log_prior_ok=self.log_prior_ok)
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            self.log_prob_ad.tofile(f)
+            self.log_prob_ok.tofile(f)
+
+    @classmethod
+    def load(cls, path: str) -> 'LocalAdClassifier':
+        with open(path, 'rb') as f:
+            if f.readline() != MAGIC:
+                raise ValueError(f"{path} is not a local classifier model")
+            header = json.loads(f.readline())
+            if header.get('hash_bits') != HASH_BITS:
+                raise ValueError(f"{path}: model hash_bits {header.get('hash_bits')} != {HASH_BITS}")
+            log_prob_ad = array('f')
+            log_prob_ok = array('f')
+            log_prob_ad.fromfile(f, HASH_SIZE)
+            log_prob_ok.fromfile(f, HASH_SIZE)
+        return cls(header.pop('log_prior_ad'), header.pop('log_prior_ok'), log_prob_ad, log_prob_ok, header)
+
+
+def load_model(path: str) -> Optional[LocalAdClassifier]:
+    """Загружает модель; None, если файла нет"""
+    try:
+        return LocalAdClassifier.load(path)
+    except FileNotFoundError:
+        return None
+
+
+# === ОБУЧЕНИЕ И ОЦЕНКА ===
+
+def _is_test_row(channel: str, message_id: int, test_fraction: float) -> bool:
+    """Детерминированное разбиение на train/test по хешу поста"""
+    return (zlib.crc32(f"{channel}/{message_id}".encode('utf-8')) % 1000) < test_fraction * 1000
+
+
+def iter_labeled_posts(db_path: str) -> Iterator[Tuple[str, int, str, bool]]:
+    """
+    Посты FILTERED/LONGCHECK, прошедшие через LLM: с текстом и не отсечённые blacklist.
+    Отдаёт (channel, message_id, text, is_advertisement) потоково.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cur = conn.execute("""
+            SELECT channel, message_id, text, is_advertisement FROM posts
+            WHERE channel_type IN (?, ?) AND blacklisted = 0
+              AND text IS NOT NULL AND text != ''
+        """, (CHANNEL_TYPE_FILTERED, CHANNEL_TYPE_LONGCHECK))
+        for channel, message_id, text, is_ad in cur:
+            yield channel, message_id, text, bool(is_ad)
+    finally:
+        conn.close()
+
+
+def evaluate(model: LocalAdClassifier, samples: Iterable[Tuple[str, bool]], threshold: float) -> dict:
+    """
+    Метрики относительно вердиктов LLM:
+    - precision/recall рекламы при пороге 0.5 (качество модели в целом);
+    - доля постов, решённых локально при threshold (сэкономленные вызовы LLM),
+      и точность/полнота этих локальных решений.
+    """
+    tp = fp = fn = tn = 0
+    decided = decided_correct = 0
+    local_tp = local_fp = local_fn = 0
+    total = 0
+    for text, is_ad in samples:
+        total += 1
+        p = model.predict_proba(text)
+        pred = p >= 0.5
+        if pred and is_ad:
+            tp += 1
+        elif pred:
+            fp += 1
+        elif is_ad:
+            fn += 1
+        else:
+            tn += 1
+        verdict = True if p >= threshold else (False if p <= 1.0 - threshold else None)
+        if verdict is None:
+            continue
+        decided += 1
+        decided_correct += verdict == is_ad
+        if verdict and is_ad:
+            local_tp += 1
+        elif verdict:
+            local_fp += 1
+        elif is_ad:
+            local_fn += 1
+
+    def ratio(a: int, b: int) -> float:
+        return round(a / b, 4) if b else 0.0
+
+    return {
+        'samples': total,
+        'precision': ratio(tp, tp + fp),
+        'recall': ratio(tp, tp + fn),
+        'accuracy': ratio(tp + tn, total),
+        'threshold': threshold,
+        'llm_calls_avoided': ratio(decided, total),
+        'local_accuracy': ratio(decided_correct, decided),
+        'local_ad_precision': ratio(local_tp, local_tp + local_fp),
+        'local_ad_recall': ratio(local_tp, local_tp + local_fn),
+    }
+
+
+def main() -> None:
+    from .paths import ARCHIVE_DB_FILE, LOCAL_CLASSIFIER_PATH
+
+    parser = argparse.ArgumentParser(description="Локальный классификатор рекламы")
+    sub = parser.add_subparsers(dest='command', required=True)
+    train_p = sub.add_parser('train', help="обучить модель на posts и оценить на отложенной выборке")
+    train_p.add_argument('--db', default=ARCHIVE_DB_FILE)
+    train_p.add_argument('--out', default=LOCAL_CLASSIFIER_PATH)
+    train_p.add_argument('--test-fraction', type=float, default=0.2)
+    train_p.add_argument('--threshold', type=float, default=0.97)
+    eval_p = sub.add_parser('eval', help="оценить сохранённую модель на всех размеченных постах")
+    eval_p.add_argument('--db', default=ARCHIVE_DB_FILE)
+    eval_p.add_argument('--model', default=LOCAL_CLASSIFIER_PATH)
+    eval_p.add_argument('--threshold', type=float, default=0.97)
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        train_samples = (
+            (text, is_ad) for channel, mid, text, is_ad in iter_labeled_posts(args.db)
+            if not _is_test_row(channel, mid, args.test_fraction)
+        )
+        model = LocalAdClassifier.train(train_samples)
+        test_samples = (
+            (text, is_ad) for channel, mid, text, is_ad in iter_labeled_posts(args.db)
+            if _is_test_row(channel, mid, args.test_fraction)
+        )
+        report = evaluate(model, test_samples, args.threshold)
+        model.meta['eval'] = report
+        model.save(args.out)
+        print(f"Модель сохранена: {args.out} (ad={model.meta['docs_ad']}, not ad={model.meta['docs_ok']})")
+    else:
+        model = LocalAdClassifier.load(args.model)
+        report = evaluate(model, ((text, is_ad) for _, _, text, is_ad in iter_labeled_posts(args.db)),
+                          args.threshold)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
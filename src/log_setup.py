@@ -0,0 +1,172 @@
+"""
+Логирование вне горячего пути.
+
+Записи попадают в очередь (QueueHandler), а в файл с ротацией и в консоль их пишет
+фоновый QueueListener. Повторяющиеся построчные логи сообщений (FW/skip, вердикты
+классификатора) сэмплируются: в лог идёт каждая LOG_SAMPLE_EVERY-я строка, остальные
+периодически сводятся в одну строку со счётчиками. В многопроцессном режиме воркеры
+отправляют записи в общую multiprocessing-очередь, а пишет их только супервизор.
+
+Переменные окружения:
+    LOG_FORMAT        text (по умолчанию) или json
+    LOG_MAX_BYTES     размер файла лога до ротации (по умолчанию 20 МБ)
+    LOG_BACKUP_COUNT  сколько старых файлов хранить (по умолчанию 5)
+    LOG_SAMPLE_EVERY  1 — писать все построчные логи сообщений (по умолчанию 10)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_SAMPLE_EVERY = max(1, int(os.getenv('LOG_SAMPLE_EVERY', '10')))
+SAMPLE_SUMMARY_INTERVAL = 60
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+PROCESS_TEXT_FORMAT = '%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+
+# Начала построчных логов отдельных сообщений
+_PER_MESSAGE_PREFIXES = (
+    ('https://t.me/', None),
+    ('Классификатор:', 'classifier'),
+    ('Blacklisted word:', 'blacklist'),
+    ('Skipped service message:', 'service'),
+)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'process': record.processName,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class PerMessageSampler(logging.Filter):
+    """Пропускает каждую every-ю INFO-строку о сообщении и считает подавленные по категориям"""
+
+    def __init__(self, every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = every
+        self._seen: Dict[str, int] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._last_summary = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def category(record: logging.LogRecord) -> Optional[str]:
+        if record.levelno != logging.INFO or not isinstance(record.msg, str):
+            return None
+        msg = record.msg
+        for prefix, category in _PER_MESSAGE_PREFIXES:
+            if msg.startswith(prefix):
+                if category is None:
+                    return 'forward' if '→' in msg else 'skip'
+                return category
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every <= 1:
+            return True
+        category = self.category(record)
+        if category is None:
+            return True
+        with self._lock:
+            seen = self._seen.get(category, 0)
+            self._seen[category] = seen + 1
+            if seen % self.every == 0:
+                return True
+            self._suppressed[category] = self._suppressed.get(category, 0) + 1
+        return False
+
+    def take_summary(self) -> Optional[str]:
+        """Сводка подавленных строк, если пора её выводить"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_summary < SAMPLE_SUMMARY_INTERVAL:
+                return None
+            self._last_summary = now
+            if not self._suppressed:
+                return None
+            parts = ", ".join(f"{k}={v}" for k, v in sorted(self._suppressed.items()))
+            self._suppressed.clear()
+        return f"Построчные логи сообщений (1 из {self.every}), не выведено: {parts}"
+
+
+class SampledQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler с сэмплированием построчных логов и периодической сводкой"""
+
+    def __init__(self, log_queue, sampler: PerMessageSampler):
+        super().__init__(log_queue)
+        self.sampler = sampler
+        self.addFilter(sampler)
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        result = super().handle(record)
+        summary = self.sampler.take_summary()
+        if summary:
+            self.enqueue(self.prepare(logging.makeLogRecord({
+                'name': 'root', 'levelno': logging.INFO, 'levelname': 'INFO', 'msg': summary,
+                'processName': record.processName,
+            })))
+        return result
+
+
+def _make_formatter(fmt: str) -> logging.Formatter:
+    if LOG_FORMAT == 'json':
+        return JsonFormatter()
+    return logging.Formatter(fmt)
+
+
+def setup_logging(
+    log_file: str,
+    fmt: str = TEXT_FORMAT,
+    log_queue: Any = None,
+    listen: bool = True
+) -> Optional[logging.handlers.QueueListener]:
+    """
+    Направляет корневой логгер в очередь.
+
+    listen=True — запускает фоновый listener, пишущий в log_file (с ротацией) и в консоль;
+    log_queue=None — создаётся очередь этого процесса. Воркер многопроцессного режима
+    передаёт очередь супервизора и listen=False. Повторный вызов ничего не меняет.
+    """
+    root = logging.getLogger()
+    if any(isinstance(h, SampledQueueHandler) for h in root.handlers):
+        return None
+    if log_queue is None:
+        log_queue = queue.SimpleQueue()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    root.addHandler(SampledQueueHandler(log_queue, PerMessageSampler()))
+    if not listen:
+        return None
+
+    formatter = _make_formatter(fmt)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+    listener.start()
+    # Дописываем очередь при выходе
+    atexit.register(listener.stop)
+    return listener
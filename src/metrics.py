@@ -0,0 +1,53 @@
+"""Простые in-process метрики: счётчики, gauge и сводки (count/sum/max) для вывода в лог"""
+import logging
+import threading
+from typing import Any, Dict, List
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_summaries: Dict[str, List[float]] = {}  # name -> [count, sum, max]
+
+
+def inc(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float) -> None:
+    """Добавляет наблюдение в сводку (например, длительность в секундах)"""
+    with _lock:
+        summary = _summaries.get(name)
+        if summary is None:
+            _summaries[name] = [1, value, value]
+        else:
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+
+def get(name: str, default: float = 0) -> float:
+    with _lock:
+        if name in _counters:
+            return _counters[name]
+        return _gauges.get(name, default)
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        result: Dict[str, Any] = dict(_counters)
+        result.update(_gauges)
+        for name, (count, total, maximum) in _summaries.items():
+            result[name] = {'count': int(count), 'avg': round(total / count, 4), 'max': round(maximum, 4)}
+        return result
+
+
+def log_snapshot() -> None:
+    data = snapshot()
+    if data:
+        logging.info("Metrics: " + ", ".join(f"{k}={v}" for k, v in sorted(data.items())))
@@ -0,0 +1,406 @@
+"""
+Версионированные миграции схемы БД.
+
+MIGRATIONS — база состояния (DB_FILE: каналы, outbox, планировщик), ARCHIVE_MIGRATIONS —
+архив постов (ARCHIVE_DB_FILE). Миграции базы состояния выполняются с подключённым
+архивом (src.storage): до миграции 11 посты хранились в базе состояния.
+"""
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+_POSTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS posts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        channel_type INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        post_url TEXT NOT NULL,
+        text TEXT,
+        text_length INTEGER DEFAULT 0,
+        published_at TIMESTAMP,
+        processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_advertisement BOOLEAN DEFAULT 0,
+        is_forwarded BOOLEAN DEFAULT 0,
+        has_media BOOLEAN DEFAULT 0,
+        blacklisted BOOLEAN DEFAULT 0,
+        UNIQUE(channel, message_id)
+    )
+"""
+
+
+def _migration_001_baseline(cur: sqlite3.Cursor) -> None:
+    """Базовая схема: каналы, реклама, посты (совместима со старыми БД)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS channels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE,
+            chat_id INTEGER,
+            last_message_id INTEGER DEFAULT 0,
+            channel_type INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS advertisements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER UNIQUE,
+            channel_username TEXT
+        )
+    """)
+    cur.execute(_POSTS_TABLE)
+    cur.execute("PRAGMA table_info(channels)")
+    columns = [col[1] for col in cur.fetchall()]
+    if 'access_hash' not in columns:
+        cur.execute("ALTER TABLE channels ADD COLUMN access_hash INTEGER")
+
+
+def _migration_002_prune_indexes(cur: sqlite3.Cursor) -> None:
+    """
+    Убирает индексы, которые только замедляют запись.
+
+    - idx_posts_channel_message_id дублирует UNIQUE(channel, message_id),
+      а idx_posts_channel является его префиксом;
+    - булевы индексы (is_advertisement, is_forwarded) и channel_type
+      имеют низкую селективность и не используются запросами бота;
+    - idx_channels_username и idx_advertisements_message_id дублируют UNIQUE.
+
+    idx_posts_published_at оставляем: вставки идут почти по возрастанию времени
+    (дописываются в конец B-дерева), а индекс нужен для выборок по периоду.
+    """
+    for index in (
+        'idx_posts_channel',
+        'idx_posts_channel_message_id',
+        'idx_posts_is_advertisement',
+        'idx_posts_is_forwarded',
+        'idx_posts_channel_type',
+        'idx_channels_username',
+        'idx_advertisements_message_id',
+    ):
+        cur.execute(f"DROP INDEX IF EXISTS {index}")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_published_at ON posts(published_at)")
+
+
+def _migration_003_forward_outbox(cur: sqlite3.Cursor) -> None:
+    """Outbox пересылок: намерение записывается до forward, отметка — после"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS forward_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            channel_type INTEGER NOT NULL DEFAULT 0,
+            message_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            access_hash INTEGER,
+            target TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            UNIQUE(channel, message_id, target)
+        )
+    """)
+    # Частичный индекс: при старте читаем только незавершённые записи
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_forward_outbox_pending
+        ON forward_outbox(id) WHERE status = 'pending'
+    """)
+
+
+def _migration_004_channel_accounts(cur: sqlite3.Cursor) -> None:
+    """Аккаунт, за которым закреплён канал"""
+    cur.execute("ALTER TABLE channels ADD COLUMN account TEXT")
+    cur.execute("ALTER TABLE forward_outbox ADD COLUMN account TEXT")
+    # Существующие каналы подписаны основным аккаунтом (accounts.PRIMARY_ACCOUNT)
+    cur.execute("UPDATE channels SET account = 'main'")
+    cur.execute("UPDATE forward_outbox SET account = 'main'")
+
+
+def _migration_005_llm_retry_queue(cur: sqlite3.Cursor) -> None:
+    """Посты, проверка которых отложена из-за недоступности LLM"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS llm_retry_queue (
+            channel TEXT NOT NULL,
+            message_id INTEGER NOT NULL,
+            channel_type INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (channel, message_id)
+        )
+    """)
+
+
+def _migration_006_post_amounts(cur: sqlite3.Cursor) -> None:
+    """Суммы, извлечённые из постов stats-каналов: JSON [[монета, сумма], ...]"""
+    cur.execute("ALTER TABLE posts ADD COLUMN amounts TEXT")
+    cur.execute("ALTER TABLE posts ADD COLUMN max_amount REAL")
+
+
+def _migration_007_backfill_progress(cur: sqlite3.Cursor) -> None:
+    """Чекпоинты догрузки истории каналов (src.backfill)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_progress (
+            channel TEXT PRIMARY KEY,
+            since TIMESTAMP NOT NULL,
+            oldest_message_id INTEGER,
+            posts INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+# День поста: дата публикации (UTC), для постов без неё — дата обработки
+_POST_DAY = "COALESCE(substr({p}.published_at, 1, 10), date({p}.processed_at))"
+
+# Полный пересчёт сводки из posts (миграция и src.daily_stats --rebuild)
+DAILY_STATS_FROM_POSTS = f"""
+    INSERT INTO channel_daily_stats
+        (day, channel, channel_type, posts, ads, forwarded, blacklisted, with_media, text_length)
+    SELECT {_POST_DAY.format(p='posts')} AS day, channel, MAX(channel_type), COUNT(*),
+           SUM(is_advertisement), SUM(is_forwarded), SUM(blacklisted), SUM(has_media),
+           SUM(COALESCE(text_length, 0))
+    FROM posts GROUP BY day, channel
+"""
+
+
+def _daily_stats_delta(p: str, sign: str) -> str:
+    """UPSERT в channel_daily_stats, добавляющий (sign='+') или вычитающий строку p (NEW/OLD)"""
+    return f"""
+        INSERT INTO channel_daily_stats
+            (day, channel, channel_type, posts, ads, forwarded, blacklisted, with_media, text_length)
+        VALUES ({_POST_DAY.format(p=p)}, {p}.channel, {p}.channel_type, {sign}1,
+                {sign}{p}.is_advertisement, {sign}{p}.is_forwarded, {sign}{p}.blacklisted,
+                {sign}{p}.has_media, {sign}COALESCE({p}.text_length, 0))
+        ON CONFLICT(day, channel) DO UPDATE SET
+            channel_type = excluded.channel_type,
+            posts = posts + excluded.posts,
+            ads = ads + excluded.ads,
+            forwarded = forwarded + excluded.forwarded,
+            blacklisted = blacklisted + excluded.blacklisted,
+            with_media = with_media + excluded.with_media,
+            text_length = text_length + excluded.text_length;
+    """
+
+
+def _migration_008_channel_daily_stats(cur: sqlite3.Cursor) -> None:
+    """
+    Дневные сводки по каналам, которые поддерживаются триггерами на posts.
+
+    Триггеры срабатывают в той же транзакции, что и запись постов (save_posts_batch,
+    догрузка истории, воркеры), поэтому сводка всегда согласована с posts. UPSERT
+    обновляет существующий пост, и триггер на UPDATE вычитает старую строку и добавляет новую.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS channel_daily_stats (
+            day TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            channel_type INTEGER NOT NULL,
+            posts INTEGER NOT NULL DEFAULT 0,
+            ads INTEGER NOT NULL DEFAULT 0,
+            forwarded INTEGER NOT NULL DEFAULT 0,
+            blacklisted INTEGER NOT NULL DEFAULT 0,
+            with_media INTEGER NOT NULL DEFAULT 0,
+            text_length INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, channel)
+        ) WITHOUT ROWID
+    """)
+    cur.execute(DAILY_STATS_FROM_POSTS)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_posts_daily_stats_insert AFTER INSERT ON posts
+        BEGIN {_daily_stats_delta('NEW', '+')} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_posts_daily_stats_update AFTER UPDATE OF
+            channel, channel_type, published_at, processed_at, is_advertisement, is_forwarded,
+            blacklisted, has_media, text_length ON posts
+        BEGIN {_daily_stats_delta('OLD', '-')} {_daily_stats_delta('NEW', '+')} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_posts_daily_stats_delete AFTER DELETE ON posts
+        BEGIN {_daily_stats_delta('OLD', '-')} END
+    """)
+
+
+def _migration_009_post_latency(cur: sqlite3.Cursor) -> None:
+    """Время стадий обработки поста (UTC, ISO) для отчёта о задержках (src.latency)"""
+    cur.execute("ALTER TABLE posts ADD COLUMN fetched_at TIMESTAMP")
+    cur.execute("ALTER TABLE posts ADD COLUMN classified_at TIMESTAMP")
+    cur.execute("ALTER TABLE posts ADD COLUMN forwarded_at TIMESTAMP")
+
+
+def _migration_010_scheduler_state(cur: sqlite3.Cursor) -> None:
+    """Время последнего опроса типов каналов и каналов (планировщик, src.catchup)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_state (
+            scope TEXT NOT NULL,
+            name TEXT NOT NULL,
+            last_scan_at REAL NOT NULL,
+            PRIMARY KEY (scope, name)
+        )
+    """)
+
+
+# Таблицы, которые миграция 11 переносит в архив
+ARCHIVE_TABLES = ('posts', 'channel_daily_stats', 'backfill_progress')
+# Копируемые таблицы и ключ, по которому проверяется, что строка уже в архиве.
+# Сводки не копируются: их заново набирают триггеры архива при вставке постов.
+ARCHIVE_COPY_KEYS = (('posts', ('channel', 'message_id')), ('backfill_progress', ('channel',)))
+# Версия схемы, начиная с которой постов в базе состояния нет
+SPLIT_ARCHIVE_VERSION = 11
+
+
+def _missing_in_archive(cur: sqlite3.Cursor, table: str, key: Tuple[str, ...]) -> int:
+    """Число строк main.table, которых нет в archive.table (0, если таблицы в main нет)"""
+    if not cur.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+        return 0
+    match = ' AND '.join(f"a.{column} = m.{column}" for column in key)
+    return cur.execute(
+        f"SELECT COUNT(*) FROM main.{table} m WHERE NOT EXISTS (SELECT 1 FROM archive.{table} a WHERE {match})"
+    ).fetchone()[0]
+
+
+def copy_to_archive(conn: sqlite3.Connection) -> int:
+    """
+    Копирует посты и прогресс догрузки из базы состояния в подключённый архив.
+
+    Отдельная транзакция, которая пишет только в архив, поэтому она атомарна:
+    транзакция с записью в две WAL-базы атомарна лишь для каждой базы отдельно.
+    Удаляет перенесённые таблицы уже миграция 11 — после проверки копии.
+    Возвращает число скопированных строк.
+    """
+    cur = conn.cursor()
+    copied = 0
+    for table, key in ARCHIVE_COPY_KEYS:
+        if not _missing_in_archive(cur, table, key):
+            continue
+        columns = ', '.join(row[1] for row in cur.execute(f"PRAGMA main.table_info({table})").fetchall())
+        cur.execute(f"INSERT OR IGNORE INTO archive.{table} ({columns}) SELECT {columns} FROM main.{table}")
+        copied += cur.rowcount
+    conn.commit()
+    return copied
+
+
+def _migration_011_split_archive(cur: sqlite3.Cursor) -> None:
+    """
+    Удаление постов, дневных сводок и прогресса догрузки из базы состояния.
+
+    Копирует их в архив copy_to_archive — раньше, в своей транзакции (src.storage.setup).
+    Здесь только проверка, что каждая строка уже в архиве, и DROP: миграция пишет
+    в одну базу. Если копия неполная, миграция не применяется и ничего не удаляется.
+    """
+    databases = {row[1] for row in cur.execute("PRAGMA database_list").fetchall()}
+    if 'archive' not in databases:
+        raise RuntimeError("Миграция 11: архив не подключён (открывайте базу через src.storage)")
+    for table, key in ARCHIVE_COPY_KEYS:
+        missing = _missing_in_archive(cur, table, key)
+        if missing:
+            raise RuntimeError(f"Миграция 11: {missing} строк {table} нет в архиве, таблицы не удалены")
+    for table in ARCHIVE_TABLES:
+        cur.execute(f"DROP TABLE IF EXISTS main.{table}")
+
+
+def _migration_012_outbox_albums(cur: sqlite3.Cursor) -> None:
+    """Сообщения альбома (JSON) у каждой его записи outbox: после рестарта альбом досылается целиком"""
+    cur.execute("ALTER TABLE forward_outbox ADD COLUMN album_ids TEXT")
+
+
+# (версия, описание, функция). Новые миграции добавляются только в конец списка.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "baseline schema", _migration_001_baseline),
+    (2, "prune redundant posts/channels indexes", _migration_002_prune_indexes),
+    (3, "forward outbox", _migration_003_forward_outbox),
+    (4, "channel account sharding", _migration_004_channel_accounts),
+    (5, "llm retry queue", _migration_005_llm_retry_queue),
+    (6, "post amounts", _migration_006_post_amounts),
+    (7, "backfill progress", _migration_007_backfill_progress),
+    (8, "channel daily stats rollup", _migration_008_channel_daily_stats),
+    (9, "post stage timestamps", _migration_009_post_latency),
+    (10, "scheduler state", _migration_010_scheduler_state),
+    (11, "move posts to archive database", _migration_011_split_archive),
+    (12, "forward outbox album ids", _migration_012_outbox_albums),
+]
+
+
+def _archive_001_baseline(cur: sqlite3.Cursor) -> None:
+    """Архив: posts, дневные сводки и прогресс догрузки — та же схема, что в базе состояния к миграции 10"""
+    cur.execute(_POSTS_TABLE)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_published_at ON posts(published_at)")
+    _migration_006_post_amounts(cur)
+    _migration_007_backfill_progress(cur)
+    _migration_008_channel_daily_stats(cur)
+    _migration_009_post_latency(cur)
+
+
+def _archive_002_channel_published_index(cur: sqlite3.Cursor) -> None:
+    """
+    История канала по убыванию (published_at, id) для /channels/<канал>/posts (src.query_api).
+    id — rowid и так замыкает ключ индекса, поэтому страница по курсору читается из индекса
+    в нужном порядке, без сортировки всей истории канала.
+    """
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_posts_channel_published_at ON posts(channel, published_at)")
+
+
+# Миграции архива постов (ARCHIVE_DB_FILE); новые — только в конец списка
+ARCHIVE_MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "posts archive baseline", _archive_001_baseline),
+    (2, "posts channel/published_at index", _archive_002_channel_published_index),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Возвращает текущую версию схемы (0 для пустой/старой БД)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(
+    conn: sqlite3.Connection,
+    migrations: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = MIGRATIONS
+) -> int:
+    """
+    Применяет все недостающие миграции, каждую в своей транзакции.
+    migrations — MIGRATIONS (база состояния) или ARCHIVE_MIGRATIONS (архив постов).
+
+    Returns:
+        Версия схемы после применения миграций
+    """
+    current = get_schema_version(conn)
+    conn.commit()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # управляем транзакциями вручную (DDL внутри BEGIN)
+    try:
+        for version, description, migrate in migrations:
+            if version <= current:
+                continue
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                # Другой процесс мог применить миграцию, пока мы ждали блокировку
+                applied = cur.execute(
+                    "SELECT 1 FROM schema_migrations WHERE version = ?", (version,)
+                ).fetchone()
+                if applied:
+                    cur.execute("COMMIT")
+                    current = version
+                    continue
+                migrate(cur)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                logging.error(f"Миграция {version} ({description}) не применена")
+                raise
+            logging.info(f"Применена миграция схемы {version}: {description}")
+            current = version
+    finally:
+        conn.isolation_level = isolation_level
+    return current
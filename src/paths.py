@@ -0,0 +1,38 @@
+"""
+Пути к файлам данных (сессии, БД, логи).
+
+Вынесены из RUN4, чтобы утилиты (отчёты, обучение, воспроизведение) могли
+работать с БД без импорта бота и создания Telegram-клиента.
+"""
+import os
+
+# Определяем базовый путь для данных (Docker или локально) - ДО импорта CONFIG
+DATA_DIR = '/data' if os.path.exists('/data') else '.'
+# Загружаем .env для определения режима (до импорта CONFIG)
+from dotenv import load_dotenv  # type: ignore
+load_dotenv()
+ENV_MODE = os.getenv('ENV_MODE', 'production').lower()
+# Используем разные сессии для теста и продакшна, чтобы избежать конфликтов
+SESSION_NAME = os.getenv('SESSION_NAME', 
+    'userbot2_test_session' if ENV_MODE == 'test' else 'userbot2_session')
+DB_FILE = os.getenv('DB_FILE', 
+    os.path.join(DATA_DIR, "channels_v2_test.db" if ENV_MODE == 'test' else "channels_v2.db") 
+    if DATA_DIR != '.' else ("channels_v2_test.db" if ENV_MODE == 'test' else "channels_v2.db"))
+SESSION_PATH = os.getenv('SESSION_PATH', 
+    os.path.join(DATA_DIR, SESSION_NAME) if DATA_DIR != '.' else SESSION_NAME)
+LOG_FILE = os.getenv('LOG_FILE', 
+    os.path.join(DATA_DIR, "userbot2_test.log" if ENV_MODE == 'test' else "userbot2.log") 
+    if DATA_DIR != '.' else ("userbot2_test.log" if ENV_MODE == 'test' else "userbot2.log"))
+# Архив постов (posts, дневные сводки); в DB_FILE — каналы и состояние бота (src.storage)
+ARCHIVE_DB_FILE = os.getenv('ARCHIVE_DB_FILE', 
+    os.path.join(DATA_DIR, "posts_archive_test.db" if ENV_MODE == 'test' else "posts_archive.db") 
+    if DATA_DIR != '.' else ("posts_archive_test.db" if ENV_MODE == 'test' else "posts_archive.db"))
+# Очереди между процессами в многопроцессном режиме (src.workers)
+QUEUE_DB_FILE = os.getenv('QUEUE_DB_FILE', 
+    os.path.join(DATA_DIR, "queues_test.db" if ENV_MODE == 'test' else "queues.db") 
+    if DATA_DIR != '.' else ("queues_test.db" if ENV_MODE == 'test' else "queues.db"))
+# file — сессии в .session файлах; memory — копия в памяти (второй процесс с той же сессией)
+TELEGRAM_SESSION_MODE = os.getenv('TELEGRAM_SESSION_MODE', 'file').lower()
+# Модель локального классификатора рекламы (python -m src.local_classifier train)
+LOCAL_CLASSIFIER_PATH = os.getenv('LOCAL_CLASSIFIER_PATH', 
+    os.path.join(DATA_DIR, "ad_classifier.bin") if DATA_DIR != '.' else "ad_classifier.bin")
@@ -0,0 +1,54 @@
+"""Кэш InputPeer: целевой канал и отслеживаемые каналы по аккаунтам"""
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from . import metrics
+
+
+class PeerCache:
+    """
+    Целевые каналы резолвятся один раз на аккаунт (access_hash у каждого аккаунта свой);
+    запись — по паре (аккаунт, username), целевых каналов может быть несколько (src.routing).
+    InputPeerChannel отслеживаемых каналов строятся из chat_id/access_hash из БД,
+    без обращений к Telegram.
+    """
+
+    def __init__(self):
+        self._targets: Dict[Tuple[str, str], Any] = {}  # (account, username) -> InputPeer
+        self._channels: Dict[Tuple[str, int], Tuple[Optional[int], Any]] = {}  # (account, chat_id) -> (access_hash, peer)
+
+    async def target(self, account, username: str):
+        """InputPeer целевого канала для аккаунта; резолвит только при промахе"""
+        cached = self._targets.get((account.name, username))
+        if cached is not None:
+            metrics.inc('peer_cache.target_hits')
+            return cached
+        metrics.inc('peer_cache.target_misses')
+        await account.throttle()
+        peer = await account.client.get_input_entity(username)
+        self._targets[(account.name, username)] = peer
+        logging.info(f"[{account.name}] Target channel resolved: {username}")
+        return peer
+
+    def channel(self, account_name: str, chat_id: int, access_hash: Optional[int]):
+        """InputPeerChannel отслеживаемого канала"""
+        from telethon.tl.types import InputPeerChannel
+        key = (account_name, chat_id)
+        cached = self._channels.get(key)
+        if cached is not None and cached[0] == access_hash:
+            return cached[1]
+        peer = InputPeerChannel(chat_id, access_hash)
+        self._channels[key] = (access_hash, peer)
+        return peer
+
+    def invalidate_target(self, account_name: Optional[str] = None, username: Optional[str] = None) -> None:
+        """Сбрасывает целевые каналы: все, одного аккаунта, один канал или одну пару"""
+        for key in list(self._targets):
+            if (account_name is None or key[0] == account_name) and (username is None or key[1] == username):
+                del self._targets[key]
+
+    def forget_channel(self, account_name: str, chat_id: int) -> None:
+        self._channels.pop((account_name, chat_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'targets': len(self._targets), 'channels': len(self._channels)}
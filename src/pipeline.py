@@ -0,0 +1,154 @@
+"""
+Потоковая обработка новых сообщений канала: чтение → классификация → пересылка → сохранение.
+
+Стадии работают одновременно и связаны ограниченными asyncio-очередями. Классификация
+(blacklist, локальная модель, DeepSeek) запускается сразу при чтении сообщения, но
+в работе не больше PIPELINE_DEPTH сообщений: если классификация отстаёт, чтение ждёт
+места в очереди, а не копит страницы в памяти. Пересылка разбирает результаты строго
+по порядку чтения, поэтому посты канала пересылаются в порядке message_id. Запись
+страницы в БД и чекпоинт выполняются в потоке, пока пересылаются следующие сообщения.
+
+Части альбомов (общий grouped_id) собираются в одно AlbumMessage (group_albums):
+процессор оценивает альбом один раз по подписи, а пересылается он одним вызовом.
+
+Метрики: pipeline.<стадия>.seconds — время обработки одного элемента стадией (count/sum
+дают пропускную способность), pipeline.<очередь>.depth — заполненность очередей.
+"""
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from . import metrics
+from .channel_processors import AlbumMessage
+
+PIPELINE_DEPTH = max(1, int(os.getenv('PIPELINE_DEPTH', '8')))
+# Готовых страниц, ожидающих записи в БД
+PERSIST_QUEUE_SIZE = 2
+
+
+class Classified(NamedTuple):
+    """Результат классификации сообщения: посты для сохранения и отложенная пересылка"""
+    message_id: int
+    posts: List[Dict[str, Any]]
+    forward: Optional[Tuple[tuple, Dict[str, Any]]]  # (args, kwargs) вызова функции пересылки
+
+
+class _PageEnd(NamedTuple):
+    max_id: int
+
+
+def last_id(item: Any) -> int:
+    """Наибольший message_id сообщения или альбома"""
+    return item.ids[-1] if isinstance(item, AlbumMessage) else item.id
+
+
+async def group_albums(pages: AsyncIterator[List[Any]]) -> AsyncIterator[List[Any]]:
+    """
+    Собирает подряд идущие сообщения с общим grouped_id в AlbumMessage.
+
+    Альбом в конце страницы может продолжаться на следующей, поэтому он переносится
+    в неё (чекпоинт страницы его не покрывает). Альбом, разрезанный лимитом сообщений
+    за цикл, обрабатывается двумя частями.
+    """
+    carry: List[Any] = []
+    async for page in pages:
+        items: List[Any] = []
+        group: List[Any] = carry
+        for message in page:
+            grouped_id = getattr(message, 'grouped_id', None)
+            if group and grouped_id != group[0].grouped_id:
+                items.append(AlbumMessage(group) if len(group) > 1 else group[0])
+                group = []
+            if grouped_id:
+                group.append(message)
+            else:
+                items.append(message)
+        carry = group
+        if items:
+            yield items
+    if carry:
+        yield [AlbumMessage(carry) if len(carry) > 1 else carry[0]]
+
+
+async def run_pipeline(
+    pages: AsyncIterator[List[Any]],
+    classify: Callable[[Any], Awaitable[Optional[Classified]]],
+    forward: Callable[[Classified], Awaitable[bool]],
+    persist: Callable[[List[Dict[str, Any]], int], None],
+    depth: int = PIPELINE_DEPTH
+) -> None:
+    """
+    Прогоняет страницы сообщений через стадии.
+
+    classify(message) -> Classified или None (сообщение пропущено); forward(result) -> успех
+    пересылки, он записывается в is_forwarded постов; persist(posts, max_id) — синхронная
+    запись постов страницы и чекпоинта. Ошибка любой стадии останавливает конвейер
+    и пробрасывается; страницы после последней записанной будут прочитаны заново.
+    """
+    classify_q: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    persist_q: asyncio.Queue = asyncio.Queue(maxsize=PERSIST_QUEUE_SIZE)
+
+    async def timed_classify(message: Any) -> Optional[Classified]:
+        started = time.monotonic()
+        try:
+            return await classify(message)
+        finally:
+            metrics.observe('pipeline.classify.seconds', time.monotonic() - started)
+
+    async def fetch_stage() -> None:
+        async for page in pages:
+            for message in page:
+                # Задача стартует сразу, put ждёт, если классификация отстаёт на depth сообщений
+                await classify_q.put(asyncio.ensure_future(timed_classify(message)))
+                metrics.observe('pipeline.classify_queue.depth', classify_q.qsize())
+            if page:
+                await classify_q.put(_PageEnd(max(last_id(item) for item in page)))
+        await classify_q.put(None)
+
+    async def forward_stage() -> None:
+        posts: List[Dict[str, Any]] = []
+        while True:
+            item = await classify_q.get()
+            if item is None:
+                await persist_q.put(None)
+                return
+            if isinstance(item, _PageEnd):
+                await persist_q.put((posts, item.max_id))
+                metrics.observe('pipeline.persist_queue.depth', persist_q.qsize())
+                posts = []
+                continue
+            result = await item
+            if result is None:
+                continue
+            if result.forward is not None:
+                started = time.monotonic()
+                forwarded = await forward(result)
+                metrics.observe('pipeline.forward.seconds', time.monotonic() - started)
+                for post in result.posts:
+                    post['is_forwarded'] = forwarded
+            posts.extend(result.posts)
+
+    async def persist_stage() -> None:
+        while True:
+            item = await persist_q.get()
+            if item is None:
+                return
+            started = time.monotonic()
+            await asyncio.to_thread(persist, *item)
+            metrics.observe('pipeline.persist.seconds', time.monotonic() - started)
+
+    stages = [asyncio.ensure_future(stage()) for stage in (fetch_stage, forward_stage, persist_stage)]
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        for stage in stages:
+            stage.cancel()
+        await asyncio.gather(*stages, return_exceptions=True)
+        # Классификации, до которых пересылка не дошла
+        while not classify_q.empty():
+            item = classify_q.get_nowait()
+            if isinstance(item, asyncio.Future):
+                item.cancel()
+                if item.done() and not item.cancelled():
+                    item.exception()  # помечаем ошибку как полученную
@@ -0,0 +1,346 @@
+"""
+Бюджет длины текста для проверки рекламы в DeepSeek.
+
+Длинный пост обходится дороже и отвечается дольше, хотя для решения «реклама / не реклама»
+обычно хватает начала (о чём пост), конца (призыв, контакты) и строк со ссылками и
+промо-маркерами. fit_to_budget оставляет именно их, пока текст укладывается в
+llm_input_token_budget токенов; вырезанные места помечаются «...». Токены считаются
+приблизительно (estimate_tokens), с запасом для кириллицы. Ответ модели ограничен
+LLM_MAX_OUTPUT_TOKENS: ожидается «да» или «нет».
+
+Влияние на точность проверяется на сохранённых постах: длинные тексты классифицируются
+обрезанными и сравниваются с вердиктом по полному тексту (из posts или свежим, --baseline fresh).
+
+    python -m src.prompt_budget --limit 200
+    python -m src.prompt_budget --set llm_input_token_budget=400 --baseline fresh --out diff.jsonl
+"""
+import argparse
+import asyncio
+import json
+import math
+import re
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Ответ модели — одно слово
+LLM_MAX_OUTPUT_TOKENS = 10
+# Доли бюджета под начало и конец поста; остаток — строки со ссылками и промо-маркерами
+HEAD_SHARE = 0.5
+TAIL_SHARE = 0.2
+# Длинные абзацы режутся на куски, чтобы из одного абзаца можно было взять начало или конец
+MAX_SEGMENT_TOKENS = 30
+OMISSION = "..."
+
+_CLEAN_RE = re.compile(r'[^\w\s.,!?а-яА-Я$]')
+_SIGNAL_RE = re.compile(
+    r'https?://|t\.me/|www\.|@\w{4,}|\berid\b|реклам|промокод|скидк|бонус|розыгрыш|партн[её]р|'
+    r'подпис|регистрац|переходи|ссылк|\bref\b|\bpromo|sponsor|giveaway|airdrop',
+    re.IGNORECASE
+)
+
+
+def clean_for_llm(text: str) -> str:
+    """Очистка текста перед отправкой в LLM (эмодзи, разметка и прочие символы)"""
+    return _CLEAN_RE.sub('', text)
+
+
+def _cost(text: str) -> float:
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars / 4 + (len(text) - ascii_chars) / 2.5
+
+
+def estimate_tokens(text: str) -> int:
+    """Приблизительное число токенов: ~4 символа ASCII или ~2.5 прочих на токен"""
+    return math.ceil(_cost(text))
+
+
+# Слово длиннее куска (ссылка, текст без пробелов) режется по символам на части не длиннее
+# MAX_SEGMENT_TOKENS при любом алфавите
+_WORD_CHUNK_CHARS = int(MAX_SEGMENT_TOKENS * 2.5)
+
+
+def _segments(text: str) -> List[Tuple[int, str, int, bool]]:
+    """
+    Куски текста (номер строки, текст, токены, продолжение слова) не длиннее MAX_SEGMENT_TOKENS.
+    «Продолжение слова» — кусок разрезанного слова, который приклеивается к предыдущему без пробела.
+    """
+    segments: List[Tuple[int, str, int, bool]] = []
+    for line_no, line in enumerate(text.splitlines()):
+        piece: List[str] = []
+        piece_cost = 0.0
+
+        def flush() -> None:
+            nonlocal piece, piece_cost
+            if piece:
+                joined = ' '.join(piece)
+                segments.append((line_no, joined, estimate_tokens(joined), False))
+                piece, piece_cost = [], 0.0
+
+        for word in line.split():
+            if len(word) > _WORD_CHUNK_CHARS:
+                flush()
+                for start in range(0, len(word), _WORD_CHUNK_CHARS):
+                    chunk = word[start:start + _WORD_CHUNK_CHARS]
+                    segments.append((line_no, chunk, estimate_tokens(chunk), start > 0))
+                continue
+            cost = _cost(word) + (0.25 if piece else 0.0)
+            if piece and math.ceil(piece_cost + cost) > MAX_SEGMENT_TOKENS:
+                flush()
+                cost = _cost(word)
+            piece.append(word)
+            piece_cost += cost
+        flush()
+    return segments
+
+
+def _prefix(text: str, budget: float) -> str:
+    """Начало текста не длиннее budget токенов (хотя бы один символ)"""
+    cost = 0  # в двадцатых долях токена: без накопления ошибки округления
+    for end, ch in enumerate(text):
+        cost += 5 if ord(ch) < 128 else 8
+        if cost > budget * 20:
+            return text[:max(end, 1)]
+    return text
+
+
+def _join(segments: List[Tuple[int, str, int, bool]], chosen: Set[int]) -> str:
+    """Выбранные куски по порядку; пропуски помечаются OMISSION"""
+    parts: List[str] = []
+    previous: Optional[int] = None
+    for index in sorted(chosen):
+        line_no, piece, _, glued = segments[index]
+        if previous is None:
+            if index > 0:
+                parts.append(OMISSION + "\n")
+        elif index != previous + 1:
+            parts.append("\n" + OMISSION + "\n")
+        elif segments[previous][0] != line_no:
+            parts.append("\n")
+        elif not glued:
+            parts.append(' ')
+        parts.append(piece)
+        previous = index
+    if previous is not None and previous < len(segments) - 1:
+        parts.append("\n" + OMISSION)
+    return ''.join(parts)
+
+
+def _first_prefix(segments: List[Tuple[int, str, int, bool]], budget: int) -> str:
+    """Начало первого куска, когда в бюджет не помещается ни один кусок целиком"""
+    marker = "\n" + OMISSION
+    if budget <= _cost(marker):
+        return _prefix(segments[0][1], budget)
+    return _prefix(segments[0][1], budget - _cost(marker)) + marker
+
+
+def fit_to_budget(text: str, budget: int) -> Tuple[str, bool]:
+    """
+    Укорачивает текст до budget токенов; возвращает (текст, был ли обрезан).
+
+    Берутся куски из начала (HEAD_SHARE бюджета), с конца (TAIL_SHARE), затем куски
+    со ссылками и промо-маркерами из середины по порядку, пока хватает бюджета;
+    оставшееся место достаётся продолжению начала, концу и любым поместившимся кускам.
+    Непустой текст не становится пустым: если не помещается даже первый кусок,
+    берётся начало текста по символам. budget <= 0 — без ограничения.
+    """
+    if budget <= 0 or estimate_tokens(text) <= budget:
+        return text, False
+    segments = _segments(text)
+    if not segments:
+        return '', True
+    chosen: Set[int] = set()
+    taken: List[int] = []  # порядок взятия: при переборе снимаются последние
+    used = 0
+
+    def take(index: int) -> bool:
+        nonlocal used
+        tokens = segments[index][2]
+        if used + tokens > budget:
+            return False
+        chosen.add(index)
+        taken.append(index)
+        used += tokens
+        return True
+
+    head_end = 0
+    while head_end < len(segments) and used + segments[head_end][2] <= budget * HEAD_SHARE:
+        take(head_end)
+        head_end += 1
+    if not chosen:
+        # Первый кусок больше доли начала: берётся целиком, если влезает в бюджет, иначе его начало
+        if not take(0):
+            return _first_prefix(segments, budget), True
+        head_end = 1
+    tail_start = len(segments)
+    tail_used = 0
+    while tail_start > head_end and tail_used + segments[tail_start - 1][2] <= budget * TAIL_SHARE:
+        tail_start -= 1
+        tail_used += segments[tail_start][2]
+        take(tail_start)
+    for index in range(head_end, tail_start):
+        if _SIGNAL_RE.search(segments[index][1]):
+            take(index)
+    # Остаток бюджета — продолжению начала, затем концу, затем любым поместившимся кускам
+    while head_end < tail_start and (head_end in chosen or take(head_end)):
+        head_end += 1
+    while tail_start > head_end and (tail_start - 1 in chosen or take(tail_start - 1)):
+        tail_start -= 1
+    for index in range(head_end, tail_start):
+        take(index)
+
+    # Разделители и «...» не входят в счёт кусков: последние взятые куски снимаются, пока не влезет
+    result = _join(segments, chosen)
+    while estimate_tokens(result) > budget and len(taken) > 1:
+        chosen.discard(taken.pop())
+        result = _join(segments, chosen)
+    if estimate_tokens(result) > budget:
+        return _first_prefix(segments, budget), True
+    return result, True
+
+
+def llm_messages(config: Dict[str, Any], text: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": config['system_prompt']},
+        {"role": "user", "content": config['user_prompt'].format(text=text)},
+    ]
+
+
+def _load_posts(db_path: str, budget: int, channel_types: List[int], limit: int) -> List[Tuple]:
+    """Посты, дошедшие до проверки рекламы, текст которых длиннее бюджета"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(f"""
+            SELECT channel, message_id, text, is_advertisement FROM posts
+            WHERE blacklisted = 0 AND text IS NOT NULL
+              AND channel_type IN ({','.join('?' * len(channel_types))})
+              AND text_length > ?
+            ORDER BY id DESC
+        """, [*channel_types, budget * 2])
+        posts = []
+        for row in rows:
+            if estimate_tokens(clean_for_llm(row[2])) > budget:
+                posts.append(row)
+                if len(posts) >= limit:
+                    break
+        return posts
+    finally:
+        conn.close()
+
+
+async def evaluate(
+    posts: List[Tuple],
+    config: Dict[str, Any],
+    ask,
+    budget: int,
+    fresh_baseline: bool,
+    concurrency: int
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Сравнивает вердикты по обрезанному тексту с вердиктами по полному"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: Dict[str, List[float]] = {'full': [], 'truncated': []}
+    tokens = {'full': 0, 'truncated': 0}
+    confusion = {'agree': 0, 'ad_to_not_ad': 0, 'not_ad_to_ad': 0, 'errors': 0}
+    diffs: List[Dict[str, Any]] = []
+
+    async def timed(kind: str, text: str) -> bool:
+        started = time.monotonic()
+        answer = await ask(llm_messages(config, text))
+        latencies[kind].append(time.monotonic() - started)
+        return answer == "нет"
+
+    async def one(channel: str, message_id: int, text: str, stored_is_ad: int) -> None:
+        full = clean_for_llm(text)
+        short = clean_for_llm(fit_to_budget(text, budget)[0])
+        tokens['full'] += estimate_tokens(full)
+        tokens['truncated'] += estimate_tokens(short)
+        async with semaphore:
+            try:
+                baseline = await timed('full', full) if fresh_baseline else bool(stored_is_ad)
+                verdict = await timed('truncated', short)
+            except Exception as e:
+                confusion['errors'] += 1
+                print(f"{channel}/{message_id}: {e!r}", file=sys.stderr)
+                return
+        if verdict == baseline:
+            confusion['agree'] += 1
+            return
+        confusion['ad_to_not_ad' if baseline else 'not_ad_to_ad'] += 1
+        diffs.append({
+            'post_url': f"https://t.me/{channel.lstrip('@')}/{message_id}",
+            'full_is_ad': baseline, 'truncated_is_ad': verdict,
+            'full_tokens': estimate_tokens(full), 'truncated_tokens': estimate_tokens(short),
+            'truncated_text': short,
+        })
+
+    await asyncio.gather(*(one(*post) for post in posts))
+    compared = len(posts) - confusion['errors']
+    summary: Dict[str, Any] = {
+        'budget': budget, 'posts': len(posts), 'baseline': 'fresh' if fresh_baseline else 'stored',
+        **confusion,
+        'agreement': round(confusion['agree'] / compared, 4) if compared else None,
+        'prompt_tokens_full': tokens['full'], 'prompt_tokens_truncated': tokens['truncated'],
+    }
+    for kind, values in latencies.items():
+        if values:
+            values.sort()
+            summary[f'latency_p50_{kind}'] = round(values[len(values) // 2], 3)
+    return summary, diffs
+
+
+def main() -> None:
+    from .channel_processors import CHANNEL_TYPE_FILTERED, CHANNEL_TYPE_LONGCHECK
+    from .paths import ARCHIVE_DB_FILE
+    from .replay import load_candidate_config
+
+    parser = argparse.ArgumentParser(description="Влияние обрезки длинных постов на вердикты LLM")
+    parser.add_argument('--db', default=ARCHIVE_DB_FILE)
+    parser.add_argument('--config', help="JSON с конфигом (по умолчанию DEFAULT_CONFIG_JSON)")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="переопределить ключ конфига, например llm_input_token_budget=400")
+    parser.add_argument('--types', default=f"{CHANNEL_TYPE_FILTERED},{CHANNEL_TYPE_LONGCHECK}",
+                        help="типы каналов через запятую")
+    parser.add_argument('--limit', type=int, default=200, help="сколько длинных постов проверить")
+    parser.add_argument('--baseline', choices=('stored', 'fresh'), default='stored',
+                        help="вердикт по полному тексту: из posts или новым запросом")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--out', help="расхождения в JSONL")
+    args = parser.parse_args()
+
+    from openai import AsyncOpenAI
+    from .CONFIG import DEFAULT_CONFIGS, deepseek_api_key, openai_proxy
+    from .http_transport import LLM_BASE_URL, close_client, get_client
+
+    config = {**DEFAULT_CONFIGS, **load_candidate_config(args.config, args.set)}
+    budget = int(config['llm_input_token_budget'])
+    if budget <= 0:
+        parser.error("llm_input_token_budget = 0: обрезка выключена, сравнивать нечего")
+    posts = _load_posts(args.db, budget, [int(t) for t in args.types.split(',')], args.limit)
+    print(f"Постов длиннее {budget} токенов: {len(posts)}", file=sys.stderr)
+
+    async def run() -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        client = AsyncOpenAI(api_key=deepseek_api_key, base_url=LLM_BASE_URL, max_retries=2,
+                             timeout=float(config['llm_timeout']), http_client=get_client(openai_proxy))
+
+        async def ask(messages: List[Dict[str, str]]) -> str:
+            resp = await client.chat.completions.create(
+                model="deepseek-chat", messages=messages, max_tokens=LLM_MAX_OUTPUT_TOKENS, temperature=0
+            )
+            return resp.choices[0].message.content.strip().lower()
+
+        try:
+            return await evaluate(posts, config, ask, budget, args.baseline == 'fresh', max(1, args.concurrency))
+        finally:
+            await close_client()
+
+    summary, diffs = asyncio.run(run())
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            for diff in diffs:
+                f.write(json.dumps(diff, ensure_ascii=False) + "\n")
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
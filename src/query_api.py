@@ -0,0 +1,337 @@
+"""
+Локальный HTTP/JSON API только для чтения поверх базы постов.
+
+Запускается отдельным процессом и открывает архив постов (ARCHIVE_DB_FILE, src.storage)
+только на чтение (mode=ro, query_only); база состояния бота не затрагивается.
+Архив в режиме WAL (setup_database), поэтому читатели видят согласованный снимок
+и не блокируют запись постов и чекпоинтов. Запросы короткие: страница ограничена
+MAX_LIMIT строками, а пагинация — по курсору (published_at, id), без OFFSET, так что
+глубокие страницы стоят столько же, сколько первая.
+
+    python -m src.query_api                      # http://127.0.0.1:8765
+    python -m src.query_api --host 0.0.0.0 --port 9000
+
+Эндпоинты (GET):
+
+    /health                                  версия схемы архива и режим журнала
+    /posts/forwarded?limit=&cursor=&types=   пересланные посты, новые первыми
+    /channels/<канал>/posts?limit=&cursor=   история канала, новые первыми
+    /stats/ads?from=&to=&channels=           реклама и пересылки по каналам (channel_daily_stats)
+
+Ответ со списком содержит next_cursor — его передают в cursor= для следующей страницы
+(null — страниц больше нет). Ответы кэшируются на QUERY_API_CACHE_TTL секунд.
+
+Переменные окружения:
+    QUERY_API_CACHE_TTL     время жизни ответа в кэше, секунды (по умолчанию 5; 0 — без кэша)
+    QUERY_API_POOL          число соединений с БД (по умолчанию 4)
+"""
+import argparse
+import base64
+import binascii
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+CACHE_TTL = float(os.getenv('QUERY_API_CACHE_TTL', '5'))
+CACHE_MAX_ENTRIES = 512
+POOL_SIZE = max(1, int(os.getenv('QUERY_API_POOL', '4')))
+
+POST_FIELDS = ('id', 'channel', 'channel_type', 'message_id', 'post_url', 'text', 'published_at',
+               'is_advertisement', 'is_forwarded', 'has_media', 'forwarded_at')
+_POST_COLUMNS = ', '.join(POST_FIELDS)
+
+
+class BadRequest(ValueError):
+    """Некорректные параметры запроса (ответ 400)"""
+
+
+class ReadOnlyPool:
+    """Пул соединений с БД только на чтение для потоков HTTP-сервера"""
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self._idle: queue.Queue = queue.Queue()
+        self._slots = threading.Semaphore(size)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA query_only=1")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            try:
+                yield conn
+            finally:
+                # Незавершённая транзакция чтения держала бы старый снимок и мешала чекпоинту WAL
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class ResponseCache:
+    """Кэш готовых ответов с коротким TTL (повторяющиеся запросы дашбордов и опросов)"""
+
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items: Dict[str, Tuple[float, bytes]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self.hits += 1
+                return item[1]
+            self._items.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, body: bytes) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if len(self._items) >= self.max_entries:
+                # Вытесняем самую старую запись (порядок вставки)
+                self._items.pop(next(iter(self._items)))
+            self._items[key] = (time.monotonic() + self.ttl, body)
+
+
+def encode_cursor(published_at: str, post_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{published_at}|{post_id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        published_at, post_id = raw.rsplit('|', 1)
+        return published_at, int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise BadRequest("некорректный cursor")
+
+
+def _int_param(params: Dict[str, List[str]], name: str, default: int, low: int, high: int) -> int:
+    value = params.get(name, [None])[0]
+    if value is None:
+        return default
+    try:
+        return min(high, max(low, int(value)))
+    except ValueError:
+        raise BadRequest(f"{name} должен быть числом")
+
+
+def _list_param(params: Dict[str, List[str]], name: str) -> List[str]:
+    return [v.strip() for value in params.get(name, []) for v in value.split(',') if v.strip()]
+
+
+def page_posts(
+    conn: sqlite3.Connection,
+    where: str,
+    params: List[Any],
+    limit: int,
+    cursor: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Страница постов по убыванию (published_at, id).
+
+    Курсор — последняя отданная пара (published_at, id): следующая страница начинается
+    строго после неё, поэтому новые посты, записанные между запросами, не сдвигают страницы.
+    """
+    sql = f"SELECT {_POST_COLUMNS} FROM posts WHERE published_at IS NOT NULL AND {where}"
+    args = list(params)
+    if cursor:
+        sql += " AND (published_at, id) < (?, ?)"
+        args.extend(decode_cursor(cursor))
+    sql += " ORDER BY published_at DESC, id DESC LIMIT ?"
+    args.append(limit + 1)
+    rows = [dict(zip(POST_FIELDS, row)) for row in conn.execute(sql, args)]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['published_at'], rows[-1]['id'])
+    for row in rows:
+        for flag in ('is_advertisement', 'is_forwarded', 'has_media'):
+            row[flag] = bool(row[flag])
+    return {'items': rows, 'next_cursor': next_cursor}
+
+
+def forwarded_posts(conn: sqlite3.Connection, params: Dict[str, List[str]]) -> Dict[str, Any]:
+    where, args = "is_forwarded = 1", []
+    types = _list_param(params, 'types')
+    if types:
+        try:
+            args = [int(t) for t in types]
+        except ValueError:
+            raise BadRequest("types — номера типов каналов через запятую")
+        where += f" AND channel_type IN ({','.join('?' * len(args))})"
+    limit = _int_param(params, 'limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+    return page_posts(conn, where, args, limit, params.get('cursor', [None])[0])
+
+
+def channel_posts(conn: sqlite3.Connection, channel: str, params: Dict[str, List[str]]) -> Dict[str, Any]:
+    channel = channel if channel.startswith('@') else f"@{channel}"
+    limit = _int_param(params, 'limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+    return page_posts(conn, "channel = ?", [channel], limit, params.get('cursor', [None])[0])
+
+
+def ad_stats(conn: sqlite3.Connection, params: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Сумма дневных сводок за [from, to] (YYYY-MM-DD, включительно) по каналам"""
+    sql = """
+        SELECT channel, MAX(channel_type), SUM(posts), SUM(ads), SUM(forwarded), SUM(blacklisted)
+        FROM channel_daily_stats WHERE posts > 0
+    """
+    args: List[Any] = []
+    date_from = params.get('from', [None])[0]
+    date_to = params.get('to', [None])[0]
+    if date_from:
+        sql += " AND day >= ?"
+        args.append(date_from)
+    if date_to:
+        sql += " AND day <= ?"
+        args.append(date_to)
+    channels = [c if c.startswith('@') else f"@{c}" for c in _list_param(params, 'channels')]
+    if channels:
+        sql += f" AND channel IN ({','.join('?' * len(channels))})"
+        args.extend(channels)
+    items = []
+    for channel, channel_type, posts, ads, forwarded, blacklisted in conn.execute(
+        sql + " GROUP BY channel ORDER BY SUM(ads) DESC, channel", args
+    ):
+        items.append({
+            'channel': channel, 'channel_type': channel_type, 'posts': posts, 'ads': ads,
+            'forwarded': forwarded, 'blacklisted': blacklisted,
+            'ad_ratio': round(ads / posts, 4) if posts else 0.0,
+        })
+    return {'from': date_from, 'to': date_to, 'items': items}
+
+
+def health(conn: sqlite3.Connection) -> Dict[str, Any]:
+    version = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0]
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    return {'status': 'ok', 'schema_version': version, 'journal_mode': journal_mode}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    server_version = "alpha-parser-query/1"
+    pool: ReadOnlyPool
+    cache: ResponseCache
+
+    def do_GET(self) -> None:
+        started = time.monotonic()
+        url = urlsplit(self.path)
+        cache_key = self.path
+        body = self.cache.get(cache_key)
+        status = 200
+        if body is None:
+            try:
+                result = self._route(url.path.rstrip('/') or '/', parse_qs(url.query))
+            except BadRequest as e:
+                status, result = 400, {'error': str(e)}
+            except sqlite3.Error as e:
+                logging.error(f"query_api: ошибка БД на {self.path}: {e}")
+                status, result = 503, {'error': 'database unavailable'}
+            if result is None:
+                status, result = 404, {'error': 'not found'}
+            body = json.dumps(result, ensure_ascii=False, default=str).encode()
+            if status == 200:
+                self.cache.put(cache_key, body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        logging.debug(f"query_api: {self.path} -> {status} за {time.monotonic() - started:.3f}s")
+
+    def _route(self, path: str, params: Dict[str, List[str]]) -> Optional[Dict[str, Any]]:
+        parts = [unquote(p) for p in path.strip('/').split('/')]
+        with self.pool.connection() as conn:
+            if parts == ['health']:
+                result = health(conn)
+                result['cache'] = {'hits': self.cache.hits, 'misses': self.cache.misses}
+                return result
+            if parts == ['posts', 'forwarded']:
+                return forwarded_posts(conn, params)
+            if len(parts) == 3 and parts[0] == 'channels' and parts[2] == 'posts':
+                return channel_posts(conn, parts[1], params)
+            if parts == ['stats', 'ads']:
+                return ad_stats(conn, params)
+        return None
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Доступ пишем через logging (debug), а не в stderr
+        pass
+
+
+def make_server(db_path: str, host: str, port: int, cache_ttl: float = CACHE_TTL) -> ThreadingHTTPServer:
+    handler = type('Handler', (QueryHandler,), {
+        'pool': ReadOnlyPool(db_path), 'cache': ResponseCache(cache_ttl),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(db_path: str, host: str, port: int) -> None:
+    server = make_server(db_path, host, port)
+    with server.RequestHandlerClass.pool.connection() as conn:
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if journal_mode.lower() != 'wal':
+        logging.warning(
+            f"query_api: БД в режиме журнала {journal_mode}, а не WAL — чтения могут задерживать запись. "
+            f"Режим включается при запуске бота (setup_database)."
+        )
+    logging.info(f"query_api: http://{host}:{port} (кэш {CACHE_TTL:.0f}s, соединений {POOL_SIZE})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.RequestHandlerClass.pool.close()
+
+
+def main() -> None:
+    from .paths import ARCHIVE_DB_FILE
+
+    parser = argparse.ArgumentParser(description="HTTP/JSON API только для чтения поверх базы постов")
+    parser.add_argument('--db', default=ARCHIVE_DB_FILE)
+    parser.add_argument('--host', default=os.getenv('QUERY_API_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('QUERY_API_PORT', '8765')))
+    parser.add_argument('--verbose', action='store_true', help="логировать каждый запрос")
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    serve(args.db, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Офлайн-воспроизведение сохранённых постов с новой конфигурацией.
+
+Прогоняет строки posts через MESSAGE_PROCESSORS с конфигом-кандидатом и показывает,
+какие решения о пересылке изменятся. Telegram и DeepSeek не вызываются: пересылка
+только фиксируется, а вердикт LLM берётся из posts.is_advertisement (если пост
+раньше до LLM не доходил — например, был в blacklist, — он считается не рекламой
+и попадает в счётчик llm_needed). Изменения промптов так оценить нельзя.
+
+Строки читаются диапазонами id в пуле процессов, в памяти не больше нескольких чанков.
+
+    python -m src.replay --config candidate.json --out diff.jsonl
+    python -m src.replay --set min_length=80 --set "blacklist_words=airdrop, giveaway"
+
+Базовый конфиг — --config (JSON) или DEFAULT_CONFIG_JSON из окружения; --set
+переопределяет отдельные ключи с той же валидацией, что и Google-таблица.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .channel_processors import MESSAGE_PROCESSORS, MessageSnapshot
+from .config_validator import validate_config_value
+
+DEFAULT_CHUNK = 20_000
+_COUNTER_KEYS = ('total', 'forwarded_before', 'forwarded_after', 'newly_forwarded', 'no_longer_forwarded',
+                 'llm_needed')
+
+
+def _decision(post: Optional[Dict[str, Any]], forwarded: bool) -> Dict[str, Any]:
+    if post is None:
+        return {'forwarded': forwarded}
+    return {
+        'forwarded': forwarded,
+        'is_advertisement': bool(post.get('is_advertisement')),
+        'blacklisted': bool(post.get('blacklisted')),
+        'amounts': post.get('amounts'),
+    }
+
+
+async def _replay_rows(rows: List[Tuple], config: Dict[str, Any]) -> Tuple[Dict[int, Dict[str, int]], List[Dict]]:
+    """Прогоняет строки через процессоры; возвращает счётчики по типам каналов и изменённые решения"""
+    words = [w.lower() for w in config.get('blacklist_words') or []]
+    stats: Dict[int, Dict[str, int]] = {}
+    diffs: List[Dict] = []
+    state: Dict[str, Any] = {}
+
+    async def is_blacklisted(text: str) -> bool:
+        tl = text.lower() if isinstance(text, str) else ''
+        return any(w in tl for w in words)
+
+    async def stored_verdict(text: str) -> bool:
+        if state['stored_is_ad'] is None:
+            stats[state['channel_type']]['llm_needed'] += 1
+            return False
+        return state['stored_is_ad']
+
+    async def fake_forward(message_id, peer, ch_link, channel_type, counters,
+                           log_prefix: str = "", use_short_delay: bool = True) -> bool:
+        state['forwarded'] = True
+        return True
+
+    for (channel, channel_type, message_id, text, published_at, has_media,
+         is_ad, is_forwarded, blacklisted, amounts) in rows:
+        processor = MESSAGE_PROCESSORS.get(channel_type)
+        if processor is None:
+            continue
+        type_stats = stats.setdefault(channel_type, dict.fromkeys(_COUNTER_KEYS, 0))
+        # Вердикт LLM известен, только если пост раньше до него дошёл
+        reached_llm = bool(text) and not blacklisted
+        state.update(forwarded=False, channel_type=channel_type,
+                     stored_is_ad=bool(is_ad) if reached_llm else None)
+        message = MessageSnapshot(
+            id=message_id, text=text,
+            date=datetime.fromisoformat(published_at) if published_at else None,
+            photo=bool(has_media)
+        )
+        batch: List[Dict] = []
+        counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
+        await processor(
+            message, None, channel.lstrip('@'), channel_type, counters,
+            fake_forward, is_blacklisted, stored_verdict,
+            lambda _id: False, lambda _id, _ch: None,
+            config=config, channel=channel, posts_batch=batch
+        )
+        before, after = bool(is_forwarded), state['forwarded']
+        type_stats['total'] += 1
+        type_stats['forwarded_before'] += before
+        type_stats['forwarded_after'] += after
+        if before != after:
+            type_stats['newly_forwarded' if after else 'no_longer_forwarded'] += 1
+            diffs.append({
+                'channel': channel, 'channel_type': channel_type, 'message_id': message_id,
+                'post_url': f"https://t.me/{channel.lstrip('@')}/{message_id}",
+                'before': {'forwarded': before, 'is_advertisement': bool(is_ad), 'blacklisted': bool(blacklisted),
+                           'amounts': json.loads(amounts) if amounts else None},
+                'after': _decision(batch[-1] if batch else None, after),
+                'text': (text or '')[:200],
+            })
+    return stats, diffs
+
+
+def _replay_chunk(args: Tuple[str, int, int, Dict[str, Any], Optional[List[int]]]):
+    """Задача пула: строки posts с id в [lo, hi)"""
+    db_path, lo, hi, config, channel_types = args
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        sql = """
+            SELECT channel, channel_type, message_id, text, published_at, has_media,
+                   is_advertisement, is_forwarded, blacklisted, amounts
+            FROM posts WHERE id >= ? AND id < ?
+        """
+        params: List[Any] = [lo, hi]
+        if channel_types:
+            sql += f" AND channel_type IN ({','.join('?' * len(channel_types))})"
+            params.extend(channel_types)
+        rows = conn.execute(sql + " ORDER BY id", params).fetchall()
+    finally:
+        conn.close()
+    return asyncio.run(_replay_rows(rows, config))
+
+
+def _chunks(db_path: str, chunk: int) -> Iterator[Tuple[int, int]]:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        lo, hi = conn.execute("SELECT MIN(id), MAX(id) FROM posts").fetchone()
+    finally:
+        conn.close()
+    if lo is None:
+        return
+    for start in range(lo, hi + 1, chunk):
+        yield start, start + chunk
+
+
+def load_candidate_config(path: Optional[str], overrides: List[str]) -> Dict[str, Any]:
+    if path:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    else:
+        config = json.loads(os.getenv('DEFAULT_CONFIG_JSON') or '{}')
+    for item in overrides:
+        key, _, value = item.partition('=')
+        config[key.strip()] = validate_config_value(key.strip(), value, config)
+    return config
+
+
+def replay(db_path: str, config: Dict[str, Any], out, workers: int, chunk: int,
+           channel_types: Optional[List[int]] = None) -> Dict[int, Dict[str, int]]:
+    """Воспроизводит posts и пишет изменённые решения в out (JSONL); возвращает сводку"""
+    totals: Dict[int, Dict[str, int]] = {}
+    in_flight: Deque[Future] = deque()
+
+    def collect(future: Future) -> None:
+        stats, diffs = future.result()
+        for channel_type, counts in stats.items():
+            acc = totals.setdefault(channel_type, dict.fromkeys(_COUNTER_KEYS, 0))
+            for k, v in counts.items():
+                acc[k] += v
+        for diff in diffs:
+            out.write(json.dumps(diff, ensure_ascii=False) + "\n")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Не больше 2*workers чанков одновременно: память не растёт с размером таблицы,
+        # а отчёт пишется в порядке id
+        for lo, hi in _chunks(db_path, chunk):
+            if len(in_flight) >= 2 * workers:
+                collect(in_flight.popleft())
+            in_flight.append(pool.submit(_replay_chunk, (db_path, lo, hi, config, channel_types)))
+        while in_flight:
+            collect(in_flight.popleft())
+    return totals
+
+
+def main() -> None:
+    from .paths import ARCHIVE_DB_FILE
+
+    parser = argparse.ArgumentParser(description="Воспроизведение posts с конфигом-кандидатом")
+    parser.add_argument('--db', default=ARCHIVE_DB_FILE)
+    parser.add_argument('--config', help="JSON с конфигом-кандидатом (по умолчанию DEFAULT_CONFIG_JSON)")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help="переопределить ключ конфига (можно несколько раз)")
+    parser.add_argument('--types', help="типы каналов через запятую, например 0,3")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK, help="строк posts (по id) на задачу")
+    parser.add_argument('--out', help="файл для изменённых решений (JSONL); по умолчанию stdout")
+    args = parser.parse_args()
+
+    config = load_candidate_config(args.config, args.set)
+    channel_types = [int(t) for t in args.types.split(',')] if args.types else None
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    try:
+        totals = replay(args.db, config, out, max(1, args.workers), max(1, args.chunk), channel_types)
+    finally:
+        if args.out:
+            out.close()
+    report = {str(t): counts for t, counts in sorted(totals.items())}
+    print(json.dumps(report, ensure_ascii=False, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Маршрутизация пересылок: в какой целевой канал идёт пост.
+
+Правила — ключ target_routes в Google-таблице (JSON):
+
+    {"stats": "@alerts", "whitelist": "@news", "@somechannel": "@special"}
+
+Ключ — канал (@username) или тип канала (имя из CHANNEL_TYPE_NAMES или номер).
+Правило канала важнее правила типа; без правила пост идёт в target_channel.
+
+У каждого целевого канала свой темп пересылок (TargetBudget, отдельно на каждый
+аккаунт): пауза между пересылками в один канал не задерживает пересылки в другие.
+FloodWait действует на весь аккаунт и учитывается в нём (account.penalize), а не
+здесь. В многопроцессном режиме у каждого
+целевого канала своя очередь forward:<канал>:p<приоритет> и своя задача в forwarder.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from .accounts import RPC_LANE, PriorityLock
+from .channel_processors import CHANNEL_TYPE_NAMES
+
+
+def resolve_target(channel: str, channel_type: int, config: Dict[str, Any]) -> str:
+    """Целевой канал для поста канала channel (@username) типа channel_type"""
+    routes = config.get('target_routes') or {}
+    if routes:
+        target = (routes.get(channel.lower())
+                  or routes.get(CHANNEL_TYPE_NAMES.get(channel_type, ''))
+                  or routes.get(str(channel_type)))
+        if target:
+            return target
+    return config['target_channel']
+
+
+def all_targets(config: Dict[str, Any]) -> List[str]:
+    """Все целевые каналы из настроек: target_channel первым"""
+    targets = [config['target_channel']]
+    for target in (config.get('target_routes') or {}).values():
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+
+def forward_queue(base: str, target: str) -> str:
+    """Очередь пересылок в target (без приоритета), например forward:@alerts"""
+    return f"{base}:{target}"
+
+
+class TargetBudget:
+    """
+    Темп пересылок одного аккаунта в один целевой канал: минимальный интервал между ними.
+
+    Очередь к каналу упорядочена по приоритету полосы (RPC_LANE), как бюджет аккаунта:
+    срочные полосы не ждут за пересылками менее срочных. Интервал отсчитывается от
+    завершения предыдущей пересылки.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._last_forward = 0.0
+        self._lock = PriorityLock()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Одна пересылка: ждёт своей очереди и интервала, держит канал до её завершения"""
+        priority, _ = RPC_LANE.get()
+        await self._lock.acquire(priority)
+        try:
+            wait = self.wait_left()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield
+        finally:
+            self._last_forward = time.monotonic()
+            self._lock.release()
+
+    def wait_left(self) -> float:
+        return max(0.0, self._last_forward + self.interval - time.monotonic())
+
+    @property
+    def waiting(self) -> int:
+        return self._lock.waiting
+
+
+class TargetBudgets:
+    """Бюджеты пересылок по (аккаунт, целевой канал)"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._budgets: Dict[Tuple[str, str], TargetBudget] = {}
+
+    def get(self, account_name: str, target: str) -> TargetBudget:
+        key = (account_name, target)
+        budget = self._budgets.get(key)
+        if budget is None:
+            budget = self._budgets[key] = TargetBudget(self.interval)
+        return budget
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            f"{account}→{target}": {'wait_left': round(budget.wait_left(), 1), 'waiting': budget.waiting}
+            for (account, target), budget in self._budgets.items()
+        }
@@ -0,0 +1,122 @@
+"""
+Две базы SQLite: состояние бота и архив постов.
+
+- DB_FILE (channels_v2.db) — маленькая «горячая» база: каналы и last_message_id,
+  forward_outbox, отложенные проверки LLM, scheduler_state, реклама. Частые мелкие
+  записи не ждут больших пачек постов, копия базы для бэкапа — мегабайты.
+- ARCHIVE_DB_FILE (posts_archive.db) — posts, channel_daily_stats и backfill_progress.
+  Подключается (ATTACH ... AS archive) только к соединениям, которым нужны посты;
+  имена таблиц в запросах не меняются. Отчёты и API читают архив напрямую.
+
+Настройки у баз свои: обе в WAL с synchronous=NORMAL, у архива больше кэш страниц
+и реже автоматический checkpoint (крупные пачки постов). wal_autocheckpoint задаётся
+на соединение, а не на базу, поэтому соединения с архивом пишут только в архив;
+таблицы состояния пишутся соединениями без архива (порог по умолчанию, 1000 страниц).
+Checkpoint по расписанию
+(checkpoint_due): база состояния — PASSIVE раз в STATE_CHECKPOINT_INTERVAL,
+архив — TRUNCATE раз в ARCHIVE_CHECKPOINT_INTERVAL, чтобы WAL архива не разрастался.
+
+Существующая channels_v2.db переносится при первом запуске (setup) в два шага:
+copy_to_archive копирует посты в архив отдельной транзакцией (пишет только в архив),
+затем миграция 11 проверяет, что каждая строка уже в архиве, и удаляет таблицы из
+базы состояния. Прерванный перенос повторяется при следующем запуске.
+
+Переменные окружения:
+    STATE_CHECKPOINT_INTERVAL     секунды между checkpoint базы состояния (по умолчанию 60)
+    ARCHIVE_CHECKPOINT_INTERVAL   секунды между checkpoint архива (по умолчанию 600)
+    ARCHIVE_WAL_AUTOCHECKPOINT    страниц WAL до автоматического checkpoint у соединений с архивом (10000);
+                                  действует на всё соединение, поэтому они не пишут в базу состояния
+"""
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Optional, Tuple
+
+from .migrations import ARCHIVE_MIGRATIONS, MIGRATIONS, SPLIT_ARCHIVE_VERSION, apply_migrations, copy_to_archive
+
+STATE_CHECKPOINT_INTERVAL = float(os.getenv('STATE_CHECKPOINT_INTERVAL', '60'))
+ARCHIVE_CHECKPOINT_INTERVAL = float(os.getenv('ARCHIVE_CHECKPOINT_INTERVAL', '600'))
+ARCHIVE_WAL_AUTOCHECKPOINT = int(os.getenv('ARCHIVE_WAL_AUTOCHECKPOINT', '10000'))
+
+STATE_PRAGMAS = (
+    "PRAGMA main.synchronous=NORMAL",
+)
+ARCHIVE_PRAGMAS = (
+    "PRAGMA archive.synchronous=NORMAL",
+    "PRAGMA archive.cache_size=-16000",  # 16 MiB
+    "PRAGMA archive.journal_size_limit=67108864",  # WAL после checkpoint усекается до 64 MiB
+    # На всё соединение (и базу состояния): в соединениях с архивом пишется только архив
+    f"PRAGMA wal_autocheckpoint={ARCHIVE_WAL_AUTOCHECKPOINT}",
+)
+# База состояния после переноса постов в архив сжимается, если свободно больше этой доли страниц
+VACUUM_FREE_RATIO = 0.5
+
+_last_checkpoint: Dict[str, float] = {}
+
+
+def connect(state_path: str, archive_path: Optional[str] = None, timeout: float = 5.0) -> sqlite3.Connection:
+    """Соединение с базой состояния; с archive_path — и с подключённым архивом"""
+    conn = sqlite3.connect(state_path, timeout=timeout)
+    for pragma in STATE_PRAGMAS:
+        conn.execute(pragma)
+    if archive_path:
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+        for pragma in ARCHIVE_PRAGMAS:
+            conn.execute(pragma)
+    return conn
+
+
+def setup(state_path: str, archive_path: str) -> Tuple[int, int]:
+    """Создаёт/мигрирует архив и базу состояния; возвращает версии их схем"""
+    conn = sqlite3.connect(archive_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        archive_version = apply_migrations(conn, ARCHIVE_MIGRATIONS)
+    finally:
+        conn.close()
+
+    # Копирование большой базы держит блокировку архива дольше обычного
+    conn = connect(state_path, archive_path, timeout=60.0)
+    try:
+        conn.execute("PRAGMA main.journal_mode=WAL")
+        apply_migrations(conn, [m for m in MIGRATIONS if m[0] < SPLIT_ARCHIVE_VERSION])
+        copied = copy_to_archive(conn)
+        if copied:
+            logging.info(f"{state_path}: в архив {archive_path} скопировано {copied} строк")
+        version = apply_migrations(conn)
+        conn.execute("DETACH DATABASE archive")
+        free, total = (conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in ('freelist_count', 'page_count'))
+        if total and free / total > VACUUM_FREE_RATIO:
+            logging.info(f"{state_path}: свободно {free} из {total} страниц (посты в архиве), VACUUM")
+            try:
+                conn.execute("VACUUM")
+            except sqlite3.OperationalError as e:
+                # Воркеры стартуют одновременно: сжатие сделает тот, кто получил блокировку
+                logging.warning(f"{state_path}: VACUUM отложен: {e}")
+    finally:
+        conn.close()
+    return version, archive_version
+
+
+def checkpoint_due(state_path: str, archive_path: str) -> None:
+    """Checkpoint баз, срок которых наступил; вызывается из основного цикла"""
+    now = time.monotonic()
+    for path, mode, interval in (
+        (state_path, 'PASSIVE', STATE_CHECKPOINT_INTERVAL),
+        (archive_path, 'TRUNCATE', ARCHIVE_CHECKPOINT_INTERVAL),
+    ):
+        if now - _last_checkpoint.get(path, now - interval) < interval:
+            continue
+        _last_checkpoint[path] = now
+        started = time.monotonic()
+        conn = sqlite3.connect(path, timeout=1.0)
+        try:
+            busy, wal_pages, moved = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        except sqlite3.OperationalError as e:
+            logging.warning(f"Checkpoint {path}: {e}")
+            continue
+        finally:
+            conn.close()
+        logging.debug(f"Checkpoint {mode} {path}: {moved}/{wal_pages} страниц, "
+                      f"{time.monotonic() - started:.3f}s" + (" (занято читателями)" if busy else ""))
@@ -0,0 +1,431 @@
+"""
+Многопроцессный режим: чтение каналов, классификация и пересылка в отдельных процессах.
+
+    python -m src.workers                      # супервизор и все воркеры
+    python -m src.workers --role classifier-0  # один воркер без супервизора (отладка)
+
+Процессы связаны durable-очередями в SQLite (QUEUE_DB_FILE):
+
+    fetcher ──▶ classify:<k> ──▶ classifier-<k> ──▶ forward:<целевой канал> ──▶ forwarder
+
+- fetcher читает каналы всеми аккаунтами (файловые сессии), обновляет список каналов
+  и настройки, кладёт новые сообщения в очередь и сразу сдвигает last_message_id;
+- classifier-<k> прогоняет сообщения через MESSAGE_PROCESSORS (blacklist, LLM, суммы),
+  сохраняет посты и ставит пересылки в очередь. Канал всегда попадает к одному
+  классификатору, поэтому порядок постов внутри канала сохраняется;
+- forwarder пересылает через forward_outbox (без дублей после рестарта); у каждого
+  целевого канала (target_routes, src.routing) своя очередь и своя задача, поэтому
+  пауза перед пересылкой в один канал не задерживает пересылки в другие
+  (FloodWait действует на весь аккаунт).
+
+Очереди classify:<k> и forward:<целевой канал> разбиты по приоритетам полос (src.lanes),
+например forward:@alerts:p0; воркер всегда разбирает сначала самую срочную непустую очередь, поэтому
+посты STATS/WHITELIST не ждут за постами, которые классифицируются через LLM.
+
+Классификатор и пересыльщик работают с копией сессии в памяти (TELEGRAM_SESSION_MODE=memory),
+чтобы не писать в .session-файл одновременно с fetcher.
+Супервизор перезапускает упавшие воркеры с экспоненциальной задержкой.
+
+Для небольших установок достаточно однопроцессного режима: python -m src.RUN4
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import lanes, routing
+from .exceptions import LLMUnavailableError
+from .log_setup import PROCESS_TEXT_FORMAT, setup_logging
+from .paths import LOG_FILE, QUEUE_DB_FILE
+
+CLASSIFIER_WORKERS = max(1, int(os.getenv('CLASSIFIER_WORKERS', '2')))
+CLASSIFY_BATCH = 50
+FORWARD_BATCH = 20
+IDLE_SLEEP = 1.0
+QUEUE_DEPTH_LOG_INTERVAL = 60
+# Как часто forwarder ищет новые целевые каналы (в настройках и в очередях)
+FORWARD_TARGETS_SCAN_INTERVAL = 10
+# Воркер, проработавший дольше этого времени, считается здоровым: задержка перезапуска сбрасывается
+RESTART_RESET_AFTER = 300
+RESTART_BACKOFF_MAX = 60
+
+FORWARD_QUEUE = 'forward'
+
+QUEUE = None  # DurableQueue процесса воркера, создаётся в _worker_entry
+
+
+def classify_queue_for(channel: str, workers: int = CLASSIFIER_WORKERS) -> str:
+    """Очередь классификатора для канала (стабильно: один канал — один классификатор)"""
+    digest = hashlib.sha1(channel.lower().encode('utf-8')).digest()
+    return f"classify:{int.from_bytes(digest[:4], 'big') % workers}"
+
+
+def _take_by_priority(queues: List[str], limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+    """Элементы первой непустой очереди; queues — от срочных к остальным"""
+    for name in queues:
+        items = QUEUE.take(name, limit)
+        if items:
+            return items
+    return []
+
+
+def _observe_queue_wait(payload: Dict[str, Any], stage: str) -> None:
+    from . import RUN4
+    if 'queued_at' in payload:
+        lane = lanes.get_lane(payload['channel_type'], RUN4.CONFIG)
+        RUN4.metrics.observe(f"queue_wait.{stage}.{lane.name}", time.time() - payload['queued_at'])
+
+
+def _worker_roles() -> List[str]:
+    return ['fetcher', 'forwarder'] + [f"classifier-{k}" for k in range(CLASSIFIER_WORKERS)]
+
+
+# === FETCHER ===
+
+async def _enqueue_channel(
+    channel: str,
+    last_message_id: int,
+    channel_type: int,
+    chat_id: int,
+    access_hash: Optional[int],
+    account_name: Optional[str] = None
+) -> dict:
+    """Замена process_channel для fetcher: новые сообщения уходят в очередь классификатора"""
+    from telethon.errors.rpcerrorlist import AuthKeyDuplicatedError
+    from . import RUN4
+    from .channel_processors import MessageSnapshot
+    from .pipeline import group_albums, last_id
+
+    account = RUN4.ACCOUNTS.get(account_name)
+    counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
+    queue_name = lanes.queue_name(classify_queue_for(channel), channel_type, RUN4.CONFIG)
+    try:
+        await RUN4.ensure_connected(account)
+        peer = RUN4.PEERS.channel(account.name, chat_id, access_hash)
+        page_size, budget = RUN4._fetch_limits()
+        async def pages():
+            async for page in RUN4._iter_message_pages(account, peer, last_message_id, page_size, budget):
+                counters['fetched'] += len(page)
+                yield page
+
+        # Альбом уходит классификатору одним элементом (подпись + album_ids)
+        async for page in group_albums(pages()):
+            payloads = [
+                {
+                    'channel': channel, 'channel_type': channel_type,
+                    'chat_id': chat_id, 'access_hash': access_hash, 'account': account.name,
+                    'message': MessageSnapshot.from_message(message).to_dict(),
+                    'album_ids': getattr(message, 'ids', None),
+                    'queued_at': time.time(),
+                }
+                for message in page
+                if message.id > last_message_id and not message.action
+            ]
+            QUEUE.put_many(queue_name, payloads)
+            # Очередь durable, поэтому чекпоинт можно сдвигать сразу после постановки
+            max_id = max(last_id(message) for message in page)
+            if max_id > last_message_id:
+                RUN4.update_last_message_id(channel, max_id)
+                last_message_id = max_id
+    except AuthKeyDuplicatedError:
+        logging.error(f"@{channel}: AuthKeyDuplicatedError [{account.name}]")
+    except Exception as e:
+        logging.error(f"@{channel} (Type {channel_type}): Ошибка чтения: {e}\n{traceback.format_exc()}")
+    return counters
+
+
+async def run_fetcher() -> None:
+    from . import RUN4
+    RUN4.setup_database()
+    if not await RUN4.authorize_accounts():
+        raise SystemExit(1)
+    await RUN4.run_scheduler(channel_handler=_enqueue_channel)
+
+
+# === CLASSIFIER ===
+
+async def _classify_item(payload: Dict[str, Any], posts_batch: List[Dict], forwards: List[Dict]) -> None:
+    from . import RUN4
+    from .channel_processors import MESSAGE_PROCESSORS, MessageSnapshot
+
+    channel = payload['channel']
+    channel_type = payload['channel_type']
+    processor = MESSAGE_PROCESSORS.get(channel_type)
+    if not processor:
+        logging.warning(f"Неизвестный тип канала: {channel_type}, пропускаем")
+        return
+    message = MessageSnapshot.from_dict(payload['message'])
+    peer = RUN4.PEERS.channel(payload['account'], payload['chat_id'], payload['access_hash'])
+
+    async def enqueue_forward(message_id, peer, ch_link, channel_type, counters,
+                              log_prefix: str = "", use_short_delay: bool = True) -> bool:
+        forwards.append({
+            'channel': channel, 'channel_type': channel_type, 'message_id': message_id,
+            'chat_id': payload['chat_id'], 'access_hash': payload['access_hash'],
+            'account': payload['account'], 'log_prefix': log_prefix, 'use_short_delay': use_short_delay,
+            'message_ids': payload.get('album_ids'), 'queued_at': time.time(),
+        })
+        # Пост сохраняется с is_forwarded=0, forwarder отметит его после реальной пересылки
+        return False
+
+    counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
+    first_post = len(posts_batch)
+    await processor(
+        message, peer, channel.lstrip('@'), channel_type, counters,
+        enqueue_forward, RUN4.is_blacklisted, RUN4.is_advertisement,
+        RUN4.is_advertisement_post, RUN4.add_advertisement_post,
+        config=RUN4.CONFIG, channel=channel, posts_batch=posts_batch,
+        local_classify_func=RUN4.classify_locally
+    )
+    # fetched_at — момент постановки в очередь fetcher'ом; forwarded_at отметит outbox_complete
+    classified_at = RUN4.utc_now()
+    fetched_at = (datetime.fromtimestamp(payload['queued_at'], timezone.utc)
+                  if 'queued_at' in payload else None)
+    for post in posts_batch[first_post:]:
+        post['fetched_at'] = fetched_at
+        post['classified_at'] = classified_at
+
+
+async def run_classifier(index: int) -> None:
+    from . import RUN4
+    RUN4.setup_database()
+    queue_base = f"classify:{index}"
+    last_config_check = 0.0
+    last_metrics_log = time.time()
+    while True:
+        if time.time() - last_config_check >= RUN4.CONFIG_CHECK_INTERVAL:
+            await RUN4.update_configs(await RUN4.load_csv())
+            last_config_check = time.time()
+        if time.time() - last_metrics_log >= RUN4.METRICS_LOG_INTERVAL:
+            RUN4.metrics.log_snapshot()
+            last_metrics_log = time.time()
+        items = _take_by_priority(lanes.queues_by_priority(queue_base, legacy=queue_base), CLASSIFY_BATCH)
+        if not items:
+            await asyncio.sleep(IDLE_SLEEP)
+            continue
+        posts_batch: List[Dict] = []
+        forwards: List[Dict] = []
+        deferred: List[int] = []
+        for item_id, payload in items:
+            _observe_queue_wait(payload, 'classify')
+            try:
+                await _classify_item(payload, posts_batch, forwards)
+            except LLMUnavailableError:
+                # Вернём элемент в очередь: проверим, когда LLM восстановится
+                deferred.append(item_id)
+            except Exception as e:
+                logging.error(f"{payload.get('channel')}: ошибка классификации: {e}\n{traceback.format_exc()}")
+        # Сначала посты, потом пересылки: forwarder отмечает is_forwarded в уже сохранённых постах
+        RUN4.save_posts_batch(posts_batch)
+        by_queue: Dict[str, List[Dict]] = {}
+        for forward in forwards:
+            forward['target'] = routing.resolve_target(forward['channel'], forward['channel_type'], RUN4.CONFIG)
+            base = routing.forward_queue(FORWARD_QUEUE, forward['target'])
+            by_queue.setdefault(lanes.queue_name(base, forward['channel_type'], RUN4.CONFIG), []).append(forward)
+        for name, payloads in by_queue.items():
+            QUEUE.put_many(name, payloads)
+        QUEUE.ack(item_id for item_id, _ in items if item_id not in deferred)
+        if deferred:
+            logging.warning(f"LLM недоступен, {len(deferred)} постов отложено")
+            QUEUE.release(deferred, delay=RUN4.LLM_BREAKER.reset_timeout)
+
+
+# === FORWARDER ===
+
+def _queued_targets() -> List[str]:
+    """Целевые каналы, для которых в очереди есть пересылки (forward:@канал:pN)"""
+    prefix = f"{FORWARD_QUEUE}:@"
+    return sorted({name.split(':')[1] for name in QUEUE.depths() if name.startswith(prefix)})
+
+
+async def _forward_to_target(target: str, counters: dict) -> None:
+    """Разбирает очереди одного целевого канала; очереди без канала (до target_routes) — задача target_channel"""
+    from telethon.errors.rpcerrorlist import AuthKeyDuplicatedError
+    from . import RUN4
+    from .accounts import RPC_LANE
+
+    base = routing.forward_queue(FORWARD_QUEUE, target)
+    while True:
+        legacy = target == RUN4.CONFIG['target_channel']
+        queues = lanes.queues_by_priority(base)
+        if legacy:
+            queues += lanes.queues_by_priority(FORWARD_QUEUE, legacy=FORWARD_QUEUE)
+        items = _take_by_priority(queues, FORWARD_BATCH)
+        if not items:
+            await asyncio.sleep(IDLE_SLEEP)
+            continue
+        for pos, (item_id, item) in enumerate(items):
+            account = RUN4.ACCOUNTS.get(item.get('account'))
+            lane = lanes.get_lane(item['channel_type'], RUN4.CONFIG)
+            RPC_LANE.set((lane.priority, lane.name))
+            _observe_queue_wait(item, 'forward')
+            try:
+                await RUN4.safe_forward_message(
+                    item['message_id'], RUN4.PEERS.channel(account.name, item['chat_id'], item['access_hash']),
+                    item['channel'].lstrip('@'), item['channel_type'], counters,
+                    log_prefix=item.get('log_prefix', ''), use_short_delay=item.get('use_short_delay', True),
+                    account=account, message_ids=item.get('message_ids'), target=item.get('target')
+                )
+            except AuthKeyDuplicatedError:
+                logging.error(f"Forwarder {target}: AuthKeyDuplicatedError, пауза 60 секунд")
+                QUEUE.release([i for i, _ in items[pos:]], delay=60)
+                break
+            QUEUE.ack([item_id])
+
+
+async def run_forwarder() -> None:
+    from . import RUN4
+
+    RUN4.setup_database()
+    if not await RUN4.authorize_accounts():
+        raise SystemExit(1)
+    # Настройки из таблицы — до первой пересылки: целевые каналы, маршруты и приоритеты полос
+    await RUN4.update_configs(await RUN4.load_csv())
+    last_config_check = time.time()
+    await RUN4.resume_forward_outbox()
+    counters = {'fetched': 0, 'forwarded': 0, 'skipped': 0, 'ads': 0}
+    tasks: Dict[str, asyncio.Task] = {}
+    while True:
+        if time.time() - last_config_check >= RUN4.CONFIG_CHECK_INTERVAL:
+            await RUN4.update_configs(await RUN4.load_csv())
+            last_config_check = time.time()
+        # Задача на каждый целевой канал: из настроек и из очередей (маршрут мог смениться)
+        for target in routing.all_targets(RUN4.CONFIG) + _queued_targets():
+            if target not in tasks:
+                logging.info(f"Forwarder: очередь пересылок в {target}")
+                tasks[target] = asyncio.create_task(_forward_to_target(target, counters), name=f"forward {target}")
+        done, _ = await asyncio.wait(tasks.values(), timeout=FORWARD_TARGETS_SCAN_INTERVAL,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            # Задачи не завершаются сами: упавшая задача роняет воркер, супервизор его перезапустит
+            for other in tasks.values():
+                other.cancel()
+            task.result()
+
+
+# === SUPERVISOR ===
+
+
+def _worker_entry(role: str, log_queue: Any = None) -> None:
+    """Точка входа процесса воркера; без log_queue (запуск через --role) пишет лог сам"""
+    setup_logging(LOG_FILE, PROCESS_TEXT_FORMAT, log_queue=log_queue, listen=log_queue is None)
+    if hasattr(signal, 'SIGUSR1'):
+        # До установки обработчика диагностики сигнал от супервизора не должен завершать процесс
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+    if role != 'fetcher':
+        os.environ['TELEGRAM_SESSION_MODE'] = 'memory'
+    global QUEUE
+    from .durable_queue import DurableQueue
+    QUEUE = DurableQueue(QUEUE_DB_FILE)
+
+    from . import RUN4  # импорт после настройки окружения: создаёт клиентов
+    if role == 'fetcher':
+        coro = run_fetcher()
+    elif role == 'forwarder':
+        coro = run_forwarder()
+    elif role.startswith('classifier-'):
+        coro = run_classifier(int(role.split('-', 1)[1]))
+    else:
+        raise ValueError(f"Unknown worker role: {role}")
+    RUN4.diagnostics.install(RUN4.client.loop)
+    try:
+        RUN4.client.loop.run_until_complete(coro)
+    finally:
+        RUN4.client.loop.run_until_complete(RUN4.ACCOUNTS.disconnect_all())
+        RUN4.client.loop.run_until_complete(RUN4.close_client())
+
+
+def supervise(roles: List[str], log_queue: Any = None) -> None:
+    """Запускает воркеры и перезапускает упавшие; log_queue — очередь логов супервизора"""
+    from .durable_queue import DurableQueue
+    queue = DurableQueue(QUEUE_DB_FILE)
+    ctx = multiprocessing.get_context('spawn')
+    procs: Dict[str, Any] = {}
+    started_at: Dict[str, float] = {}
+    restarts: Dict[str, int] = {role: 0 for role in roles}
+    restart_at: Dict[str, float] = {role: 0.0 for role in roles}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    def forward_to_workers(signum, frame):
+        # Снимок диагностики (SIGUSR1) / выключение tracemalloc (SIGUSR2) — во всех воркерах
+        for proc in procs.values():
+            if proc is not None and proc.is_alive():
+                os.kill(proc.pid, signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, forward_to_workers)
+        signal.signal(signal.SIGUSR2, forward_to_workers)
+
+    last_depth_log = 0.0
+    while not stopping:
+        now = time.time()
+        for role in roles:
+            proc = procs.get(role)
+            if proc is not None and proc.is_alive():
+                continue
+            if proc is not None:
+                logging.warning(f"Воркер {role} завершился с кодом {proc.exitcode}")
+                if now - started_at[role] >= RESTART_RESET_AFTER:
+                    restarts[role] = 0
+                delay = min(RESTART_BACKOFF_MAX, 2 ** restarts[role])
+                restarts[role] += 1
+                restart_at[role] = now + delay
+                procs[role] = None
+                logging.info(f"Перезапуск {role} через {delay} с")
+                continue
+            if now < restart_at[role]:
+                continue
+            proc = ctx.Process(target=_worker_entry, args=(role, log_queue), name=role, daemon=False)
+            proc.start()
+            procs[role] = proc
+            started_at[role] = now
+            logging.info(f"Запущен воркер {role} (pid {proc.pid})")
+        if now - last_depth_log >= QUEUE_DEPTH_LOG_INTERVAL:
+            try:
+                depths = queue.depths()
+                if depths:
+                    logging.info(f"Очереди: {depths}")
+            except Exception as e:
+                logging.warning(f"Не удалось прочитать очереди: {e}")
+            last_depth_log = now
+        time.sleep(1)
+
+    logging.info("Остановка воркеров…")
+    for proc in procs.values():
+        if proc is not None and proc.is_alive():
+            proc.terminate()
+    for proc in procs.values():
+        if proc is not None:
+            proc.join(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Alpha Parser: многопроцессный режим")
+    parser.add_argument('--role', help="запустить один воркер (fetcher, forwarder, classifier-<k>)")
+    args = parser.parse_args()
+    if args.role:
+        _worker_entry(args.role)
+        return
+    # Пишет в файл только супервизор: воркеры отправляют записи в его очередь
+    multiprocessing.current_process().name = 'supervisor'
+    log_queue = multiprocessing.get_context('spawn').Queue()
+    setup_logging(LOG_FILE, PROCESS_TEXT_FORMAT, log_queue=log_queue)
+    supervise(_worker_roles(), log_queue)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ if cp .env.production .env 2>/dev/null; then
     echo "Files will be created with standard names:"
     echo "  - userbot2_session.session"
     echo "  - channels_v2.db"
+    echo "  - posts_archive.db"
     echo "  - userbot2.log"
     echo ""
     echo "⚠ WARNING: This is PRODUCTION mode!"
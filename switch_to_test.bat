@@ -8,6 +8,7 @@ if %errorlevel% equ 0 (
     echo Files will be created with _test suffix:
     echo   - userbot2_test_session.session
     echo   - channels_v2_test.db
+    echo   - posts_archive_test.db
     echo   - userbot2_test.log
 ) else (
     echo ✗ Error: .env.test file not found!
@@ -8,6 +8,7 @@ if cp .env.test .env 2>/dev/null; then
     echo "Files will be created with _test suffix:"
     echo "  - userbot2_test_session.session"
     echo "  - channels_v2_test.db"
+    echo "  - posts_archive_test.db"
     echo "  - userbot2_test.log"
 else
     echo "✗ Error: .env.test file not found!"